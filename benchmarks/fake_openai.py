@@ -0,0 +1,355 @@
+"""A local stand-in for the OpenAI API used by the offline benchmarks.
+
+Serves chat completions (including streaming), the Responses API used by
+`responses.parse`, and embeddings. Latency, jitter, 429 rate and token counts
+are configurable so runs are reproducible and cost nothing.
+
+    python benchmarks/fake_openai.py --port 8765 --latency-ms 300 --error-rate 0.05
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+WORDS = (
+    "trace span metric sdk traceloop openllmetry install configure python "
+    "javascript export jaeger zipkin datadog grafana privacy workflow annotate "
+    "thread version docker self-host langchain feedback vector llm support"
+).split()
+
+
+@dataclass
+class FakeOpenAIConfig:
+    latency_ms: float = 200.0
+    jitter_ms: float = 50.0
+    error_rate: float = 0.0
+    retry_after_s: float = 0.1
+    completion_tokens: int = 120
+    embedding_dimensions: int = 256
+    embedding_latency_ms: float = 50.0
+    pass_rate: float = 0.7
+    seed: int = 0
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    throttled: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector, so identical texts embed identically."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+def _facts_in(prompt: str) -> List[str]:
+    facts = re.findall(r"Fact to check: (.+)", prompt)
+    listed = re.search(r"Facts to check:\n((?:- .+\n?)+)", prompt)
+    if listed:
+        facts.extend(line[2:].strip() for line in listed.group(1).splitlines())
+    return facts
+
+
+class SchemaFiller:
+    """Builds a JSON value matching a (strict) JSON schema."""
+
+    def __init__(self, schema: Dict, rng: random.Random, facts: List[str], pass_rate):
+        self.defs = schema.get("$defs", {})
+        self.rng = rng
+        self.facts = facts
+        self.pass_rate = pass_rate
+        self._fact_index = 0
+
+    def fill(self, schema: Dict, name: str = ""):
+        if "$ref" in schema:
+            return self.fill(self.defs[schema["$ref"].split("/")[-1]], name)
+        if "anyOf" in schema:
+            return self.fill(schema["anyOf"][0], name)
+
+        kind = schema.get("type")
+        if kind == "object":
+            return {
+                key: self.fill(value, key)
+                for key, value in schema.get("properties", {}).items()
+            }
+        if kind == "array":
+            count = len(self.facts) if self.facts else 2
+            return [self.fill(schema.get("items", {}), name) for _ in range(count)]
+        if kind == "boolean":
+            return self.rng.random() < self.pass_rate
+        if kind in ("number", "integer"):
+            return round(self.rng.random(), 3) if kind == "number" else 1
+        if name == "fact" and self.facts:
+            fact = self.facts[self._fact_index % len(self.facts)]
+            self._fact_index += 1
+            return fact
+        return _words(self.rng, 12)
+
+
+class FakeOpenAIServer:
+    def __init__(self, config: Optional[FakeOpenAIConfig] = None, port: int = 0):
+        self.config = config or FakeOpenAIConfig()
+        self.stats: Dict[str, EndpointStats] = {}
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _record(self, endpoint: str, seconds: float, throttled: bool = False):
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.throttled += throttled
+            if not throttled:
+                stats.latencies.append(seconds)
+
+    def _sleep(self, base_ms: float) -> None:
+        jitter = (self._random() * 2 - 1) * self.config.jitter_ms
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def chat_completion(self, body: Dict) -> Dict:
+        prompt = "\n".join(
+            str(message.get("content", "")) for message in body["messages"]
+        )
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        content = _words(rng, self.config.completion_tokens // 2)
+        prompt_tokens = estimate_tokens(prompt)
+        return {
+            "id": f"chatcmpl-{rng.getrandbits(48):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": self.config.completion_tokens,
+                "total_tokens": prompt_tokens + self.config.completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            },
+        }
+
+    def response(self, body: Dict) -> Dict:
+        messages = body["input"] if isinstance(body["input"], list) else []
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        schema = body.get("text", {}).get("format", {}).get("schema", {})
+        filler = SchemaFiller(schema, rng, _facts_in(prompt), self.config.pass_rate)
+        text = json.dumps(filler.fill(schema))
+        input_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        return {
+            "id": f"resp_{rng.getrandbits(48):x}",
+            "object": "response",
+            "created_at": time.time(),
+            "model": body.get("model", "gpt-4o"),
+            "status": "completed",
+            "output": [
+                {
+                    "type": "message",
+                    "id": f"msg_{rng.getrandbits(48):x}",
+                    "status": "completed",
+                    "role": "assistant",
+                    "content": [
+                        {"type": "output_text", "text": text, "annotations": []}
+                    ],
+                }
+            ],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        }
+
+    def embeddings(self, body: Dict) -> Dict:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or self.config.embedding_dimensions
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(str(text), dimensions)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(
+                    struct.pack(f"<{dimensions}f", *vector)
+                ).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+        tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _stream_chat(self, completion: Dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def write(data: str):
+                    payload = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(
+                        f"{len(payload):x}\r\n".encode() + payload + b"\r\n"
+                    )
+                    self.wfile.flush()
+
+                words = completion["choices"][0]["message"]["content"].split(" ")
+                for index, word in enumerate(words):
+                    chunk = {
+                        "id": completion["id"],
+                        "object": "chat.completion.chunk",
+                        "created": completion["created"],
+                        "model": completion["model"],
+                        "choices": [
+                            {
+                                "index": 0,
+                                "delta": {
+                                    "content": word if index == 0 else f" {word}"
+                                },
+                                "finish_reason": None,
+                            }
+                        ],
+                    }
+                    write(json.dumps(chunk))
+                    time.sleep(server.config.jitter_ms / 1000 / max(len(words), 1))
+                write("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_POST(self):
+                started = time.perf_counter()
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?")[0]
+                routes = {
+                    "/v1/chat/completions": ("chat", server.chat_completion),
+                    "/v1/responses": ("responses", server.response),
+                    "/v1/embeddings": ("embeddings", server.embeddings),
+                }
+                if path not in routes:
+                    self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+                    return
+                endpoint, build = routes[path]
+
+                if server._random() < server.config.error_rate:
+                    server._record(endpoint, 0.0, throttled=True)
+                    self._send_json(
+                        429,
+                        {
+                            "error": {
+                                "message": "Rate limit reached (fake)",
+                                "type": "rate_limit_exceeded",
+                                "code": "rate_limit_exceeded",
+                            }
+                        },
+                        headers={"Retry-After": str(server.config.retry_after_s)},
+                    )
+                    return
+
+                server._sleep(
+                    server.config.embedding_latency_ms
+                    if endpoint == "embeddings"
+                    else server.config.latency_ms
+                )
+                payload = build(body)
+                if endpoint == "chat" and body.get("stream"):
+                    self._stream_chat(payload)
+                else:
+                    self._send_json(200, payload)
+                server._record(endpoint, time.perf_counter() - started)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the fake OpenAI server")
+    parser.add_argument("--port", type=int, default=8765)
+    for name, value in vars(FakeOpenAIConfig()).items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}", type=type(value), default=value
+        )
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+
+    server = FakeOpenAIServer(FakeOpenAIConfig(**args), port=port)
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""Offline benchmarks for load_data, query_rag and evaluate.
+
+Everything runs against benchmarks/fake_openai.py and a temporary Chroma
+collection seeded with synthetic docs, so numbers are free and repeatable.
+Results are written as JSON so they can be compared across commits:
+
+    uv run python benchmarks/run_benchmarks.py --output before.json
+    uv run python benchmarks/run_benchmarks.py --output after.json
+    uv run python benchmarks/run_benchmarks.py --compare before.json after.json
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_openai import WORDS, FakeOpenAIConfig, FakeOpenAIServer  # noqa: E402
+
+from prompt_optimizer.telemetry import percentile  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+class StageTimer:
+    """Wraps async functions in place and records how long each call takes."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, *targets):
+        original = getattr(targets[0], stage.split(":")[-1])
+        name = stage.split(":")[0]
+
+        @functools.wraps(original)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.latencies[name].append(time.perf_counter() - started)
+
+        for target in targets:
+            setattr(target, stage.split(":")[-1], timed)
+
+
+def synthetic_docs(count: int, seed: int) -> Dict[str, str]:
+    rng = random.Random(seed)
+    docs = {}
+    for index in range(count):
+        paragraphs = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 120))) + "."
+            for _ in range(rng.randint(3, 12))
+        ]
+        docs[f"synthetic/page-{index}.mdx"] = f"# Page {index}\n\n" + "\n\n".join(
+            paragraphs
+        )
+    return docs
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def run_suite(args, server: FakeOpenAIServer) -> Dict:
+    # Imported here: configuration is read from the environment at import time.
+    from prompt_optimizer import indexing, rag, runner
+
+    timer = StageTimer()
+    timer.wrap("query_rewrite:arephrase_as_query", rag)
+    timer.wrap("retrieval:aretrieve_documents", rag)
+    timer.wrap("query_rag:aquery_rag", rag, runner)
+    timer.wrap("fact_judging:aevaluate_single_response", runner)
+
+    docs = synthetic_docs(args.docs, args.seed)
+    shas = {path: f"{index:040x}" for index, path in enumerate(docs)}
+    texts = {shas[path]: text for path, text in docs.items()}
+
+    async def list_repo_files():
+        return dict(shas)
+
+    async def fetch_blob(sha: str) -> str:
+        return texts[sha]
+
+    reports = []
+
+    async def ingest(*args, **kwargs):
+        reports.append(await original_ingest(*args, **kwargs))
+        return reports[-1]
+
+    original_ingest = indexing.ingest
+    indexing.list_repo_files = list_repo_files
+    indexing.fetch_blob = fetch_blob
+    indexing.ingest = ingest
+
+    results = {}
+
+    started = time.perf_counter()
+    await indexing.sync_docs(full=True)
+    elapsed = time.perf_counter() - started
+    chunks = rag.get_docs_collection().count()
+    results["load_data"] = {
+        "wall_s": elapsed,
+        "files": len(docs),
+        "chunks": chunks,
+        "chunks_per_s": chunks / elapsed,
+        "stages": {
+            stage.name: {"count": stage.count, "per_s": stage.rate}
+            for stage in reports[-1].stages
+        },
+    }
+
+    template = "Answer the question using the context.\n{context}\n{question}"
+    questions = [item["question"] for item in runner.evaluation_items]
+    started = time.perf_counter()
+    for question in questions[: args.questions]:
+        await rag.aquery_rag(template, question)
+    elapsed = time.perf_counter() - started
+    results["query_rag"] = {
+        "wall_s": elapsed,
+        "queries": args.questions,
+        "queries_per_s": args.questions / elapsed,
+    }
+
+    started = time.perf_counter()
+    score, failure_reasons = await runner.aevaluate(template, show_progress=False)
+    elapsed = time.perf_counter() - started
+    evaluated = len(runner.get_items_to_evaluate())
+    results["evaluate"] = {
+        "wall_s": elapsed,
+        "questions": evaluated,
+        "questions_per_s": evaluated / elapsed,
+        "score": score,
+        "failures": len(failure_reasons),
+    }
+
+    results["stages"] = {
+        stage: summarize(latencies) for stage, latencies in timer.latencies.items()
+    }
+    results["endpoints"] = {
+        endpoint: {"throttled": stats.throttled, **summarize(stats.latencies)}
+        for endpoint, stats in server.stats.items()
+    }
+    return results
+
+
+def run(args) -> Dict:
+    config = FakeOpenAIConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+    )
+    server = FakeOpenAIServer(config).start()
+    with tempfile.TemporaryDirectory(prefix="prompt-optimizer-bench-") as workdir:
+        os.environ.update(
+            {
+                "OPENAI_BASE_URL": server.base_url,
+                "OPENAI_API_KEY": "sk-fake",
+                "PROMPT_OPTIMIZER_NO_CACHE": "1",
+                "PROMPT_OPTIMIZER_CHROMA_PATH": os.path.join(workdir, "chroma"),
+                "PROMPT_OPTIMIZER_CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"),
+                "PROMPT_OPTIMIZER_INDEX_MANIFEST": os.path.join(
+                    workdir, "manifest.json"
+                ),
+                "PROMPT_OPTIMIZER_CONTEXT_SNAPSHOT_PATH": os.path.join(
+                    workdir, "snapshot.json"
+                ),
+                "PROMPT_OPTIMIZER_VECTOR_INDEX_DIR": os.path.join(
+                    workdir, "vector_index"
+                ),
+                "PROMPT_OPTIMIZER_BM25_PATH": os.path.join(workdir, "bm25_index.json"),
+            }
+        )
+
+        if args.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            results = asyncio.run(run_suite(args, server))
+        finally:
+            server.stop()
+        elapsed = time.perf_counter() - started
+    peak = None
+    if args.trace_memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": vars(config),
+        "wall_s": elapsed,
+        "peak_python_mb": peak,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "results": results,
+    }
+
+
+def measure_peak_memory() -> float:
+    """Peak Python memory of the suite in MB, from a second run in a separate
+    process: tracing allocations slows every call, so the timed run skips it."""
+    with tempfile.TemporaryDirectory() as directory:
+        output = os.path.join(directory, "memory.json")
+        subprocess.run(
+            [sys.executable, __file__, *sys.argv[1:], "--trace-memory"]
+            + ["--output", output],
+            stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        with open(output) as file:
+            return json.load(file)["peak_python_mb"]
+
+
+def _flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as file:
+        before = json.load(file)
+    with open(after_path) as file:
+        after = json.load(file)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+
+    old = _flatten(
+        {k: v for k, v in before.items() if k not in ("config", "timestamp")}
+    )
+    new = _flatten({k: v for k, v in after.items() if k not in ("config", "timestamp")})
+    for name in sorted(set(old) | set(new)):
+        if name not in old or name not in new:
+            print(f"  {name:<48} {old.get(name, '-')!s:>12} {new.get(name, '-')!s:>12}")
+            continue
+        change = (new[name] - old[name]) / old[name] if old[name] else 0.0
+        print(f"  {name:<48} {old[name]:12.2f} {new[name]:12.2f} {change:+8.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--docs", type=int, default=50)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Where to write the JSON results")
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip the second, untimed run that measures peak Python memory",
+    )
+    # Set on the memory run that measure_peak_memory starts.
+    parser.add_argument("--trace-memory", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BEFORE", "AFTER"),
+        help="Compare two result files instead of running",
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args)
+    if not args.trace_memory and not args.no_memory:
+        report["peak_python_mb"] = measure_peak_memory()
+    output = (
+        args.output
+        or RESULTS_DIR / f"{report['commit']}-{int(report['timestamp'])}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    print(json.dumps(report["results"], indent=2))
+    if report["peak_python_mb"] is not None:
+        print(f"Peak Python memory: {report['peak_python_mb']:.1f} MB")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Measure import cost of every entry point in [project.scripts].
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter per
+script and reports the median cumulative import time together with the slowest
+modules pulled in along the way.
+
+    uv run python benchmarks/startup_time.py [--runs 5] [--top 10] [--json out.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+try:
+    import tomllib
+except ModuleNotFoundError:  # Python 3.10
+    import tomli as tomllib
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_scripts():
+    with open(ROOT / "pyproject.toml", "rb") as file:
+        return tomllib.load(file)["project"]["scripts"]
+
+
+def parse_importtime(stderr: str):
+    """Return (total_us, {module: cumulative_us}) from -X importtime output."""
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, raw_name = line.split("|")
+        name = raw_name.strip()
+        # Nested imports are indented by two extra spaces per level.
+        if len(raw_name) - len(raw_name.lstrip()) == 1:
+            total += int(cumulative_us)
+        modules[name] = max(modules.get(name, 0), int(cumulative_us))
+    return total, modules
+
+
+def measure(module: str, env):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=ROOT,
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1]
+        raise RuntimeError(f"importing {module} failed: {error}")
+    total, modules = parse_importtime(completed.stderr)
+    return wall, total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    # Entry points must import without credentials they do not use.
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if key not in ("GITHUB_TOKEN", "OPENAI_API_KEY")
+    }
+
+    results = {}
+    for script, target in load_scripts().items():
+        module = target.split(":")[0]
+        walls, totals = [], []
+        modules = {}
+        for _ in range(args.runs):
+            wall, total, modules = measure(module, env)
+            walls.append(wall)
+            totals.append(total)
+
+        slowest = sorted(
+            ((name, us) for name, us in modules.items() if name != module),
+            key=lambda entry: entry[1],
+            reverse=True,
+        )[: args.top]
+        results[script] = {
+            "module": module,
+            "wall_ms": statistics.median(walls) * 1000,
+            "import_ms": statistics.median(totals) / 1000,
+            "slowest": [{"module": name, "ms": us / 1000} for name, us in slowest],
+        }
+
+        print(
+            f"{script:<18} {module:<34} import {results[script]['import_ms']:8.1f} ms"
+            f"  process {results[script]['wall_ms']:8.1f} ms"
+        )
+        for entry in results[script]["slowest"]:
+            print(f"    {entry['ms']:8.1f} ms  {entry['module']}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
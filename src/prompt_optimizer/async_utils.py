@@ -0,0 +1,40 @@
+import asyncio
+import contextvars
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Awaitable, TypeVar
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+T = TypeVar("T")
+
+# httpx connection pools are bound to the event loop that created them, so every
+# loop gets its own AsyncOpenAI client instead of sharing a module-level one.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_client() -> "AsyncOpenAI":
+    from openai import AsyncOpenAI
+
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        # Retries and backoff are handled by prompt_optimizer.scheduler.
+        _async_clients[loop] = AsyncOpenAI(max_retries=0)
+    return _async_clients[loop]
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Run a coroutine to completion, even when called from inside a running loop
+    (crewAI flows call tools synchronously from their own event loop)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # Copy the context so the worker thread still sees the active telemetry stage.
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(context.run, asyncio.run, coro).result()
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from prompt_optimizer.sqlite_utils import ThreadLocalConnection
+
+CACHE_PATH = os.getenv("PROMPT_OPTIMIZER_CACHE_PATH", "db/llm_cache.sqlite3")
+CACHE_TTL_SECONDS = int(os.getenv("PROMPT_OPTIMIZER_CACHE_TTL", 7 * 24 * 60 * 60))
+CACHE_MAX_BYTES = int(os.getenv("PROMPT_OPTIMIZER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+CACHE_ENABLED = os.getenv("PROMPT_OPTIMIZER_NO_CACHE", "") not in ("1", "true", "yes")
+
+# Eviction scans the whole table, so only run it every so many writes.
+EVICT_EVERY_N_WRITES = 100
+
+
+def cache_key(model: str, messages: Any, response_schema: Any = None) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": messages, "schema": response_schema},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)",
+)
+
+
+class ResponseCache:
+    """Content-addressed SQLite cache for model and retrieval results.
+
+    Every thread gets its own connection and the database runs in WAL mode, so
+    concurrent evaluations (threads or separate processes) can share one file.
+    """
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl_seconds: int = CACHE_TTL_SECONDS,
+        max_bytes: int = CACHE_MAX_BYTES,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._connections = ThreadLocalConnection(path, SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or now - row[1] > self.ttl_seconds:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        connection.execute(
+            "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        with self._lock:
+            self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, now),
+        )
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % EVICT_EVERY_N_WRITES == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        connection = self._connection()
+        removed = connection.execute(
+            "DELETE FROM responses WHERE created_at < ?",
+            (time.time() - self.ttl_seconds,),
+        ).rowcount
+
+        (total_size,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total_size <= self.max_bytes:
+            return removed
+
+        excess = total_size - self.max_bytes
+        freed = 0
+        stale_keys = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ):
+            if freed >= excess:
+                break
+            stale_keys.append((key,))
+            freed += size
+        connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+        return removed + len(stale_keys)
+
+    def clear(self) -> None:
+        self._connection().execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
+
+
+def format_cache_stats(before: Dict[str, int], after: Dict[str, int]) -> str:
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    if not response_cache.enabled:
+        return "Cache: disabled"
+    lookups = hits + misses
+    hit_rate = hits / lookups if lookups else 0.0
+    return f"Cache: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate)"
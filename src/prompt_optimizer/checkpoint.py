@@ -0,0 +1,106 @@
+"""Append-only JSONL record of evaluated items, one file per prompt and
+evaluation config.
+
+Every scored item is written as soon as it completes, so an interrupted
+evaluation resumed with the same config only scores the items that are
+still missing. A different judge, retrieval setup or collection gets a file
+of its own, so its results are never mixed with stale ones.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+CHECKPOINT_DIR = os.getenv("PROMPT_OPTIMIZER_CHECKPOINT_DIR", "db/checkpoints")
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def config_hash(config: Dict) -> str:
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def item_id(item: Dict) -> str:
+    if item.get("id") is not None:
+        return str(item["id"])
+    return hashlib.sha256(item["question"].encode("utf-8")).hexdigest()[:16]
+
+
+class Checkpoint:
+    def __init__(
+        self,
+        prompt_template: str,
+        config: Optional[Dict] = None,
+        directory: str = CHECKPOINT_DIR,
+    ):
+        self.prompt_hash = prompt_hash(prompt_template)
+        self.config_hash = config_hash(config or {})
+        self.path = os.path.join(
+            directory, f"{self.prompt_hash}-{self.config_hash}.jsonl"
+        )
+        self._lock = threading.Lock()
+        # Whether the file is known to end with a complete line.
+        self._terminated = False
+
+    def load(self) -> Dict[str, Dict]:
+        """Results by item id; a line cut short by a crash is ignored."""
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if (
+                    entry.get("prompt_hash") == self.prompt_hash
+                    and entry.get("config_hash") == self.config_hash
+                ):
+                    results[entry["item_id"]] = entry["result"]
+        return results
+
+    def append(self, item_id: str, result: Dict) -> None:
+        line = json.dumps(
+            {
+                "prompt_hash": self.prompt_hash,
+                "config_hash": self.config_hash,
+                "item_id": item_id,
+                "result": result,
+            }
+        )
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if not self._terminated:
+                # A run that died mid-write leaves a partial last line; end it
+                # so this result is not glued onto it.
+                line = ("\n" if self._ends_mid_line() else "") + line
+                self._terminated = True
+            with open(self.path, "a") as file:
+                file.write(line + "\n")
+                file.flush()
+                os.fsync(file.fileno())
+
+    async def aappend(self, item_id: str, result: Dict) -> None:
+        """append without blocking the event loop on the write and fsync."""
+        await asyncio.to_thread(self.append, item_id, result)
+
+    def _ends_mid_line(self) -> bool:
+        try:
+            with open(self.path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                return file.read(1) != b"\n"
+        except OSError:
+            # Missing or empty file.
+            return False
+
+    def clear(self) -> None:
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,211 @@
+"""Evaluation sets read from JSONL, CSV or Parquet files.
+
+Files are read row by row (Parquet in record batches), so only the selected
+sample, never the whole file, is held in memory. Every row needs a
+`question` and its `required_facts`; an `id` and a `category` column are
+optional and used for checkpoints, sharding and stratified sampling.
+"""
+
+import csv
+import hashlib
+import heapq
+import json
+import os
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from prompt_optimizer.checkpoint import item_id
+
+STRATIFY_BY = "category"
+PARQUET_BATCH_SIZE = 1024
+
+
+def _normalize(row: Dict) -> Dict:
+    facts = row.get("required_facts")
+    if isinstance(facts, str):
+        # CSV cells hold either a JSON list or facts separated by "|".
+        facts = (
+            json.loads(facts)
+            if facts.lstrip().startswith("[")
+            else [fact.strip() for fact in facts.split("|") if fact.strip()]
+        )
+    item = {**row, "question": row["question"], "required_facts": list(facts or [])}
+    if item.get("id") in ("", None):
+        item.pop("id", None)
+    return item
+
+
+def _read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _read_csv(path: str) -> Iterator[Dict]:
+    with open(path, newline="") as file:
+        yield from csv.DictReader(file)
+
+
+def _read_parquet(path: str) -> Iterator[Dict]:
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=PARQUET_BATCH_SIZE):
+        yield from batch.to_pylist()
+
+
+READERS = {
+    ".jsonl": _read_jsonl,
+    ".json": _read_jsonl,
+    ".csv": _read_csv,
+    ".parquet": _read_parquet,
+}
+
+
+def iter_dataset(path: str) -> Iterator[Dict]:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(
+            f"Unsupported dataset format {extension!r}, expected one of "
+            f"{', '.join(READERS)}"
+        )
+    for row in READERS[extension](path):
+        yield _normalize(row)
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse "i/n" (0 <= i < n) as given to --shard."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/n, got {value!r}")
+    if not 0 <= index < count:
+        raise ValueError(f"Shard index must be between 0 and {count - 1}")
+    return index, count
+
+
+def _rank(item: Dict, seed: int) -> int:
+    digest = hashlib.sha256(f"{seed}:{item_id(item)}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def in_shard(item: Dict, shard: Tuple[int, int]) -> bool:
+    # Hashing the item id keeps shard membership stable when rows move.
+    index, count = shard
+    return _rank(item, seed=-1) % count == index
+
+
+def allocate(counts: Dict[str, int], size: int) -> Dict[str, int]:
+    """Split `size` across strata in proportion to their counts, handing out
+    the rounding leftovers by largest remainder."""
+    total = sum(counts.values())
+    if size >= total:
+        return dict(counts)
+    quotas = {stratum: size * count / total for stratum, count in counts.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    leftover = size - sum(allocation.values())
+    for stratum in sorted(
+        quotas, key=lambda name: (allocation[name] - quotas[name], name)
+    )[:leftover]:
+        allocation[stratum] += 1
+    return allocation
+
+
+def stratified_sample(
+    path: str, size: int, seed: int = 0, stratify_by: str = STRATIFY_BY
+) -> List[Dict]:
+    """Deterministic stratified sample of `size` items, in file order.
+
+    One pass counts the strata, a second keeps the `k` items with the lowest
+    seeded hash per stratum, so the sample only depends on the seed and the
+    item ids, and memory only grows with `size`.
+    """
+    counts = Counter(str(item.get(stratify_by, "")) for item in iter_dataset(path))
+    allocation = allocate(counts, size)
+
+    kept: Dict[str, List[Tuple[int, int, Dict]]] = {name: [] for name in allocation}
+    for position, item in enumerate(iter_dataset(path)):
+        stratum = str(item.get(stratify_by, ""))
+        if not allocation[stratum]:
+            continue
+        # Max-heap on rank (negated) holding the `k` lowest ranks seen so far.
+        entry = (-_rank(item, seed), position, item)
+        heap = kept[stratum]
+        if len(heap) < allocation[stratum]:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+
+    selected = [entry for heap in kept.values() for entry in heap]
+    return [item for _, _, item in sorted(selected, key=lambda entry: entry[1])]
+
+
+def select_items(
+    path: str,
+    sample_size: Optional[int] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    seed: int = 0,
+    stratify_by: str = STRATIFY_BY,
+) -> Iterator[Dict]:
+    """Items of a dataset file, optionally sampled and then sharded.
+
+    The sample is the same on every machine, so shards of it never overlap.
+    """
+    items: Iterable[Dict] = (
+        stratified_sample(path, sample_size, seed, stratify_by)
+        if sample_size
+        else iter_dataset(path)
+    )
+    for item in items:
+        if shard is None or in_shard(item, shard):
+            yield item
+
+
+def write_shard_result(
+    path: str,
+    prompt_hash: str,
+    dataset: Optional[str],
+    shard: Optional[Tuple[int, int]],
+    items: int,
+    score_sum: float,
+    failure_reasons: List[Dict],
+) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(
+            {
+                "prompt_hash": prompt_hash,
+                "dataset": dataset,
+                "shard": list(shard) if shard else None,
+                "items": items,
+                "score_sum": score_sum,
+                "failure_reasons": failure_reasons,
+            },
+            file,
+            indent=2,
+        )
+
+
+def merge_shard_results(paths: List[str]) -> Tuple[float, List[Dict], int]:
+    """Combine per-shard result files into (score, failure_reasons, items)."""
+    results = []
+    for path in paths:
+        with open(path) as file:
+            results.append(json.load(file))
+
+    prompt_hashes = {result["prompt_hash"] for result in results}
+    if len(prompt_hashes) > 1:
+        raise ValueError("Shard results belong to different prompts")
+    shards = [tuple(result["shard"]) for result in results if result["shard"]]
+    if len(set(shards)) != len(shards):
+        raise ValueError("The same shard was given more than once")
+    counts = {count for _, count in shards}
+    if len(counts) == 1 and len(shards) < counts.pop():
+        print(f"Warning: only {len(shards)} shards given, the score is partial")
+
+    items = sum(result["items"] for result in results)
+    score = sum(result["score_sum"] for result in results) / items if items else 0.0
+    failure_reasons = [
+        reason for result in results for reason in result["failure_reasons"]
+    ]
+    return score, failure_reasons, items
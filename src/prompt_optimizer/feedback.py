@@ -0,0 +1,165 @@
+"""Turn an evaluation's failed facts into feedback for the optimizer.
+
+A few failures are passed on verbatim. Beyond FEEDBACK_CHAR_BUDGET the
+failure reasons are embedded and grouped with k-means, every group is
+summarized by its own model call (all in parallel), and the feedback lists
+the groups, largest first, with their size and a couple of representative
+failures. Its length is bounded by MAX_CLUSTERS, not by the number of
+failures.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List
+
+from prompt_optimizer import llm
+from prompt_optimizer.telemetry import FEEDBACK_COMPRESSION, stage
+from prompt_optimizer.vector_index import aembed_texts
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Feedback shorter than this goes to the optimizer verbatim; only longer
+# feedback is worth compressing.
+FEEDBACK_CHAR_BUDGET = 4000
+FEEDBACK_MODEL = "gpt-4o"
+MAX_CLUSTERS = 8
+KMEANS_ITERATIONS = 25
+KMEANS_SEED = 0
+# Failures closest to a cluster's centre shown to its summarizer and in the feedback.
+SUMMARY_SAMPLE_SIZE = 12
+EXAMPLES_PER_CLUSTER = 2
+EXAMPLE_CHARS = 200
+SUMMARY_CHARS = 300
+
+
+def format_failures(failure_reasons: List[Dict]) -> str:
+    return "\n".join(
+        f"- {reason['question']} / {reason['fact']}: {reason['reason']}"
+        for reason in failure_reasons
+    )
+
+
+def kmeans(
+    vectors: "np.ndarray",
+    k: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = KMEANS_SEED,
+) -> "np.ndarray":
+    """Cluster label of every row, by cosine similarity (spherical k-means
+    with k-means++ seeding)."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    points = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    k = min(k, len(points))
+
+    centroids = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = 1 - (points @ np.stack(centroids).T).max(axis=1)
+        distances = np.clip(distances, 0, None) ** 2
+        if not distances.sum():
+            break
+        centroids.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centroids = np.stack(centroids)
+
+    labels = np.full(len(points), -1)
+    for _ in range(iterations):
+        new_labels = (points @ centroids.T).argmax(axis=1)
+        if (new_labels == labels).all():
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, points)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # An emptied cluster keeps its previous centre.
+        centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+    return labels
+
+
+@dataclass
+class FailureCluster:
+    failures: List[Dict]
+    # Indices into `failures`, closest to the cluster centre first.
+    order: List[int]
+    summary: str = ""
+
+    @property
+    def questions(self) -> int:
+        return len({failure["question"] for failure in self.failures})
+
+    def representatives(self, count: int) -> List[Dict]:
+        return [self.failures[index] for index in self.order[:count]]
+
+
+def cluster_failures(
+    failure_reasons: List[Dict], embeddings: "np.ndarray", k: int = MAX_CLUSTERS
+) -> List[FailureCluster]:
+    """Group failures by embedding, largest group first."""
+    import numpy as np
+
+    labels = kmeans(embeddings, k)
+    points = embeddings / np.maximum(
+        np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12
+    )
+    clusters = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        centre = points[members].mean(axis=0)
+        closeness = points[members] @ centre
+        clusters.append(
+            FailureCluster(
+                failures=[failure_reasons[index] for index in members],
+                order=np.argsort(-closeness, kind="stable").tolist(),
+            )
+        )
+    return sorted(clusters, key=lambda cluster: -len(cluster.failures))
+
+
+async def _summarize(cluster: FailureCluster) -> str:
+    sample = format_failures(cluster.representatives(SUMMARY_SAMPLE_SIZE))
+    summary = await llm.chat(
+        FEEDBACK_MODEL,
+        [
+            {
+                "role": "system",
+                "content": "These failed fact checks from a RAG evaluation share a "
+                "common cause. Describe that cause and what the prompt should do "
+                "differently in at most two sentences.",
+            },
+            {
+                "role": "user",
+                "content": f"{len(cluster.failures)} failures, for example:\n{sample}",
+            },
+        ],
+    )
+    return summary.strip()[:SUMMARY_CHARS]
+
+
+def format_clusters(clusters: List[FailureCluster], total: int) -> str:
+    lines = [f"{total} failed facts in {len(clusters)} groups:"]
+    for cluster in clusters:
+        lines.append(
+            f"- {len(cluster.failures)} failures across {cluster.questions} "
+            f"questions: {cluster.summary}"
+        )
+        for failure in cluster.representatives(EXAMPLES_PER_CLUSTER):
+            example = f"{failure['fact']}: {failure['reason']}"
+            lines.append(f"  e.g. {example[:EXAMPLE_CHARS]}")
+    return "\n".join(lines)
+
+
+async def abuild_feedback(failure_reasons: List[Dict]) -> str:
+    failures = format_failures(failure_reasons)
+    if len(failures) <= FEEDBACK_CHAR_BUDGET:
+        return failures
+
+    with stage(FEEDBACK_COMPRESSION):
+        embeddings = await aembed_texts(
+            [f"{reason['fact']}: {reason['reason']}" for reason in failure_reasons]
+        )
+        clusters = cluster_failures(failure_reasons, embeddings)
+        summaries = await asyncio.gather(*(_summarize(c) for c in clusters))
+    for cluster, summary in zip(clusters, summaries):
+        cluster.summary = summary
+    return format_clusters(clusters, len(failure_reasons))
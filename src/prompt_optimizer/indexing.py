@@ -0,0 +1,230 @@
+import asyncio
+import base64
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Set
+
+from prompt_optimizer.ingest import (
+    EMBED_BATCH_SIZE,
+    EMBED_CONCURRENCY,
+    content_hash,
+    ingest,
+)
+from prompt_optimizer.resources import get_docs_collection, get_github_client
+
+MANIFEST_PATH = os.getenv("PROMPT_OPTIMIZER_INDEX_MANIFEST", "db/index_manifest.json")
+DOCS_OWNER = "traceloop"
+DOCS_REPO = "docs"
+DOCS_BRANCH = "main"
+DOCS_EXTENSIONS = (".mdx",)
+# Chunks read per request when hashing the stored documents.
+HASH_PAGE_SIZE = 1000
+
+
+@dataclass
+class IndexPlan:
+    added: Dict[str, str] = field(default_factory=dict)
+    changed: Dict[str, str] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    full: bool = False
+
+    @property
+    def to_embed(self) -> Dict[str, str]:
+        return {**self.added, **self.changed}
+
+    def summary(self) -> str:
+        lines = [
+            f"{'Full rebuild' if self.full else 'Incremental update'}: "
+            f"{len(self.added)} added, {len(self.changed)} changed, "
+            f"{len(self.removed)} removed, {self.unchanged} unchanged"
+        ]
+        for label, paths in (
+            ("+", self.added),
+            ("~", self.changed),
+            ("-", self.removed),
+        ):
+            lines.extend(f"  {label} {path}" for path in sorted(paths))
+        return "\n".join(lines)
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def manifest_version(path: str = MANIFEST_PATH) -> int:
+    """Changes every time load_data rewrites the manifest."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def collection_version(collection) -> Dict:
+    """Identifies what load_data last wrote; exports built from the collection
+    compare it to tell whether they are stale."""
+    return {
+        "collection": collection.name,
+        "count": collection.count(),
+        "manifest": manifest_version(),
+    }
+
+
+def save_manifest(manifest: Dict, path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+async def list_repo_files(
+    owner: str = DOCS_OWNER, repo: str = DOCS_REPO, branch: str = DOCS_BRANCH
+) -> Dict[str, str]:
+    """Map every docs file path on the branch to its git blob SHA."""
+    github_client = get_github_client()
+    branch_data = await github_client.get_branch(owner, repo, branch)
+    files = {}
+
+    async def walk(tree_sha: str, prefix: str):
+        tree = await github_client.get_tree(owner, repo, tree_sha)
+        subtrees = []
+        for entry in tree.tree:
+            path = f"{prefix}{entry.path}"
+            if entry.type == "tree":
+                subtrees.append(walk(entry.sha, f"{path}/"))
+            elif entry.type == "blob" and path.endswith(DOCS_EXTENSIONS):
+                files[path] = entry.sha
+        await asyncio.gather(*subtrees)
+
+    await walk(branch_data.commit.commit.tree.sha, "")
+    return files
+
+
+async def fetch_blob(sha: str, owner: str = DOCS_OWNER, repo: str = DOCS_REPO) -> str:
+    blob = await get_github_client().get_blob(owner, repo, sha)
+    if blob.encoding == "base64":
+        return base64.b64decode(blob.content).decode("utf-8", errors="replace")
+    return blob.content
+
+
+def plan_update(remote_files: Dict[str, str], manifest: Dict, full: bool) -> IndexPlan:
+    indexed = {} if full else manifest.get("files", {})
+    plan = IndexPlan(full=full)
+    for path, sha in remote_files.items():
+        if path not in indexed:
+            plan.added[path] = sha
+        elif indexed[path]["sha"] != sha:
+            plan.changed[path] = sha
+        else:
+            plan.unchanged += 1
+    plan.removed = [path for path in indexed if path not in remote_files]
+    return plan
+
+
+def chunk_id(path: str, blob_sha: str, index: int) -> str:
+    return f"{path}@{blob_sha}#{index}"
+
+
+def _delete_chunks(chunk_ids: List[str], batch_size: int = 500) -> None:
+    collection = get_docs_collection()
+    for start in range(0, len(chunk_ids), batch_size):
+        collection.delete(ids=chunk_ids[start : start + batch_size])
+
+
+def stored_hashes() -> Dict[str, str]:
+    """Content hash of every chunk in the collection, by chunk id."""
+    collection = get_docs_collection()
+    hashes = {}
+    for offset in range(0, collection.count(), HASH_PAGE_SIZE):
+        page = collection.get(
+            include=["documents"], limit=HASH_PAGE_SIZE, offset=offset
+        )
+        for chunk_id, document in zip(page["ids"], page["documents"]):
+            hashes[chunk_id] = content_hash(document)
+    return hashes
+
+
+def orphaned_duplicates(files: Dict, hashes: Set[str]) -> List[str]:
+    """Files that had chunks dropped as duplicates of a copy that is no longer
+    in the collection (its file was removed or changed)."""
+    return [
+        path
+        for path, entry in files.items()
+        if set(entry.get("duplicates", [])) - hashes
+    ]
+
+
+async def sync_docs(
+    full: bool = False,
+    dry_run: bool = False,
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    embed_concurrency: int = EMBED_CONCURRENCY,
+) -> IndexPlan:
+    manifest = load_manifest()
+    collection = get_docs_collection()
+    if not manifest and collection.count() and not full:
+        # Chunks written before the manifest existed cannot be matched to files.
+        print("No index manifest found for a non-empty collection, rebuilding")
+        full = True
+
+    remote_files = await list_repo_files()
+    plan = plan_update(remote_files, manifest, full)
+    print(plan.summary())
+    if dry_run:
+        return plan
+
+    if full:
+        # Drop the manifest before the chunks, so if the rebuild fails partway
+        # the next run rebuilds again instead of finding every file unchanged.
+        if os.path.exists(MANIFEST_PATH):
+            os.remove(MANIFEST_PATH)
+        _delete_chunks(collection.get(include=[])["ids"])
+        files = {}
+    else:
+        files = dict(manifest.get("files", {}))
+        for path in [*plan.removed, *plan.changed]:
+            _delete_chunks(files.pop(path)["chunk_ids"])
+
+    to_embed = dict(plan.to_embed)
+    hashes = {} if full else stored_hashes()
+    orphaned = orphaned_duplicates(files, set(hashes.values()))
+    if orphaned:
+        # Their dropped chunks are re-ingested; chunks still present elsewhere
+        # are dropped again by the dedupe stage.
+        print(f"Re-ingesting {len(orphaned)} files whose duplicates lost their copy")
+        for path in orphaned:
+            entry = files.pop(path)
+            _delete_chunks(entry["chunk_ids"])
+            for stale_id in entry["chunk_ids"]:
+                hashes.pop(stale_id, None)
+            to_embed[path] = entry["sha"]
+
+    report = await ingest(
+        to_embed.items(),
+        fetch=fetch_blob,
+        chunk_id=chunk_id,
+        embed_batch_size=embed_batch_size,
+        embed_concurrency=embed_concurrency,
+        known_hashes=set(hashes.values()),
+    )
+    print(report.summary())
+    for path, sha in to_embed.items():
+        files[path] = {
+            "sha": sha,
+            "chunk_ids": report.chunk_ids.get(path, []),
+            "duplicates": report.duplicate_hashes.get(path, []),
+        }
+
+    save_manifest(
+        {
+            "repo": f"{DOCS_OWNER}/{DOCS_REPO}",
+            "branch": DOCS_BRANCH,
+            "files": files,
+        }
+    )
+    return plan
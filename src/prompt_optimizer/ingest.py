@@ -0,0 +1,277 @@
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import (
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from prompt_optimizer.async_utils import get_async_client
+from prompt_optimizer.resources import EMBEDDING_MODEL, get_docs_collection
+from prompt_optimizer.scheduler import estimate_tokens, scheduler
+
+FETCH_CONCURRENCY = 8
+EMBED_BATCH_SIZE = 100
+EMBED_CONCURRENCY = 4
+UPSERT_BATCH_SIZE = 500
+# Every queue between two stages is bounded, so a fast stage waits for a slow
+# one instead of buffering the whole corpus in memory.
+QUEUE_SIZE = 256
+
+_DONE = object()
+
+
+def content_hash(text: str) -> str:
+    """Identifies a chunk's text regardless of whitespace."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class SourceFile:
+    path: str
+    sha: str
+    text: str = ""
+
+
+@dataclass
+class Chunk:
+    id: str
+    path: str
+    text: str
+    metadata: Dict
+    embedding: Optional[List[float]] = None
+
+
+@dataclass
+class StageStats:
+    name: str
+    unit: str = "chunks"
+    count: int = 0
+    busy_seconds: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def record(self, count: int, started: float) -> None:
+        now = time.perf_counter()
+        self.count += count
+        self.busy_seconds += now - started
+        self.started_at = self.started_at or started
+        self.finished_at = now
+
+    @property
+    def rate(self) -> float:
+        if not self.count or self.finished_at is None:
+            return 0.0
+        return self.count / max(self.finished_at - self.started_at, 1e-9)
+
+
+@dataclass
+class IngestReport:
+    chunk_ids: Dict[str, List[str]] = field(default_factory=dict)
+    # Content hashes of the chunks dropped from each file as duplicates.
+    duplicate_hashes: Dict[str, List[str]] = field(default_factory=dict)
+    duplicates: int = 0
+    stages: List[StageStats] = field(default_factory=list)
+
+    def summary(self) -> str:
+        lines = [f"Dropped {self.duplicates} duplicate chunks"]
+        for stage in self.stages:
+            lines.append(
+                f"  {stage.name:<8} {stage.count:>7} {stage.unit:<7} "
+                f"{stage.rate:9.1f} {stage.unit}/s  (busy {stage.busy_seconds:.1f}s)"
+            )
+        return "\n".join(lines)
+
+
+async def _drain(queue: asyncio.Queue):
+    while True:
+        item = await queue.get()
+        if item is _DONE:
+            # Put the marker back so sibling workers on this queue stop as well.
+            await queue.put(_DONE)
+            return
+        yield item
+
+
+async def _run_workers(
+    workers: int,
+    source: asyncio.Queue,
+    sink: Optional[asyncio.Queue],
+    handle: Callable[[object], Awaitable[list]],
+    stats: StageStats,
+    unit_count: Callable[[list], int] = len,
+):
+    async def worker():
+        async for item in _drain(source):
+            started = time.perf_counter()
+            outputs = await handle(item)
+            stats.record(unit_count(outputs), started)
+            if sink is not None:
+                for output in outputs:
+                    await sink.put(output)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    if sink is not None:
+        await sink.put(_DONE)
+
+
+def _chunk_file(
+    source: SourceFile, chunk_id: Callable[[str, str, int], str]
+) -> List[Chunk]:
+    from llama_index.core import Document
+    from llama_index.core.node_parser import SentenceSplitter
+    from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+    document = Document(
+        text=source.text,
+        id_=source.path,
+        metadata={
+            "file_path": source.path,
+            "file_name": os.path.basename(source.path),
+        },
+    )
+    chunks = []
+    for index, node in enumerate(
+        SentenceSplitter().get_nodes_from_documents([document])
+    ):
+        node.id_ = chunk_id(source.path, source.sha, index)
+        # Same metadata layout ChromaVectorStore.add writes, so llama-index can
+        # still read these chunks back.
+        metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=False)
+        chunks.append(
+            Chunk(
+                id=node.id_,
+                path=source.path,
+                text=node.get_content(),
+                metadata=metadata,
+            )
+        )
+    return chunks
+
+
+async def ingest(
+    sources: Iterable[Tuple[str, str]],
+    fetch: Callable[[str], Awaitable[str]],
+    chunk_id: Callable[[str, str, int], str],
+    embed_batch_size: int = EMBED_BATCH_SIZE,
+    embed_concurrency: int = EMBED_CONCURRENCY,
+    fetch_concurrency: int = FETCH_CONCURRENCY,
+    upsert_batch_size: int = UPSERT_BATCH_SIZE,
+    known_hashes: Optional[Set[str]] = None,
+) -> IngestReport:
+    """Fetch, chunk, de-duplicate, embed and upsert `(path, blob_sha)` sources.
+
+    Each stage runs concurrently with the others and hands its output to the
+    next one through a bounded queue. Chunks whose content hash is in
+    `known_hashes` (the chunks already in the collection) or was seen earlier
+    in this run are dropped.
+    """
+    collection = get_docs_collection()
+    client = get_async_client()
+    report = IngestReport()
+    fetch_stats = StageStats("fetch", unit="files")
+    chunk_stats = StageStats("chunk")
+    dedupe_stats = StageStats("dedupe")
+    embed_stats = StageStats("embed")
+    upsert_stats = StageStats("upsert")
+    report.stages = [fetch_stats, chunk_stats, dedupe_stats, embed_stats, upsert_stats]
+
+    pending, fetched, chunked, unique, embedded = (
+        asyncio.Queue(QUEUE_SIZE) for _ in range(5)
+    )
+    batches = asyncio.Queue(max(QUEUE_SIZE // embed_batch_size, embed_concurrency))
+
+    async def produce():
+        for path, sha in sources:
+            await pending.put(SourceFile(path, sha))
+        await pending.put(_DONE)
+
+    async def fetch_file(source: SourceFile):
+        source.text = await fetch(source.sha)
+        return [source]
+
+    async def chunk(source: SourceFile):
+        return await asyncio.to_thread(_chunk_file, source, chunk_id)
+
+    seen_hashes = set(known_hashes or ())
+
+    async def dedupe(chunk: Chunk):
+        digest = content_hash(chunk.text)
+        if digest in seen_hashes:
+            report.duplicates += 1
+            report.duplicate_hashes.setdefault(chunk.path, []).append(digest)
+            return []
+        seen_hashes.add(digest)
+        return [chunk]
+
+    async def batch():
+        current = []
+        async for chunk in _drain(unique):
+            current.append(chunk)
+            if len(current) == embed_batch_size:
+                await batches.put(current)
+                current = []
+        if current:
+            await batches.put(current)
+        await batches.put(_DONE)
+
+    async def embed(chunks: List[Chunk]):
+        texts = [chunk.text for chunk in chunks]
+        response = await scheduler.run(
+            EMBEDDING_MODEL,
+            lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=texts),
+            sum(estimate_tokens(text) for text in texts),
+        )
+        for chunk, data in zip(chunks, response.data):
+            chunk.embedding = data.embedding
+        return [chunks]
+
+    async def upsert():
+        buffer: List[Chunk] = []
+
+        async def flush():
+            started = time.perf_counter()
+            await asyncio.to_thread(
+                collection.upsert,
+                ids=[chunk.id for chunk in buffer],
+                embeddings=[chunk.embedding for chunk in buffer],
+                documents=[chunk.text for chunk in buffer],
+                metadatas=[chunk.metadata for chunk in buffer],
+            )
+            for chunk in buffer:
+                report.chunk_ids.setdefault(chunk.path, []).append(chunk.id)
+            upsert_stats.record(len(buffer), started)
+            buffer.clear()
+
+        async for chunks in _drain(embedded):
+            buffer.extend(chunks)
+            if len(buffer) >= upsert_batch_size:
+                await flush()
+        if buffer:
+            await flush()
+
+    await asyncio.gather(
+        produce(),
+        _run_workers(fetch_concurrency, pending, fetched, fetch_file, fetch_stats),
+        _run_workers(1, fetched, chunked, chunk, chunk_stats),
+        _run_workers(1, chunked, unique, dedupe, dedupe_stats, unit_count=lambda _: 1),
+        batch(),
+        _run_workers(
+            embed_concurrency,
+            batches,
+            embedded,
+            embed,
+            embed_stats,
+            unit_count=lambda outputs: len(outputs[0]),
+        ),
+        upsert(),
+    )
+    return report
@@ -0,0 +1,448 @@
+"""Cheap-first fact judging (JUDGE_MODE "cascade").
+
+Each fact is first checked locally: if (almost) all of its key terms appear
+in the answer it passes, if (almost) none do it fails. Facts in between go to
+gpt-4o-mini, which also rates its confidence, and only answers it is unsure
+about are judged by the full gpt-4o judge. The thresholds for both steps are
+calibrated by `uv run calibrate_judge` against facts labeled by the full
+judge. Without a calibration for the current collection and labels every
+fact goes to the full judge: term coverage cannot see negation ("does not
+support X" covers "supports X"), so no cheap tier decides uncalibrated.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from prompt_optimizer import llm
+from prompt_optimizer.indexing import collection_version
+from prompt_optimizer.lexical import tokenize
+from prompt_optimizer.prompts import FACT_JUDGE_SYSTEM, fact_judge_messages
+from prompt_optimizer.resources import get_docs_collection
+from prompt_optimizer.scheduler import PRIORITY_JUDGE
+
+SMALL_JUDGE_MODEL = "gpt-4o-mini"
+CALIBRATION_PATH = os.getenv(
+    "PROMPT_OPTIMIZER_JUDGE_CALIBRATION", "db/judge_calibration.json"
+)
+LABELS_PATH = "db/judge_labels.jsonl"
+# A tier may only decide cases on which it agreed with the full judge at
+# least this often during calibration...
+TARGET_AGREEMENT = 0.97
+# ...over at least this many labeled cases.
+MIN_DECISIONS = 5
+MAX_CONCURRENT_LABELS = 8
+
+LEXICAL = "lexical"
+SMALL_MODEL = "small_model"
+FULL_JUDGE = "full_judge"
+TIERS = (LEXICAL, SMALL_MODEL, FULL_JUDGE)
+
+
+class ConfidentFactEvaluation(BaseModel):
+    fact: str
+    passed: bool
+    reason: str
+    confidence: float = Field(
+        description="How sure you are of the decision, from 0 (guess) to 1 (certain)"
+    )
+
+
+@dataclass
+class Thresholds:
+    """The defaults decide nothing: coverage is at most 1.0 and confidence at
+    most 1, so every fact goes to the full judge."""
+
+    # Share of the fact's key terms found in the answer at or above which the
+    # fact passes, and at or below which it fails, without a model call.
+    lexical_pass: float = 1.01
+    lexical_fail: float = -1.0
+    # Small-model verdicts at or above this confidence are final.
+    small_model_confidence: float = 1.01
+    # What the thresholds were calibrated on, see calibration_fingerprint.
+    fingerprint: Dict = field(default_factory=dict)
+
+    def save(self, path: str = CALIBRATION_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(asdict(self), file, indent=2)
+
+
+def labels_hash(labels: List[Dict]) -> str:
+    lines = sorted(json.dumps(label, sort_keys=True) for label in labels)
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()[:16]
+
+
+def calibration_fingerprint(labels: List[Dict], labels_path: str) -> Dict:
+    return {
+        "collection": collection_version(get_docs_collection()),
+        "labels_path": labels_path,
+        "labels": labels_hash(labels),
+        "small_model": SMALL_JUDGE_MODEL,
+    }
+
+
+def load_thresholds(path: str = CALIBRATION_PATH) -> Thresholds:
+    """The calibrated thresholds, or the defaults if there are none for the
+    current collection, labels and small model."""
+    if not os.path.exists(path):
+        return Thresholds()
+    with open(path) as file:
+        thresholds = Thresholds(**json.load(file))
+
+    fingerprint = thresholds.fingerprint
+    collection = collection_version(get_docs_collection())
+    labels = _load_labels(fingerprint.get("labels_path", ""))
+    if (
+        fingerprint.get("small_model") != SMALL_JUDGE_MODEL
+        or fingerprint.get("collection") != collection
+        or (labels is not None and labels_hash(labels) != fingerprint.get("labels"))
+    ):
+        print(
+            f"Judge calibration {path} does not match the current collection or "
+            "labels, sending every fact to the full judge"
+        )
+        return Thresholds()
+    return thresholds
+
+
+_loaded: Optional[Thresholds] = None
+
+
+def reload_thresholds() -> Thresholds:
+    """Read the calibration once per evaluation rather than once per fact."""
+    global _loaded
+    _loaded = load_thresholds()
+    return _loaded
+
+
+def current_thresholds() -> Thresholds:
+    return _loaded if _loaded is not None else reload_thresholds()
+
+
+def _stem(token: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[: -len(suffix)]
+    return token
+
+
+def lexical_coverage(fact: str, response: str) -> float:
+    """Share of the fact's distinct key terms that also appear in the answer."""
+    terms = {_stem(token) for token in tokenize(fact)}
+    if not terms:
+        return 0.0
+    answer = {_stem(token) for token in tokenize(response)}
+    return len(terms & answer) / len(terms)
+
+
+class CascadeStats:
+    def __init__(self):
+        self.tiers: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, tier: str) -> None:
+        with self._lock:
+            self.tiers[tier] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {tier: self.tiers[tier] for tier in TIERS}
+
+
+cascade_stats = CascadeStats()
+
+
+def format_cascade_stats(before: Dict[str, int], after: Dict[str, int]) -> str:
+    decided = {tier: after[tier] - before[tier] for tier in TIERS}
+    total = sum(decided.values())
+    if not total:
+        return "Judge cascade: no facts judged"
+    return (
+        f"Judge cascade: {decided[LEXICAL]} facts decided locally, "
+        f"{decided[SMALL_MODEL]} by {SMALL_JUDGE_MODEL}, {decided[FULL_JUDGE]} by "
+        f"the full judge ({1 - decided[FULL_JUDGE] / total:.0%} of full judge "
+        "calls avoided)"
+    )
+
+
+def small_judge_input(question: str, response: str, fact: str) -> List[Dict]:
+    messages = fact_judge_messages(question, response, fact)
+    messages[0] = {
+        "role": "system",
+        "content": f"{FACT_JUDGE_SYSTEM} Also rate your confidence in the decision.",
+    }
+    return messages
+
+
+FullJudge = Callable[[str, str, str], Awaitable]
+
+
+async def ajudge_fact(
+    question: str,
+    response: str,
+    fact: str,
+    full_judge: FullJudge,
+    thresholds: Optional[Thresholds] = None,
+) -> Tuple[bool, str, str]:
+    """(passed, reason, tier that decided) for one fact. `full_judge` is the
+    gpt-4o judge, called only when the cheaper tiers are not confident."""
+    result = await _ajudge_fact(
+        question, response, fact, full_judge, thresholds or current_thresholds()
+    )
+    cascade_stats.add(result[2])
+    return result
+
+
+async def _ajudge_fact(
+    question: str,
+    response: str,
+    fact: str,
+    full_judge: FullJudge,
+    thresholds: Thresholds,
+) -> Tuple[bool, str, str]:
+    coverage = lexical_coverage(fact, response)
+    if coverage >= thresholds.lexical_pass:
+        return (
+            True,
+            f"{coverage:.0%} of the fact's key terms appear in the answer.",
+            LEXICAL,
+        )
+    if coverage <= thresholds.lexical_fail:
+        return (
+            False,
+            f"Only {coverage:.0%} of the fact's key terms appear in the answer.",
+            LEXICAL,
+        )
+
+    small = await llm.parse(
+        SMALL_JUDGE_MODEL,
+        small_judge_input(question, response, fact),
+        ConfidentFactEvaluation,
+        priority=PRIORITY_JUDGE,
+    )
+    if small.confidence >= thresholds.small_model_confidence:
+        return small.passed, small.reason, SMALL_MODEL
+
+    evaluation = await full_judge(question, response, fact)
+    return evaluation.passed, evaluation.reason, FULL_JUDGE
+
+
+# Calibration
+
+
+def _in_holdout(label: Dict) -> bool:
+    digest = hashlib.sha256(f"{label['question']}\0{label['fact']}".encode("utf-8"))
+    return digest.digest()[0] % 2 == 1
+
+
+def _agreeing_threshold(
+    cases: List[Tuple[float, bool]], candidates: List[float], decides, expected: bool
+) -> Optional[float]:
+    """The first candidate threshold whose decided cases agree with the full
+    judge at least TARGET_AGREEMENT of the time (over MIN_DECISIONS cases)."""
+    for threshold in candidates:
+        decided = [label for value, label in cases if decides(value, threshold)]
+        if len(decided) < MIN_DECISIONS:
+            continue
+        if sum(label == expected for label in decided) / len(decided) >= (
+            TARGET_AGREEMENT
+        ):
+            return threshold
+    return None
+
+
+def calibrate_lexical(labels: List[Dict], thresholds: Thresholds) -> None:
+    cases = [
+        (lexical_coverage(label["fact"], label["response"]), label["passed"])
+        for label in labels
+    ]
+    values = sorted({value for value, _ in cases})
+    lexical_pass = _agreeing_threshold(
+        cases, values, lambda value, threshold: value >= threshold, True
+    )
+    lexical_fail = _agreeing_threshold(
+        cases, values[::-1], lambda value, threshold: value <= threshold, False
+    )
+    # A tier that never reaches the target agreement decides nothing.
+    thresholds.lexical_pass = 1.01 if lexical_pass is None else lexical_pass
+    thresholds.lexical_fail = -1.0 if lexical_fail is None else lexical_fail
+
+
+async def _small_verdicts(labels: List[Dict]) -> List[ConfidentFactEvaluation]:
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_LABELS)
+
+    async def judge(label: Dict):
+        async with semaphore:
+            return await llm.parse(
+                SMALL_JUDGE_MODEL,
+                small_judge_input(label["question"], label["response"], label["fact"]),
+                ConfidentFactEvaluation,
+                priority=PRIORITY_JUDGE,
+            )
+
+    return await asyncio.gather(*(judge(label) for label in labels))
+
+
+async def acalibrate_small_model(labels: List[Dict], thresholds: Thresholds) -> None:
+    undecided = [
+        label
+        for label in labels
+        if thresholds.lexical_fail
+        < lexical_coverage(label["fact"], label["response"])
+        < thresholds.lexical_pass
+    ]
+    verdicts = await _small_verdicts(undecided)
+    # Agreement is what matters here, so every verdict is compared to `True`.
+    cases = [
+        (verdict.confidence, verdict.passed == label["passed"])
+        for verdict, label in zip(verdicts, undecided)
+    ]
+    confidence = _agreeing_threshold(
+        cases,
+        sorted({value for value, _ in cases}),
+        lambda value, threshold: value >= threshold,
+        True,
+    )
+    thresholds.small_model_confidence = 1.01 if confidence is None else confidence
+
+
+async def alabel_facts(prompt_template: str, items: List[Dict]) -> List[Dict]:
+    """Answer every item and label each required fact with the full judge."""
+    from prompt_optimizer.rag import aquery_rag
+    from prompt_optimizer.runner import aevaluate_single_fact
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_LABELS)
+
+    async def label(item: Dict) -> List[Dict]:
+        async with semaphore:
+            response = await aquery_rag(prompt_template, item["question"])
+            evaluations = await asyncio.gather(
+                *(
+                    aevaluate_single_fact(item["question"], response, fact)
+                    for fact in item["required_facts"]
+                )
+            )
+        return [
+            {
+                "question": item["question"],
+                "response": response,
+                "fact": fact,
+                "passed": evaluation.passed,
+            }
+            for fact, evaluation in zip(item["required_facts"], evaluations)
+        ]
+
+    return [row for rows in await asyncio.gather(*map(label, items)) for row in rows]
+
+
+async def aevaluate_cascade(labels: List[Dict], thresholds: Thresholds) -> Dict:
+    """Replay the cascade on labeled facts; the label stands in for the full
+    judge, so no gpt-4o calls are made."""
+
+    async def judge(label: Dict):
+        async def full_judge(question, response, fact):
+            return ConfidentFactEvaluation(
+                fact=fact, passed=label["passed"], reason="", confidence=1.0
+            )
+
+        return await _ajudge_fact(
+            label["question"], label["response"], label["fact"], full_judge, thresholds
+        )
+
+    results = await asyncio.gather(*map(judge, labels))
+    tiers = Counter(tier for _, _, tier in results)
+    agreements = Counter(
+        tier
+        for (passed, _, tier), label in zip(results, labels)
+        if passed == label["passed"]
+    )
+    total = len(labels)
+    return {
+        "facts": total,
+        "tiers": {tier: tiers[tier] for tier in TIERS},
+        "tier_agreement": {
+            tier: agreements[tier] / tiers[tier] if tiers[tier] else None
+            for tier in TIERS
+        },
+        "agreement": sum(agreements.values()) / total if total else 1.0,
+        "full_judge_calls_avoided": 1 - tiers[FULL_JUDGE] / total if total else 0.0,
+    }
+
+
+def _load_labels(path: str) -> Optional[List[Dict]]:
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def run():
+    from rich.console import Console
+    from rich.table import Table
+
+    from prompt_optimizer.async_utils import run_sync
+    from prompt_optimizer.prompts import DEFAULT_PROMPT
+    from prompt_optimizer.runner import get_items_to_evaluate
+    from prompt_optimizer.telemetry import telemetry
+
+    parser = argparse.ArgumentParser(
+        description="Calibrate the judge cascade against full-judge labels"
+    )
+    parser.add_argument(
+        "--labels",
+        default=LABELS_PATH,
+        help="JSONL of question/response/fact/passed; built with the full judge "
+        "from the evaluation items if it does not exist",
+    )
+    parser.add_argument("--output", default=CALIBRATION_PATH)
+    args = parser.parse_args()
+
+    telemetry.start_run()
+    labels = _load_labels(args.labels)
+    if labels is None:
+        labels = run_sync(alabel_facts(DEFAULT_PROMPT, get_items_to_evaluate()))
+        os.makedirs(os.path.dirname(args.labels) or ".", exist_ok=True)
+        with open(args.labels, "w") as file:
+            file.writelines(json.dumps(label) + "\n" for label in labels)
+        print(f"Labeled {len(labels)} facts with the full judge: {args.labels}")
+
+    # Thresholds are fitted on one half of the facts and checked on the other.
+    calibration = [label for label in labels if not _in_holdout(label)]
+    holdout = [label for label in labels if _in_holdout(label)]
+    thresholds = Thresholds(fingerprint=calibration_fingerprint(labels, args.labels))
+    calibrate_lexical(calibration, thresholds)
+    run_sync(acalibrate_small_model(calibration, thresholds))
+    thresholds.save(args.output)
+    print(
+        f"Thresholds written to {args.output}: "
+        f"lexical pass >= {thresholds.lexical_pass:.2f}, "
+        f"lexical fail <= {thresholds.lexical_fail:.2f}, "
+        f"{SMALL_JUDGE_MODEL} confidence >= {thresholds.small_model_confidence:.2f}"
+    )
+
+    report = run_sync(aevaluate_cascade(holdout, thresholds))
+    table = Table(title=f"Judge cascade on {report['facts']} held-out facts")
+    table.add_column("Tier")
+    table.add_column("Facts decided", justify="right")
+    table.add_column("Agreement with full judge", justify="right")
+    for tier in TIERS:
+        agreement = report["tier_agreement"][tier]
+        table.add_row(
+            tier,
+            str(report["tiers"][tier]),
+            "-" if agreement is None else f"{agreement:.1%}",
+        )
+    Console().print(table)
+    print(
+        f"Overall agreement {report['agreement']:.1%}, "
+        f"{report['full_judge_calls_avoided']:.0%} of full judge calls avoided"
+    )
@@ -0,0 +1,184 @@
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+from rich.console import Console
+from rich.table import Table
+
+from prompt_optimizer.async_utils import get_async_client, run_sync
+from prompt_optimizer.llm import EXPECTED_OUTPUT_TOKENS
+from prompt_optimizer.prompts import (
+    DEFAULT_PROMPT,
+    fact_judge_messages,
+    facts_judge_messages,
+)
+from prompt_optimizer.rag import aquery_rag
+from prompt_optimizer.runner import (
+    JUDGE_MODEL,
+    FactEvaluation,
+    ResponseEvaluation,
+    ajudge_batched,
+    get_items_to_evaluate,
+)
+from prompt_optimizer.scheduler import PRIORITY_JUDGE, estimate_tokens, scheduler
+
+console = Console()
+
+PROMPT_TEMPLATE = DEFAULT_PROMPT
+
+
+# The judges are called directly rather than through the response cache: the
+# harness needs each call's usage and latency.
+async def _judge(input: List[Dict[str, str]], text_format):
+    client = get_async_client()
+    return await scheduler.run(
+        JUDGE_MODEL,
+        lambda: client.responses.parse(
+            model=JUDGE_MODEL, input=input, text_format=text_format
+        ),
+        estimate_tokens(json.dumps(input)) + EXPECTED_OUTPUT_TOKENS,
+        PRIORITY_JUDGE,
+    )
+
+
+async def _judge_fact(question: str, response: str, fact: str):
+    return await _judge(fact_judge_messages(question, response, fact), FactEvaluation)
+
+
+async def _judge_facts(question: str, response: str, facts: List[str]):
+    return await _judge(
+        facts_judge_messages(question, response, facts), ResponseEvaluation
+    )
+
+
+def _add_usage(totals: Dict[str, float], result) -> None:
+    totals["calls"] += 1
+    if result.usage:
+        totals["input_tokens"] += result.usage.input_tokens
+        totals["output_tokens"] += result.usage.output_tokens
+
+
+def _new_totals() -> Dict[str, float]:
+    return {"calls": 0, "input_tokens": 0, "output_tokens": 0, "seconds": 0.0}
+
+
+async def _judge_per_fact(question: str, response: str, facts: List[str], totals):
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(_judge_fact(question, response, fact) for fact in facts)
+    )
+    totals["seconds"] += time.perf_counter() - start
+    for result in results:
+        _add_usage(totals, result)
+    return [result.output_parsed for result in results]
+
+
+async def _judge_batched(question: str, response: str, facts: List[str], totals):
+    # Same matching and fallback as the runner's batched mode, with calls that
+    # record their usage.
+    async def judge_facts(question: str, response: str, facts: List[str]):
+        result = await _judge_facts(question, response, facts)
+        _add_usage(totals, result)
+        return result.output_parsed
+
+    async def judge_fact(question: str, response: str, fact: str):
+        totals["fallbacks"] = totals.get("fallbacks", 0) + 1
+        result = await _judge_fact(question, response, fact)
+        _add_usage(totals, result)
+        return result.output_parsed
+
+    start = time.perf_counter()
+    evaluations = await ajudge_batched(
+        question, response, facts, judge_facts, judge_fact
+    )
+    totals["seconds"] += time.perf_counter() - start
+    return evaluations
+
+
+async def compare(prompt_template: str = PROMPT_TEMPLATE):
+    # The same items evaluate scores, including a configured dataset.
+    items = get_items_to_evaluate()
+    per_fact = _new_totals()
+    batched = _new_totals()
+    total_facts = 0
+    disagreements = []
+
+    # Both modes judge the same generated answer, one question at a time, so the
+    # latency numbers are not skewed by each other's requests.
+    for item in items:
+        question, facts = item["question"], item["required_facts"]
+        response = await aquery_rag(prompt_template, question)
+
+        per_fact_evaluations = await _judge_per_fact(
+            question, response, facts, per_fact
+        )
+        batched_evaluations = await _judge_batched(question, response, facts, batched)
+
+        total_facts += len(facts)
+        for single, batch in zip(per_fact_evaluations, batched_evaluations):
+            if single.passed != batch.passed:
+                disagreements.append(
+                    {
+                        "question": question,
+                        "fact": single.fact,
+                        "per_fact": single.passed,
+                        "batched": batch.passed,
+                    }
+                )
+
+    return {
+        "questions": len(items),
+        "facts": total_facts,
+        "per_fact": per_fact,
+        "batched": batched,
+        "disagreements": disagreements,
+    }
+
+
+def _savings(before: float, after: float) -> str:
+    if not before:
+        return "-"
+    return f"{(before - after) / before:.0%}"
+
+
+def run():
+    report = run_sync(compare())
+    if not report["facts"]:
+        console.print("No facts to judge, nothing to compare")
+        return
+    per_fact, batched = report["per_fact"], report["batched"]
+
+    table = Table(title=f"Judge modes over {report['questions']} questions")
+    table.add_column("Metric")
+    table.add_column("per_fact", justify="right")
+    table.add_column("batched", justify="right")
+    table.add_column("Savings", justify="right")
+    for metric in ("calls", "input_tokens", "output_tokens"):
+        table.add_row(
+            metric,
+            str(per_fact[metric]),
+            str(batched[metric]),
+            _savings(per_fact[metric], batched[metric]),
+        )
+    table.add_row(
+        "judge seconds",
+        f"{per_fact['seconds']:.1f}",
+        f"{batched['seconds']:.1f}",
+        _savings(per_fact["seconds"], batched["seconds"]),
+    )
+    console.print(table)
+
+    disagreements = report["disagreements"]
+    console.print(
+        f"Batched fallbacks: {batched.get('fallbacks', 0)} of {report['facts']} facts"
+    )
+    console.print(
+        f"Disagreements: {len(disagreements)} of {report['facts']} facts "
+        f"({len(disagreements) / report['facts']:.1%})"
+    )
+    for disagreement in disagreements:
+        console.print(
+            f"- {disagreement['question']} / {disagreement['fact']}: "
+            f"per_fact={disagreement['per_fact']} batched={disagreement['batched']}"
+        )
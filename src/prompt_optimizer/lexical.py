@@ -0,0 +1,135 @@
+"""BM25 inverted index over the indexed docs chunks.
+
+load_data rebuilds it from the Chroma collection after every sync, so its
+chunk ids always line up with the vector index. It is used by the hybrid
+retrieval mode in rag, which searches with the raw question instead of an
+LLM-rewritten query.
+"""
+
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from prompt_optimizer.indexing import collection_version
+from prompt_optimizer.resources import get_docs_collection
+from prompt_optimizer.vector_index import EXPORT_PAGE_SIZE
+
+BM25_PATH = os.getenv("PROMPT_OPTIMIZER_BM25_PATH", "db/bm25_index.json")
+BM25_K1 = 1.5
+BM25_B = 0.75
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its of on or "
+    "the that this to was what when where which who why will with you your".split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(
+        self,
+        ids: List[str],
+        lengths: List[int],
+        postings: Dict[str, List[Tuple[int, int]]],
+        version: Dict,
+    ):
+        self.ids = ids
+        self.lengths = lengths
+        self.postings = postings
+        self.version = version
+        self.average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, ids: List[str], documents: List[str], version: Dict) -> "BM25Index":
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        lengths = []
+        for row, document in enumerate(documents):
+            tokens = tokenize(document)
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                postings[term].append((row, count))
+        return cls(ids, lengths, dict(postings), version)
+
+    def search(self, query: str, n_results: int = 5) -> List[Tuple[int, float]]:
+        """(row, score) of the best matching chunks, best first."""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term, [])
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (len(self.ids) - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for row, count in postings:
+                norm = 1 - BM25_B + BM25_B * self.lengths[row] / self.average_length
+                scores[row] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda entry: (-entry[1], entry[0]))[
+            :n_results
+        ]
+
+    def save(self, path: str = BM25_PATH) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "version": self.version,
+                    "ids": self.ids,
+                    "lengths": self.lengths,
+                    "postings": self.postings,
+                },
+                file,
+            )
+        os.replace(tmp_path, path)
+
+
+def build_bm25_index(path: str = BM25_PATH) -> BM25Index:
+    """Index every chunk currently in the collection and write it to `path`."""
+    collection = get_docs_collection()
+    version = collection_version(collection)
+    ids: List[str] = []
+    documents: List[str] = []
+    for offset in range(0, version["count"], EXPORT_PAGE_SIZE):
+        page = collection.get(
+            include=["documents"], limit=EXPORT_PAGE_SIZE, offset=offset
+        )
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+    index = BM25Index.build(ids, documents, version)
+    index.save(path)
+    return index
+
+
+_loaded: Optional[BM25Index] = None
+
+
+def load_bm25_index(path: str = BM25_PATH) -> Optional[BM25Index]:
+    """The saved index, or None if load_data has not built one for the
+    current collection."""
+    global _loaded
+    version = collection_version(get_docs_collection())
+    if _loaded is not None and _loaded.version == version:
+        return _loaded
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        data = json.load(file)
+    if data["version"] != version:
+        return None
+    _loaded = BM25Index(
+        data["ids"],
+        data["lengths"],
+        {
+            term: [tuple(entry) for entry in rows]
+            for term, rows in data["postings"].items()
+        },
+        data["version"],
+    )
+    return _loaded
@@ -0,0 +1,105 @@
+import json
+import time
+from typing import AsyncIterator, Dict, List, Type, TypeVar
+
+from pydantic import BaseModel
+
+from prompt_optimizer.async_utils import get_async_client
+from prompt_optimizer.cache import cache_key, response_cache
+from prompt_optimizer.scheduler import PRIORITY_DEFAULT, estimate_tokens, scheduler
+from prompt_optimizer.telemetry import telemetry
+
+ParsedT = TypeVar("ParsedT", bound=BaseModel)
+
+# Output tokens reserved against a model's TPM budget before the call; the
+# reservation is settled with the real usage afterwards.
+EXPECTED_OUTPUT_TOKENS = 500
+
+
+async def chat(
+    model: str, messages: List[Dict[str, str]], priority: int = PRIORITY_DEFAULT
+) -> str:
+    key = cache_key(model, messages)
+    cached = response_cache.get(key)
+    if cached is not None:
+        telemetry.record_usage(model, cache_hit=True)
+        return json.loads(cached)
+
+    client = get_async_client()
+    started = time.perf_counter()
+    response = await scheduler.run(
+        model,
+        lambda: client.chat.completions.create(model=model, messages=messages),
+        estimate_tokens(json.dumps(messages)) + EXPECTED_OUTPUT_TOKENS,
+        priority,
+    )
+    telemetry.record_openai_usage(model, response.usage, time.perf_counter() - started)
+    content = response.choices[0].message.content
+    response_cache.set(key, json.dumps(content))
+    return content
+
+
+async def chat_stream(
+    model: str, messages: List[Dict[str, str]], priority: int = PRIORITY_DEFAULT
+) -> AsyncIterator[str]:
+    """Like chat, but yields the answer as it is generated."""
+    key = cache_key(model, messages)
+    cached = response_cache.get(key)
+    if cached is not None:
+        telemetry.record_usage(model, cache_hit=True)
+        yield json.loads(cached)
+        return
+
+    client = get_async_client()
+    started = time.perf_counter()
+    parts = []
+    # The slot is held until the stream ends, so streams in progress count
+    # against the model's concurrency limit.
+    async with scheduler.hold(
+        model,
+        lambda: client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        ),
+        estimate_tokens(json.dumps(messages)) + EXPECTED_OUTPUT_TOKENS,
+        priority,
+    ) as held:
+        async for chunk in held.result:
+            if chunk.usage is not None:
+                held.used_tokens = chunk.usage.total_tokens
+                telemetry.record_openai_usage(
+                    model, chunk.usage, time.perf_counter() - started
+                )
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+    response_cache.set(key, json.dumps("".join(parts)))
+
+
+async def parse(
+    model: str,
+    input: List[Dict[str, str]],
+    text_format: Type[ParsedT],
+    priority: int = PRIORITY_DEFAULT,
+) -> ParsedT:
+    key = cache_key(model, input, text_format.model_json_schema())
+    cached = response_cache.get(key)
+    if cached is not None:
+        telemetry.record_usage(model, cache_hit=True)
+        return text_format.model_validate_json(cached)
+
+    client = get_async_client()
+    started = time.perf_counter()
+    result = await scheduler.run(
+        model,
+        lambda: client.responses.parse(
+            model=model, input=input, text_format=text_format
+        ),
+        estimate_tokens(json.dumps(input)) + EXPECTED_OUTPUT_TOKENS,
+        priority,
+    )
+    telemetry.record_openai_usage(model, result.usage, time.perf_counter() - started)
+    response_cache.set(key, result.output_parsed.model_dump_json())
+    return result.output_parsed
@@ -1,4 +1,7 @@
-from typing import Optional
+import argparse
+import asyncio
+import time
+from typing import List, Optional
 
 from crewai.flow.flow import Flow, listen, router, start
 from pydantic import BaseModel
@@ -7,15 +10,38 @@ from prompt_optimizer.evaluate_crew.evaluate_crew import (
     PromptEvaluator,
     EvaluationResult,
 )
+from prompt_optimizer.async_utils import run_sync
+from prompt_optimizer.checkpoint import Checkpoint, prompt_hash
+from prompt_optimizer.feedback import abuild_feedback
 from prompt_optimizer.optimize_crew.optimize_crew import PromptOptimizer
+from prompt_optimizer.prompts import DEFAULT_PROMPT, to_prefix_layout
+from prompt_optimizer.run_store import RUNNING, run_store
+from prompt_optimizer.runner import (
+    EVALUATE_CALLS,
+    aevaluate,
+    aevaluate_adaptive,
+    evaluation_config,
+)
+from prompt_optimizer.telemetry import (
+    EVALUATOR_CREW,
+    OPTIMIZER_CREW,
+    stage,
+    telemetry,
+)
 
+START_PROMPT = DEFAULT_PROMPT
 
-START_PROMPT = """Answer the following question based on the provided context:
-Context:
-{context}
+TARGET_SCORE = 0.8
+MAX_RETRIES = 3
 
-Question:
-{question}"""
+
+class PromptCandidate(BaseModel):
+    prompt: str
+    score: float
+    feedback: Optional[str] = None
+    round: int = 0
+    # Set when adaptive evaluation stopped early; the score is then partial.
+    items_evaluated: Optional[int] = None
 
 
 class PromptOptimizationFlowState(BaseModel):
@@ -24,19 +50,120 @@ class PromptOptimizationFlowState(BaseModel):
     valid: bool = False
     retry_count: int = 0
     score: float = 0.0
+    history: List[PromptCandidate] = []
+    # Let the PromptEvaluator agent decide when to run the evaluation instead
+    # of calling the evaluation engine directly.
+    use_evaluator_crew: bool = False
+    # runner.evaluate()/evaluate_adaptive() invocations per round.
+    evaluate_calls: List[int] = []
+    # Run store id; the state is saved there after every step.
+    run_id: Optional[str] = None
+    # Whether `prompt` has been evaluated, so a resumed run optimizes it
+    # instead of evaluating it again.
+    evaluated: bool = False
+    # Set by `kickoff --resume`: evaluations continue from their checkpoints.
+    resumed: bool = False
+
+
+def total_evaluate_calls() -> int:
+    return sum(EVALUATE_CALLS.values())
+
+
+def best_candidate(history: List[PromptCandidate]) -> Optional[PromptCandidate]:
+    # max() keeps the first of equal scores, i.e. the earliest prompt found.
+    return max(history, key=lambda candidate: candidate.score, default=None)
+
+
+def save_step(state: PromptOptimizationFlowState, name: str, started: float) -> None:
+    if state.run_id:
+        run_store.save_step(
+            state.run_id, name, state.model_dump(), time.perf_counter() - started
+        )
+
+
+def record_candidate(
+    state: PromptOptimizationFlowState, candidate: PromptCandidate, seconds: float
+) -> None:
+    if state.run_id:
+        run_store.record_prompt(
+            state.run_id,
+            candidate.model_dump(),
+            seconds,
+            Checkpoint(candidate.prompt, evaluation_config()).load(),
+        )
+
+
+def finish_run(state: PromptOptimizationFlowState, status: str) -> None:
+    if state.run_id:
+        run_store.finish_run(state.run_id, status)
+
+
+def write_best_prompt(state: PromptOptimizationFlowState) -> PromptCandidate:
+    best = best_candidate(state.history) or PromptCandidate(
+        prompt=state.prompt, score=state.score, feedback=state.feedback or None
+    )
+    print(f"Final prompt (Score: {best.score:.2f}, round {best.round}):")
+    print(best.prompt)
+
+    with open("optimized_prompt.txt", "w") as file:
+        file.write(f"Score: {best.score:.2f}\n")
+        file.write(f"Prompt:\n{best.prompt}")
+    return best
 
 
 class PromptOptimizationFlow(Flow[PromptOptimizationFlowState]):
 
+    def _evaluate_directly(self, prompt: str) -> EvaluationResult:
+        previous = next(
+            (
+                candidate
+                for candidate in self.state.history
+                if prompt_hash(candidate.prompt) == prompt_hash(prompt)
+            ),
+            None,
+        )
+        if previous is not None:
+            print("Prompt was already evaluated, reusing its score")
+            return EvaluationResult(
+                score=previous.score, failure_reasons=previous.feedback or ""
+            )
+
+        score, failure_reasons = run_sync(aevaluate(prompt, resume=self.state.resumed))
+        return EvaluationResult(
+            score=score, failure_reasons=run_sync(abuild_feedback(failure_reasons))
+        )
+
     @start("retry")
     def evaluate_prompt(self):
+        if self.state.evaluated:
+            print(f"Resuming after round {self.state.retry_count - 1}'s evaluation")
+            return "optimize"
+
         print("Evaluating prompt")
-        result: EvaluationResult = (
-            PromptEvaluator().crew().kickoff(inputs={"prompt": self.state.prompt})
-        ).pydantic
+        started = time.perf_counter()
+        calls_before = total_evaluate_calls()
+        if self.state.use_evaluator_crew:
+            crew = PromptEvaluator().crew()
+            with stage(EVALUATOR_CREW):
+                output = crew.kickoff(inputs={"prompt": self.state.prompt})
+            telemetry.record_crew_usage(crew, output, EVALUATOR_CREW)
+            result: EvaluationResult = output.pydantic
+        else:
+            result = self._evaluate_directly(self.state.prompt)
+        self.state.evaluate_calls.append(total_evaluate_calls() - calls_before)
+        print(f"evaluate() calls this round: {self.state.evaluate_calls[-1]}")
+
         self.state.score = result.score
         self.state.valid = not result.failure_reasons
         self.state.feedback = result.failure_reasons
+        candidate = PromptCandidate(
+            prompt=self.state.prompt,
+            score=result.score,
+            feedback=result.failure_reasons,
+            round=self.state.retry_count,
+        )
+        self.state.history.append(candidate)
+        record_candidate(self.state, candidate, time.perf_counter() - started)
 
         print(f"Evaluation results:")
         print(f"Score: {self.state.score:.2f}")
@@ -45,58 +172,295 @@ class PromptOptimizationFlow(Flow[PromptOptimizationFlowState]):
             print(result.failure_reasons)
 
         self.state.retry_count += 1
+        self.state.evaluated = True
+        save_step(self.state, "evaluate_prompt", started)
 
         return "optimize"
 
     @router(evaluate_prompt)
     def optimize_prompt(self):
-        if self.state.score > 0.8:
+        if self.state.score > TARGET_SCORE:
             return "complete"
 
-        if self.state.retry_count > 3:
+        if self.state.retry_count > MAX_RETRIES:
             return "max_retry_exceeded"
 
         print("Optimizing prompt")
-        result = (
-            PromptOptimizer()
-            .crew()
-            .kickoff(
+        started = time.perf_counter()
+        crew = PromptOptimizer().crew()
+        with stage(OPTIMIZER_CREW):
+            result = crew.kickoff(
                 inputs={
                     "prompt": self.state.prompt,
                     "feedback": self.state.feedback,
                     "score": self.state.score,
                 }
             )
-        )
+        telemetry.record_crew_usage(crew, result, OPTIMIZER_CREW)
 
         print("Optimized prompt:", result.raw)
-        self.state.prompt = result.raw
+        self.state.prompt = to_prefix_layout(result.raw)
+        self.state.evaluated = False
+        save_step(self.state, "optimize_prompt", started)
 
         return "retry"
 
     @listen("complete")
     def save_result(self):
         print("Prompt is valid")
-        print(f"Final prompt (Score: {self.state.score:.2f}):")
-        print(self.state.prompt)
-
-        with open("optimized_prompt.txt", "w") as file:
-            file.write(f"Score: {self.state.score:.2f}\n")
-            file.write(f"Prompt:\n{self.state.prompt}")
+        write_best_prompt(self.state)
+        finish_run(self.state, "complete")
 
     @listen("max_retry_exceeded")
     def max_retry_exceeded_exit(self):
         print("Max retry count exceeded")
-        print(f"Final prompt (Score: {self.state.score:.2f}):")
-        print(self.state.prompt)
-        if self.state.feedback:
+        best = write_best_prompt(self.state)
+        finish_run(self.state, "max_retry_exceeded")
+        if best.feedback:
             print("\nRemaining failure reasons:")
-            print(self.state.feedback)
+            print(best.feedback)
+
+
+class BeamSearchFlowState(PromptOptimizationFlowState):
+    candidates_per_round: int = 4
+    beam_width: int = 2
+    max_rounds: int = 4
+    round: int = 0
+    beam: List[PromptCandidate] = []
+    adaptive: bool = False
+    # Prompts proposed for the current round that are not scored yet.
+    pending: List[str] = []
+
+
+class BeamSearchOptimizationFlow(Flow[BeamSearchFlowState]):
+    """Each round expands every prompt in the beam into new candidates, scores
+    them concurrently and keeps the best `beam_width` prompts seen so far."""
+
+    def _score_to_beat(self) -> float:
+        if len(self.state.beam) < self.state.beam_width:
+            return 0.0
+        return self.state.beam[-1].score
+
+    async def _score(self, prompt: str) -> PromptCandidate:
+        if self.state.run_id:
+            stored = run_store.prompt(self.state.run_id, prompt)
+            if stored is not None:
+                print("Candidate was already scored in this run, reusing its score")
+                return PromptCandidate(**stored)
+
+        started = time.perf_counter()
+        candidate = await self._evaluate(prompt)
+        record_candidate(self.state, candidate, time.perf_counter() - started)
+        return candidate
+
+    async def _evaluate(self, prompt: str) -> PromptCandidate:
+        score_to_beat = self._score_to_beat()
+        if self.state.adaptive and score_to_beat > 0:
+            result = await aevaluate_adaptive(
+                prompt, score_to_beat, resume=self.state.resumed
+            )
+            if result.stopped_early:
+                print(
+                    f"Dropped candidate after {result.items_evaluated}/"
+                    f"{result.total_items} items (score {result.score:.2f}, "
+                    f"interval {result.interval[0]:.2f}-{result.interval[1]:.2f})"
+                )
+            return PromptCandidate(
+                prompt=prompt,
+                score=result.score,
+                feedback=await abuild_feedback(result.failure_reasons),
+                round=self.state.round,
+                items_evaluated=(
+                    result.items_evaluated if result.stopped_early else None
+                ),
+            )
+
+        score, failure_reasons = await aevaluate(
+            prompt, show_progress=False, resume=self.state.resumed
+        )
+        return PromptCandidate(
+            prompt=prompt,
+            score=score,
+            feedback=await abuild_feedback(failure_reasons),
+            round=self.state.round,
+        )
+
+    async def _propose(self, parent: PromptCandidate) -> str:
+        crew = PromptOptimizer().crew()
+        with stage(OPTIMIZER_CREW):
+            result = await crew.kickoff_async(
+                inputs={
+                    "prompt": parent.prompt,
+                    "feedback": parent.feedback,
+                    "score": parent.score,
+                }
+            )
+        telemetry.record_crew_usage(crew, result, OPTIMIZER_CREW)
+        return to_prefix_layout(result.raw)
+
+    @start("next_round")
+    async def run_round(self):
+        started = time.perf_counter()
+        calls_before = total_evaluate_calls()
+        if self.state.pending:
+            print(
+                f"Round {self.state.round}: resuming with "
+                f"{len(self.state.pending)} proposed candidates"
+            )
+        elif not self.state.beam:
+            print("Evaluating starting prompt")
+            self.state.pending = [self.state.prompt]
+        else:
+            print(
+                f"Round {self.state.round}: generating "
+                f"{self.state.candidates_per_round} candidates"
+            )
+            parents = [
+                self.state.beam[index % len(self.state.beam)]
+                for index in range(self.state.candidates_per_round)
+            ]
+            proposals = await asyncio.gather(
+                *(self._propose(parent) for parent in parents)
+            )
+            seen = {candidate.prompt for candidate in self.state.history}
+            self.state.pending = [
+                prompt for prompt in dict.fromkeys(proposals) if prompt not in seen
+            ]
+            # The optimizer's proposals are the expensive part of a round.
+            save_step(self.state, "propose", started)
+
+        candidates = await asyncio.gather(
+            *(self._score(prompt) for prompt in self.state.pending)
+        )
+        self.state.pending = []
+        self.state.history.extend(candidates)
+        self.state.evaluate_calls.append(total_evaluate_calls() - calls_before)
+        print(f"evaluate() calls this round: {self.state.evaluate_calls[-1]}")
+        self.state.beam = sorted(
+            [*self.state.beam, *candidates],
+            key=lambda candidate: candidate.score,
+            reverse=True,
+        )[: self.state.beam_width]
+
+        best = self.state.beam[0]
+        self.state.prompt, self.state.score = best.prompt, best.score
+        self.state.feedback = best.feedback
+        for candidate in candidates:
+            print(f"Candidate score: {candidate.score:.2f}")
+        print(f"Best score after round {self.state.round}: {best.score:.2f}")
+
+        self.state.round += 1
+        save_step(self.state, "run_round", started)
+        return "expand"
+
+    @router(run_round)
+    def check_budget(self):
+        if self.state.score > TARGET_SCORE:
+            return "complete"
+
+        if self.state.round > self.state.max_rounds:
+            return "max_retry_exceeded"
+
+        return "next_round"
+
+    @listen("complete")
+    def save_result(self):
+        print("Prompt is valid")
+        write_best_prompt(self.state)
+        finish_run(self.state, "complete")
+
+    @listen("max_retry_exceeded")
+    def max_retry_exceeded_exit(self):
+        print("Round budget exhausted")
+        best = write_best_prompt(self.state)
+        finish_run(self.state, "max_retry_exceeded")
+        if best.feedback:
+            print("\nRemaining failure reasons:")
+            print(best.feedback)
+
+
+FLOWS = {"prompt": PromptOptimizationFlow, "beam": BeamSearchOptimizationFlow}
 
 
 def kickoff():
-    prompt_flow = PromptOptimizationFlow()
-    prompt_flow.kickoff()
+    parser = argparse.ArgumentParser(description="Optimize the RAG prompt")
+    parser.add_argument(
+        "--beam",
+        action="store_true",
+        help="Search with a beam of concurrently scored candidates",
+    )
+    parser.add_argument(
+        "--candidates",
+        type=int,
+        default=4,
+        help="Candidates generated per round (beam mode)",
+    )
+    parser.add_argument(
+        "--beam-width",
+        type=int,
+        default=2,
+        help="Candidates kept between rounds (beam mode)",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=4,
+        help="Optimization rounds (beam mode)",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Stop scoring candidates that cannot enter the beam (beam mode)",
+    )
+    parser.add_argument(
+        "--agent-evaluator",
+        action="store_true",
+        help="Evaluate through the PromptEvaluator crew instead of directly",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="RUN_ID",
+        help="Continue a run from its last completed step (its other options "
+        "are kept)",
+    )
+    args = parser.parse_args()
+
+    if args.resume:
+        run = run_store.load_run(args.resume)
+        if run is None:
+            recent = ", ".join(stored.run_id for stored in run_store.recent_runs())
+            parser.error(f"Unknown run {args.resume} (recent runs: {recent or 'none'})")
+        if run.status != RUNNING:
+            parser.error(f"Run {run.run_id} already finished ({run.status})")
+        print(
+            f"Resuming run {run.run_id} after {run.steps} steps "
+            f"(last: {run.last_step or 'none'})"
+        )
+        telemetry.start_run()
+        inputs = {key: value for key, value in run.state.items() if key != "id"}
+        inputs["resumed"] = True
+        FLOWS[run.flow]().kickoff(inputs=inputs)
+        return
+
+    telemetry.start_run()
+    if args.beam:
+        flow = "beam"
+        inputs = {
+            "candidates_per_round": args.candidates,
+            "beam_width": args.beam_width,
+            "max_rounds": args.rounds,
+            "adaptive": args.adaptive,
+        }
+    else:
+        flow = "prompt"
+        inputs = {"use_evaluator_crew": args.agent_evaluator}
+    # The telemetry run id also names the run in the run store.
+    inputs["run_id"] = telemetry.run_id
+    run_store.start_run(telemetry.run_id, flow, inputs)
+    print(
+        f"Run {telemetry.run_id}, resume with: uv run kickoff --resume {telemetry.run_id}"
+    )
+    FLOWS[flow]().kickoff(inputs=inputs)
 
 
 def plot():
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import threading
+from typing import List
+
+from crewai.knowledge.source.string_knowledge_source import StringKnowledgeSource
+
+# Comma separated URLs or local PDF paths; local paths keep runs fully offline.
+KNOWLEDGE_SOURCES = os.getenv(
+    "PROMPT_OPTIMIZER_KNOWLEDGE_SOURCES", "https://arxiv.org/pdf/2401.14423"
+).split(",")
+KNOWLEDGE_CACHE_DIR = os.getenv(
+    "PROMPT_OPTIMIZER_KNOWLEDGE_CACHE", "db/knowledge_cache"
+)
+
+_lock = threading.Lock()
+_sources = {}
+
+
+def source_key(source: str) -> str:
+    """Hash of a local file's bytes, or of the URL for remote sources."""
+    digest = hashlib.sha256()
+    if os.path.exists(source):
+        with open(source, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    else:
+        digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_markdown(source: str) -> str:
+    """Docling-converted markdown for a source, converted once and kept on disk."""
+    path = os.path.join(KNOWLEDGE_CACHE_DIR, f"{source_key(source)}.md")
+    if os.path.exists(path):
+        with open(path) as file:
+            return file.read()
+
+    from docling.document_converter import DocumentConverter
+
+    markdown = DocumentConverter().convert(source).document.export_to_markdown()
+    os.makedirs(KNOWLEDGE_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(markdown)
+    os.replace(tmp_path, path)
+    return markdown
+
+
+class CachedKnowledgeSource(StringKnowledgeSource):
+    """A pre-parsed document that only embeds chunks the knowledge store lacks."""
+
+    def add(self) -> None:
+        self.chunks = self._chunk_text(self.content)
+        collection = getattr(self.storage, "collection", None)
+        if collection is not None and self.chunks:
+            # KnowledgeStorage ids its documents by the hash of their text.
+            ids = [
+                hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+                for chunk in self.chunks
+            ]
+            stored = set(collection.get(ids=ids, include=[])["ids"])
+            self.chunks = [
+                chunk for chunk, id in zip(self.chunks, ids) if id not in stored
+            ]
+        if self.chunks:
+            self._save_documents()
+
+
+def get_knowledge_sources(sources: List[str] = KNOWLEDGE_SOURCES):
+    with _lock:
+        for source in sources:
+            if source not in _sources:
+                _sources[source] = CachedKnowledgeSource(
+                    content=load_markdown(source),
+                    metadata={"source": source},
+                )
+        return [_sources[source] for source in sources]
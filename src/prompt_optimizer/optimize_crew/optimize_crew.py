@@ -1,8 +1,21 @@
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from crewai.agents.agent_builder.base_agent import BaseAgent
-from crewai.knowledge.source.crew_docling_source import CrewDoclingSource
-from typing import List
+from typing import Any, List, Tuple
+from prompt_optimizer.optimize_crew.knowledge import get_knowledge_sources
+from prompt_optimizer.prompts import missing_variables, to_prefix_layout
+
+
+def keep_prefix_layout(output) -> Tuple[bool, Any]:
+    """Reject prompts that lost a template variable and move the variables of
+    the rest to the end, so the instructions stay a cacheable prefix."""
+    missing = missing_variables(output.raw)
+    if missing:
+        return False, (
+            "The prompt must keep the template variables "
+            + ", ".join(f"{{{name}}}" for name in missing)
+        )
+    return True, to_prefix_layout(output.raw)
 
 
 @CrewBase
@@ -36,23 +49,18 @@ class PromptOptimizer:
     def improve_prompt_task(self) -> Task:
         return Task(
             config=self.tasks_config["improve_prompt_task"],  # type: ignore[index]
+            guardrail=keep_prefix_layout,
         )
 
     @crew
     def crew(self) -> Crew:
         """Creates the PromptOptimizer crew"""
 
-        prompt_optimization_papers = CrewDoclingSource(
-            file_paths=[
-                "https://arxiv.org/pdf/2401.14423",
-            ],
-        )
-
         return Crew(
             agents=self.agents,
             tasks=self.tasks,
             process=Process.sequential,
             verbose=True,
-            knowledge_sources=[prompt_optimization_papers],
+            knowledge_sources=get_knowledge_sources(),
             # process=Process.hierarchical, # In case you wanna use that instead https://docs.crewai.com/how-to/Hierarchical/
         )
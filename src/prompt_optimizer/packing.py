@@ -0,0 +1,191 @@
+"""Fit the retrieved chunks into a token budget before generation.
+
+Chunks arrive in relevance order. A chunk whose word shingles are mostly
+already in the packed context is dropped, lines at the edges of a chunk that
+repeat what an earlier chunk ended or started with (the splitter's overlap)
+are trimmed, and chunks are then added in relevance order while they fit in
+PROMPT_OPTIMIZER_CONTEXT_TOKENS tokens of gpt-4o's tokenizer.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Set
+
+from prompt_optimizer.scheduler import estimate_tokens
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_OPTIMIZER_CONTEXT_TOKENS", "3000"))
+TOKENIZER_MODEL = "gpt-4o"
+SEPARATOR = "\n\n"
+SHINGLE_SIZE = 5
+# Share of a chunk's shingles already packed above which it is a duplicate.
+DUPLICATE_CONTAINMENT = 0.8
+# Share of a line's shingles already packed above which an edge line is trimmed.
+OVERLAP_CONTAINMENT = 0.9
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception as error:
+        # tiktoken downloads its vocabulary on first use, which fails offline.
+        print(f"Tokenizer unavailable ({error!r}), estimating context tokens")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    return estimate_tokens(text) if encoding is None else len(encoding.encode(text))
+
+
+def truncate_tokens(text: str, tokens: int) -> str:
+    encoding = _encoding()
+    if encoding is None:
+        return text[: (tokens - 1) * 4]
+    return encoding.decode(encoding.encode(text)[:tokens])
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """Hashes of every run of `size` words; shorter text is hashed whole."""
+    words = text.lower().split()
+    if len(words) <= size:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+def short_line_shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """The whole-line hashes of lines shorter than `size` words.
+
+    shingles(text) only covers such a line as part of runs that cross into the
+    neighbouring lines, so they are added to the packed set to let a repeated
+    heading or short line be recognized on its own."""
+    hashes: Set[int] = set()
+    for line in text.splitlines():
+        if len(line.split()) < size:
+            hashes |= shingles(line, size)
+    return hashes
+
+
+def containment(part: Set[int], whole: Set[int]) -> float:
+    return len(part & whole) / len(part) if part else 1.0
+
+
+def _trim_overlap(text: str, seen: Set[int]) -> str:
+    """Drop leading and trailing lines that were already packed."""
+    lines = text.splitlines(keepends=True)
+
+    def covered(line: str) -> bool:
+        return containment(shingles(line), seen) >= OVERLAP_CONTAINMENT
+
+    start, end = 0, len(lines)
+    while start < end and covered(lines[start]):
+        start += 1
+    while end > start and covered(lines[end - 1]):
+        end -= 1
+    return "".join(lines[start:end]).strip()
+
+
+@dataclass
+class PackedContext:
+    text: str
+    chunks: int
+    kept: int
+    duplicates: int
+    tokens_in: int
+    tokens_out: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+
+class PackingStats:
+    def __init__(self):
+        self.queries = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def add(self, packed: PackedContext) -> None:
+        with self._lock:
+            self.queries += 1
+            self.tokens_in += packed.tokens_in
+            self.tokens_out += packed.tokens_out
+            self.duplicates += packed.duplicates
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "duplicates": self.duplicates,
+            }
+
+
+packing_stats = PackingStats()
+
+
+def pack_context(
+    documents: List[str], token_budget: Optional[int] = None
+) -> PackedContext:
+    """Join `documents` (most relevant first) into at most `token_budget`
+    tokens; a budget of 0 only removes duplicates."""
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    separator_tokens = count_tokens(SEPARATOR)
+    tokens_in = count_tokens(SEPARATOR.join(documents))
+
+    seen: Set[int] = set()
+    kept: List[str] = []
+    used = 0
+    duplicates = 0
+    for document in documents:
+        document_shingles = shingles(document)
+        if kept and containment(document_shingles, seen) >= DUPLICATE_CONTAINMENT:
+            duplicates += 1
+            continue
+        text = _trim_overlap(document, seen) if kept else document.strip()
+        if not text:
+            duplicates += 1
+            continue
+
+        tokens = count_tokens(text) + (separator_tokens if kept else 0)
+        if budget and used + tokens > budget:
+            if kept:
+                # A later, shorter chunk may still fit.
+                continue
+            # Even the most relevant chunk is too long: keep its beginning.
+            text = truncate_tokens(text, budget)
+            tokens = budget
+        kept.append(text)
+        seen |= document_shingles | short_line_shingles(document)
+        used += tokens
+
+    packed = PackedContext(
+        text=SEPARATOR.join(kept),
+        chunks=len(documents),
+        kept=len(kept),
+        duplicates=duplicates,
+        tokens_in=tokens_in,
+        tokens_out=used,
+    )
+    packing_stats.add(packed)
+    return packed
+
+
+def format_packing_stats(before: Dict[str, int], after: Dict[str, int]) -> str:
+    queries = after["queries"] - before["queries"]
+    if not queries:
+        return "Context packing: no queries"
+    tokens_in = after["tokens_in"] - before["tokens_in"]
+    saved = tokens_in - (after["tokens_out"] - before["tokens_out"])
+    return (
+        f"Context packing: {saved / queries:.0f} tokens saved per query "
+        f"({saved / tokens_in if tokens_in else 0:.0%} of retrieved), "
+        f"{after['duplicates'] - before['duplicates']} duplicate chunks dropped"
+    )
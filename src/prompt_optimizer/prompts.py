@@ -0,0 +1,136 @@
+"""Prompt layout that keeps OpenAI's automatic prefix cache warm.
+
+The provider caches the longest previously seen prefix of a prompt (from
+1024 tokens on), so every prompt is assembled with the text that never
+changes first and the per-question parts last. Answer templates keep their
+instructions ahead of a fixed variable section:
+
+    <instructions>
+
+    Context:
+    {context}
+
+    Question:
+    {question}
+
+and the judge prompts put their instructions before the question and answer,
+with the fact(s) being checked at the very end, so all per-fact calls for one
+answer share everything but the last few tokens.
+"""
+
+import re
+from typing import Dict, List
+
+VARIABLES = ("context", "question")
+
+
+def variable_section(names: List[str]) -> str:
+    return "\n\n".join(f"{name.capitalize()}:\n{{{name}}}" for name in names)
+
+
+VARIABLE_SECTION = variable_section(list(VARIABLES))
+DEFAULT_INSTRUCTIONS = "Answer the following question based on the provided context:"
+DEFAULT_PROMPT = f"{DEFAULT_INSTRUCTIONS}\n{VARIABLE_SECTION}"
+
+# What an inline placeholder is replaced with when it is moved to the end.
+_REFERENCES = {"context": "the context below", "question": "the question below"}
+_PLACEHOLDER = re.compile(r"\{(" + "|".join(VARIABLES) + r")\}")
+# "Context:", "**Question**:", "## Context" and similar headings of a placeholder.
+_LABEL = re.compile(r"^\W*(" + "|".join(VARIABLES) + r")\W*$", re.IGNORECASE)
+# What is left of "Q: {question}" or "User docs: {context}" once the placeholder
+# is gone; longer text before the colon is an instruction and is kept.
+_INLINE_LABEL = re.compile(r"^\W*\w+( \w+)?:\W*$")
+_TRAILING_PLACEHOLDER = re.compile(r"\s*:\s*" + _PLACEHOLDER.pattern + r"\s*$")
+
+
+def missing_variables(template: str) -> List[str]:
+    return [name for name in VARIABLES if f"{{{name}}}" not in template]
+
+
+def present_variables(template: str) -> List[str]:
+    return [name for name in VARIABLES if f"{{{name}}}" in template]
+
+
+def has_prefix_layout(template: str) -> bool:
+    section = variable_section(present_variables(template))
+    return bool(section) and template.rstrip().endswith(section)
+
+
+def _refer_below(line: str) -> str:
+    """The line with its placeholders replaced by a pointer to the end, so
+    "Use the context: {context}" becomes "Use the context below."."""
+    line = _TRAILING_PLACEHOLDER.sub(" below.", line)
+    return _PLACEHOLDER.sub(lambda match: _REFERENCES[match.group(1)], line)
+
+
+def to_prefix_layout(template: str) -> str:
+    """Move the {context} and {question} placeholders the template uses (and
+    their labels) to a fixed section at the end, keeping every other line and
+    the instructions around the placeholders."""
+    names = present_variables(template)
+    if not names:
+        return template
+    section = variable_section(names)
+    if has_prefix_layout(template):
+        body = template.rstrip()[: -len(section)]
+        if not _PLACEHOLDER.search(body):
+            return template.rstrip()
+
+    kept: List[str] = []
+    for line in template.splitlines():
+        if not _PLACEHOLDER.search(line):
+            kept.append(line)
+            continue
+        if kept and _LABEL.match(kept[-1]):
+            kept.pop()
+        rest = _PLACEHOLDER.sub("", line)
+        if not rest.strip() or _LABEL.match(rest) or _INLINE_LABEL.match(rest):
+            continue
+        kept.append(_refer_below(line))
+
+    instructions = re.sub(r"\n{3,}", "\n\n", "\n".join(kept)).strip()
+    return f"{instructions}\n\n{section}" if instructions else section
+
+
+def render_answer_prompt(template: str, context: str, question: str) -> str:
+    """Fill in `template` unchanged. Templates are put in the prefix layout where
+    they enter the flow (the optimizer's output and the served prompt file), so
+    the prompt that is scored and saved is the one that is sent."""
+    return template.format(context=context, question=question)
+
+
+FACT_JUDGE_SYSTEM = "Evaluate if the specific fact is present in the answer."
+FACT_JUDGE_INSTRUCTIONS = """You are an evaluator checking if a specific fact is present in an answer.
+
+Determine if the fact given at the end is present in the answer. Consider both explicit mentions and implicit coverage.
+Provide a clear reason for your decision."""
+
+FACTS_JUDGE_SYSTEM = "Evaluate if each of the specific facts is present in the answer."
+FACTS_JUDGE_INSTRUCTIONS = """You are an evaluator checking if specific facts are present in an answer.
+
+For each fact listed at the end, determine if it is present in the answer. Consider both explicit mentions and implicit coverage.
+Return exactly one evaluation per fact, in the same order, copying the fact text verbatim.
+Provide a clear reason for each decision."""
+
+
+def fact_judge_messages(question: str, response: str, fact: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": FACT_JUDGE_SYSTEM},
+        {
+            "role": "user",
+            "content": f"{FACT_JUDGE_INSTRUCTIONS}\n\nQuestion: {question}\n\n"
+            f"Answer to evaluate:\n{response}\n\nFact to check: {fact}",
+        },
+    ]
+
+
+def facts_judge_messages(question: str, response: str, facts: List[str]) -> List[Dict]:
+    facts_list = "\n".join(f"- {fact}" for fact in facts)
+    return [
+        {"role": "system", "content": FACTS_JUDGE_SYSTEM},
+        {
+            "role": "user",
+            "content": f"{FACTS_JUDGE_INSTRUCTIONS}\n\nQuestion: {question}\n\n"
+            f"Answer to evaluate:\n{response}\n\nFacts to check:\n{facts_list}",
+        },
+    ]
@@ -1,111 +1,280 @@
+import argparse
+import asyncio
+import hashlib
+import json
 import os
-from openai import OpenAI
-import chromadb
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
-from llama_index.core import VectorStoreIndex
-from llama_index.core import Settings
-from llama_index.core.prompts import RichPromptTemplate
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.core import StorageContext
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.readers.github import GithubRepositoryReader, GithubClient
+from typing import AsyncIterator, Dict, List, Optional
 
-from dotenv import load_dotenv
-
-from traceloop.sdk import Traceloop
-
-# from traceloop.sdk.decorators import task, workflow
+from prompt_optimizer import llm
+from prompt_optimizer.async_utils import run_sync
+from prompt_optimizer.cache import cache_key, response_cache
+from prompt_optimizer.indexing import manifest_version, sync_docs
+from prompt_optimizer.ingest import EMBED_BATCH_SIZE, EMBED_CONCURRENCY
+from prompt_optimizer.lexical import build_bm25_index, load_bm25_index
+from prompt_optimizer.packing import pack_context
+from prompt_optimizer.prompts import DEFAULT_PROMPT, render_answer_prompt
+from prompt_optimizer.resources import EMBEDDING_MODEL, get_docs_collection
+from prompt_optimizer.scheduler import PRIORITY_GENERATION
+from prompt_optimizer.telemetry import (
+    CONTEXT_PACKING,
+    GENERATION,
+    QUERY_REWRITE,
+    RETRIEVAL,
+    stage,
+    telemetry,
+)
+from prompt_optimizer.vector_index import VectorIndex, aembed_texts, asearch
 
-from pydantic import BaseModel
+# "rewrite" asks gpt-4o for a short query and searches Chroma with it; "hybrid"
+# searches Chroma and the BM25 index with the raw question and fuses the rankings.
+RETRIEVAL_MODES = ("rewrite", "hybrid")
+RETRIEVAL_MODE = os.getenv("PROMPT_OPTIMIZER_RETRIEVAL", "rewrite")
+HYBRID_CANDIDATES = 20
+RRF_K = 60
 
-load_dotenv()
 
-QA_PROMPT_KEY = "response_synthesizer:text_qa_template"
+async def arephrase_as_query(question: str):
+    with stage(QUERY_REWRITE):
+        return await llm.chat(
+            "gpt-4o",
+            [
+                {
+                    "role": "user",
+                    "content": f"Rewrite the following question as a concise 2 word query for a vector database: {question}",
+                }
+            ],
+            priority=PRIORITY_GENERATION,
+        )
 
 
-# Traceloop.init()
+def rephrase_as_query(question: str):
+    return run_sync(arephrase_as_query(question))
 
-Settings.embed_model = OpenAIEmbedding(model="text-embedding-3-small")
 
-github_client = GithubClient(github_token=os.environ["GITHUB_TOKEN"])
+async def aretrieve_documents(query: str, n_results: int = 5):
+    with stage(RETRIEVAL):
+        return await _aretrieve_documents(query, n_results)
 
-client = OpenAI()
-embedding_function = OpenAIEmbeddingFunction(
-    api_key=os.getenv("OPENAI_API_KEY"), model_name="text-embedding-3-small"
-)
-chroma_client = chromadb.PersistentClient(path="db/chroma_data")
-traceloop_docs = chroma_client.get_or_create_collection(
-    "traceloop-docs", embedding_function=embedding_function
-)
-vector_store = ChromaVectorStore(chroma_collection=traceloop_docs)
 
+async def _aretrieve_documents(query: str, n_results: int):
+    traceloop_docs = get_docs_collection()
+    # The collection size and manifest version are part of the key so
+    # re-indexing invalidates old results.
+    key = cache_key(
+        EMBEDDING_MODEL,
+        query,
+        {
+            "collection": traceloop_docs.name,
+            "count": traceloop_docs.count(),
+            "manifest": manifest_version(),
+            "n": n_results,
+        },
+    )
+    cached = response_cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
 
-index = VectorStoreIndex.from_vector_store(
-    vector_store=ChromaVectorStore(chroma_collection=traceloop_docs),
-    storage_context=StorageContext.from_defaults(vector_store=vector_store),
-)
+    results = await _aquery_collection(traceloop_docs, query, n_results)
+    documents = results["documents"][0]
+    response_cache.set(key, json.dumps(documents))
+    return documents
 
 
-# @task()
-def rephrase_as_query(question: str):
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": f"Rewrite the following question as a concise 2 word query for a vector database: {question}",
-            }
-        ],
+async def _aquery_collection(collection, text: str, n_results: int, **kwargs):
+    """Search Chroma with `text` embedded through the scheduler rather than by
+    the collection's embedding function, which would bypass the rate limits."""
+    embedding = (await aembed_texts([text]))[0].tolist()
+    # Chroma has no async API; keep the event loop free while it searches.
+    return await asyncio.to_thread(
+        collection.query, query_embeddings=[embedding], n_results=n_results, **kwargs
     )
-    return response.choices[0].message.content
 
 
-# @workflow()
-def query_rag(prompt_template: str, question: str):
-    results = traceloop_docs.query(
-        query_texts=[rephrase_as_query(question)], n_results=5
-    )
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[str]:
+    """Merge ranked id lists; an id scores 1 / (k + rank) in every list it is in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (k + rank + 1)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
 
-    concatenated_docs = "\n\n".join(results["documents"][0])
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+async def ahybrid_retrieve_documents(question: str, n_results: int = 5):
+    """Vector and BM25 search with the raw question, so no rewrite call is made.
+    Falls back to vector search alone until load_data has built the BM25 index."""
+    with stage(RETRIEVAL):
+        traceloop_docs = get_docs_collection()
+        # Keyed like the rewrite path, so re-indexing invalidates old results.
+        key = cache_key(
+            EMBEDDING_MODEL,
+            question,
             {
-                "role": "user",
-                "content": prompt_template.format(
-                    context=concatenated_docs, question=question
-                ),
+                "retrieval": "hybrid",
+                "collection": traceloop_docs.name,
+                "count": traceloop_docs.count(),
+                "manifest": manifest_version(),
+                "n": n_results,
+                "candidates": HYBRID_CANDIDATES,
+                "rrf_k": RRF_K,
             },
-        ],
-    )
-    return response.choices[0].message.content
+        )
+        cached = response_cache.get(key)
+        if cached is not None:
+            return json.loads(cached)
+
+        bm25, vector = await asyncio.gather(
+            asyncio.to_thread(load_bm25_index),
+            _aquery_collection(
+                traceloop_docs, question, HYBRID_CANDIDATES, include=["documents"]
+            ),
+        )
+        documents = dict(zip(vector["ids"][0], vector["documents"][0]))
+        rankings = [vector["ids"][0]]
+        if bm25 is not None:
+            rankings.append(
+                [bm25.ids[row] for row, _ in bm25.search(question, HYBRID_CANDIDATES)]
+            )
+
+        fused = reciprocal_rank_fusion(rankings)[:n_results]
+        missing = [doc_id for doc_id in fused if doc_id not in documents]
+        if missing:
+            lexical_only = await asyncio.to_thread(
+                traceloop_docs.get, ids=missing, include=["documents"]
+            )
+            documents.update(zip(lexical_only["ids"], lexical_only["documents"]))
+        results = [documents[doc_id] for doc_id in fused if doc_id in documents]
+        # Vector-only fallbacks are not cached, or they would outlive the
+        # BM25 index that load_data builds later.
+        if bm25 is not None:
+            response_cache.set(key, json.dumps(results))
+        return results
+
+
+def collection_fingerprint() -> str:
+    """Identify the current contents of the docs collection."""
+    traceloop_docs = get_docs_collection()
+    ids = traceloop_docs.get(include=[])["ids"]
+    digest = hashlib.sha256(traceloop_docs.name.encode("utf-8"))
+    for doc_id in sorted(ids):
+        digest.update(doc_id.encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def aretrieve_question_documents(
+    question: str, retrieval: Optional[str] = None
+) -> List[str]:
+    if (retrieval or RETRIEVAL_MODE) == "hybrid":
+        return await ahybrid_retrieve_documents(question)
+    query = await arephrase_as_query(question)
+    return await aretrieve_documents(query)
+
+
+def pack_documents(documents: List[str]) -> str:
+    with stage(CONTEXT_PACKING):
+        return pack_context(documents).text
+
+
+async def aretrieve_context(question: str, retrieval: Optional[str] = None) -> str:
+    """Everything in query_rag that does not depend on the prompt template."""
+    return pack_documents(await aretrieve_question_documents(question, retrieval))
+
+
+async def aretrieve_contexts(questions: List[str], index: VectorIndex) -> List[str]:
+    """aretrieve_context for many questions, searched together in the exported index."""
+    queries = await asyncio.gather(*(arephrase_as_query(q) for q in questions))
+    with stage(RETRIEVAL):
+        results = await asearch(index, list(queries))
+    return [pack_documents(documents) for documents in results]
+
+
+async def aquery_rag(
+    prompt_template: str, question: str, context: Optional[str] = None
+):
+    if context is None:
+        context = await aretrieve_context(question)
+
+    with stage(GENERATION):
+        return await llm.chat(
+            "gpt-4o",
+            [
+                {
+                    "role": "user",
+                    "content": render_answer_prompt(prompt_template, context, question),
+                },
+            ],
+            priority=PRIORITY_GENERATION,
+        )
+
+
+async def astream_query_rag(
+    prompt_template: str, question: str, context: Optional[str] = None
+) -> AsyncIterator[str]:
+    if context is None:
+        context = await aretrieve_context(question)
+
+    with stage(GENERATION):
+        async for token in llm.chat_stream(
+            "gpt-4o",
+            [
+                {
+                    "role": "user",
+                    "content": render_answer_prompt(prompt_template, context, question),
+                },
+            ],
+            priority=PRIORITY_GENERATION,
+        ):
+            yield token
+
+
+def query_rag(prompt_template: str, question: str, context: Optional[str] = None):
+    return run_sync(aquery_rag(prompt_template, question, context))
 
 
 def load_data():
-    reader = GithubRepositoryReader(
-        github_client=github_client,
-        owner="traceloop",
-        repo="docs",
-        filter_file_extensions=(
-            [".mdx"],
-            GithubRepositoryReader.FilterType.INCLUDE,
-        ),
+    parser = argparse.ArgumentParser(
+        description="Index the traceloop/docs .mdx files into Chroma"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Drop every indexed chunk and re-embed all files",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only print which files would be added, changed or removed",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EMBED_BATCH_SIZE,
+        help="Chunks per embedding request",
     )
-    docs = reader.load_data(branch="main")
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
-    index = VectorStoreIndex.from_documents(docs, storage_context=storage_context)
-    index.storage_context.persist()
+    parser.add_argument(
+        "--embed-concurrency",
+        type=int,
+        default=EMBED_CONCURRENCY,
+        help="Embedding requests in flight at once",
+    )
+    args = parser.parse_args()
+
+    run_sync(
+        sync_docs(
+            full=args.full,
+            dry_run=args.dry_run,
+            embed_batch_size=args.batch_size,
+            embed_concurrency=args.embed_concurrency,
+        )
+    )
+    if not args.dry_run:
+        index = build_bm25_index()
+        print(f"BM25 index: {len(index.ids)} chunks, {len(index.postings)} terms")
 
 
 def run():
-    prompt_template = """Answer the following question based on the provided context:
-Context:
-{context}
-
-Question:
-{question}"""
+    prompt_template = DEFAULT_PROMPT
 
+    telemetry.start_run()
     question = input("Enter your question: ")
     result = query_rag(prompt_template, question)
     print("\nAnswer:")
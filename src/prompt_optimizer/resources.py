@@ -0,0 +1,53 @@
+"""Process-wide clients, imported and built on first use so entry points only
+pay for (and need credentials for) the resources they actually touch."""
+
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHROMA_PATH = os.getenv("PROMPT_OPTIMIZER_CHROMA_PATH", "db/chroma_data")
+DOCS_COLLECTION = "traceloop-docs"
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    from openai import OpenAI
+
+    return OpenAI()
+
+
+@lru_cache(maxsize=None)
+def get_github_client():
+    from llama_index.readers.github import GithubClient
+
+    return GithubClient(github_token=os.environ["GITHUB_TOKEN"])
+
+
+@lru_cache(maxsize=None)
+def get_chroma_client():
+    import chromadb
+
+    return chromadb.PersistentClient(path=CHROMA_PATH)
+
+
+@lru_cache(maxsize=None)
+def get_embedding_function():
+    from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
+    return OpenAIEmbeddingFunction(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        api_base=os.getenv("OPENAI_BASE_URL"),
+        model_name=EMBEDDING_MODEL,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_docs_collection():
+    return get_chroma_client().get_or_create_collection(
+        DOCS_COLLECTION, embedding_function=get_embedding_function()
+    )
+
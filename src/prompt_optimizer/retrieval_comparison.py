@@ -0,0 +1,206 @@
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from typing import Dict, List
+
+from rich.console import Console
+from rich.table import Table
+
+from prompt_optimizer.async_utils import run_sync
+from prompt_optimizer.cache import response_cache
+from prompt_optimizer.packing import CONTEXT_TOKEN_BUDGET, count_tokens, pack_context
+from prompt_optimizer.prompts import DEFAULT_PROMPT
+from prompt_optimizer.rag import (
+    RETRIEVAL_MODES,
+    aretrieve_context,
+    aretrieve_question_documents,
+)
+from prompt_optimizer.runner import (
+    MAX_CONCURRENT_QUESTIONS,
+    ScoreAccumulator,
+    aprocess_and_evaluate_single_question,
+    get_items_to_evaluate,
+)
+from prompt_optimizer.serve import PROMPT_PATH, parse_prompt_file
+from prompt_optimizer.telemetry import telemetry
+
+console = Console()
+
+
+async def _retrieve_all(items: List[Dict], retrieval: str):
+    """Contexts and per-question retrieval latency, one question at a time so
+    the latencies are not skewed by each other's requests. The response cache
+    is bypassed, otherwise repeated runs would time cache lookups."""
+    contexts, latencies = [], []
+    enabled = response_cache.enabled
+    response_cache.enabled = False
+    try:
+        for item in items:
+            started = time.perf_counter()
+            contexts.append(await aretrieve_context(item["question"], retrieval))
+            latencies.append(time.perf_counter() - started)
+    finally:
+        response_cache.enabled = enabled
+    return contexts, latencies
+
+
+async def _score(prompt_template: str, items: List[Dict], contexts: List[str]):
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUESTIONS)
+    totals = ScoreAccumulator()
+
+    async def evaluate(index: int):
+        async with semaphore:
+            totals.add(
+                index,
+                await aprocess_and_evaluate_single_question(
+                    prompt_template, items[index], contexts[index]
+                ),
+            )
+
+    await asyncio.gather(*(evaluate(index) for index in range(len(items))))
+    return totals
+
+
+async def compare(prompt_template: str, modes=RETRIEVAL_MODES) -> Dict[str, Dict]:
+    items = get_items_to_evaluate()
+    report = {}
+    for retrieval in modes:
+        contexts, latencies = await _retrieve_all(items, retrieval)
+        totals = await _score(prompt_template, items, contexts)
+        report[retrieval] = {
+            "questions": len(items),
+            "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+            "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+            "max_ms": max(latencies, default=0.0) * 1000,
+            "score": totals.score,
+            "passed_facts": totals.passed_facts,
+            "total_facts": totals.total_facts,
+        }
+    return report
+
+
+async def compare_packing(
+    prompt_template: str, token_budget: int = CONTEXT_TOKEN_BUDGET
+) -> Dict[str, Dict]:
+    """Score the same retrieved chunks joined as-is and packed into the budget."""
+    items = get_items_to_evaluate()
+    documents = await asyncio.gather(
+        *(aretrieve_question_documents(item["question"]) for item in items)
+    )
+    variants = {
+        "joined": ["\n\n".join(chunks) for chunks in documents],
+        "packed": [pack_context(chunks, token_budget).text for chunks in documents],
+    }
+    report = {}
+    for name, contexts in variants.items():
+        totals = await _score(prompt_template, items, contexts)
+        tokens = [count_tokens(context) for context in contexts]
+        report[name] = {
+            "questions": len(items),
+            "mean_tokens": statistics.fmean(tokens) if tokens else 0.0,
+            "max_tokens": max(tokens, default=0),
+            "score": totals.score,
+            "passed_facts": totals.passed_facts,
+            "total_facts": totals.total_facts,
+        }
+    return report
+
+
+def _print_packing(report: Dict[str, Dict], token_budget: int):
+    table = Table(
+        title=f"Context packing ({token_budget} token budget) over "
+        f"{report['joined']['questions']} questions"
+    )
+    table.add_column("Metric")
+    table.add_column("joined", justify="right")
+    table.add_column("packed", justify="right")
+    table.add_row(
+        "context tokens (mean)",
+        *(f"{entry['mean_tokens']:.0f}" for entry in report.values()),
+    )
+    table.add_row(
+        "context tokens (max)", *(str(entry["max_tokens"]) for entry in report.values())
+    )
+    table.add_row(
+        "facts passed",
+        *(
+            f"{entry['passed_facts']}/{entry['total_facts']}"
+            for entry in report.values()
+        ),
+    )
+    table.add_row("score", *(f"{entry['score']:.3f}" for entry in report.values()))
+    console.print(table)
+
+    joined, packed = report["joined"], report["packed"]
+    console.print(
+        f"Packing saves {joined['mean_tokens'] - packed['mean_tokens']:.0f} context "
+        f"tokens per query and changes the score by "
+        f"{packed['score'] - joined['score']:+.3f}"
+    )
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Compare retrieval modes, or context packing, on cost and score"
+    )
+    parser.add_argument(
+        "--prompt",
+        default=PROMPT_PATH,
+        help="Prompt file to evaluate (the default template if it does not exist)",
+    )
+    parser.add_argument(
+        "--packing",
+        action="store_true",
+        help="Compare packed and plainly joined contexts instead of retrieval modes",
+    )
+    parser.add_argument("--token-budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    prompt_template = DEFAULT_PROMPT
+    if os.path.exists(args.prompt):
+        with open(args.prompt) as file:
+            prompt_template = parse_prompt_file(file.read())
+
+    telemetry.start_run()
+    if args.packing:
+        _print_packing(
+            run_sync(compare_packing(prompt_template, args.token_budget)),
+            args.token_budget,
+        )
+        return
+
+    report = run_sync(compare(prompt_template))
+
+    table = Table(
+        title=f"Retrieval modes over {report['rewrite']['questions']} questions"
+    )
+    table.add_column("Metric")
+    for retrieval in report:
+        table.add_column(retrieval, justify="right")
+    for metric, label in (
+        ("mean_ms", "retrieval mean ms"),
+        ("p50_ms", "retrieval p50 ms"),
+        ("max_ms", "retrieval max ms"),
+    ):
+        table.add_row(label, *(f"{entry[metric]:.0f}" for entry in report.values()))
+    table.add_row(
+        "facts passed",
+        *(
+            f"{entry['passed_facts']}/{entry['total_facts']}"
+            for entry in report.values()
+        ),
+    )
+    table.add_row("score", *(f"{entry['score']:.3f}" for entry in report.values()))
+    console.print(table)
+
+    rewrite, hybrid = report["rewrite"], report["hybrid"]
+    saved = rewrite["mean_ms"] - hybrid["mean_ms"]
+    console.print(
+        f"Hybrid saves {saved:.0f} ms per question "
+        f"({saved / rewrite['mean_ms']:.0%} of retrieval) and changes the score by "
+        f"{hybrid['score'] - rewrite['score']:+.3f}"
+        if rewrite["mean_ms"]
+        else "No questions to compare"
+    )
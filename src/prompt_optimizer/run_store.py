@@ -0,0 +1,239 @@
+"""SQLite history of `kickoff` runs, written after every flow step.
+
+Each run keeps the flow state as of its last completed step (so
+`kickoff --resume <run-id>` can continue it), a row per step with its
+duration, and every prompt it scored with the score, feedback, evaluation
+time and per-item results.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from prompt_optimizer.checkpoint import prompt_hash
+from prompt_optimizer.sqlite_utils import ThreadLocalConnection
+
+RUN_STORE_PATH = os.getenv("PROMPT_OPTIMIZER_RUN_STORE", "db/runs.sqlite3")
+
+RUNNING = "running"
+
+
+@dataclass
+class StoredRun:
+    run_id: str
+    flow: str
+    status: str
+    state: Dict
+    last_step: Optional[str]
+    steps: int
+    updated_at: float
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT PRIMARY KEY,
+        flow TEXT NOT NULL,
+        status TEXT NOT NULL,
+        state TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS steps (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        seconds REAL NOT NULL,
+        state TEXT NOT NULL,
+        finished_at REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS prompts (
+        run_id TEXT NOT NULL,
+        prompt_hash TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        round INTEGER NOT NULL,
+        score REAL NOT NULL,
+        feedback TEXT,
+        items_evaluated INTEGER,
+        seconds REAL NOT NULL,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (run_id, prompt_hash)
+    )""",
+    """CREATE TABLE IF NOT EXISTS item_results (
+        run_id TEXT NOT NULL,
+        prompt_hash TEXT NOT NULL,
+        item_id TEXT NOT NULL,
+        result TEXT NOT NULL,
+        PRIMARY KEY (run_id, prompt_hash, item_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS steps_run ON steps (run_id, id)",
+)
+
+
+class RunStore:
+    def __init__(self, path: str = RUN_STORE_PATH):
+        self.path = path
+        self._connections = ThreadLocalConnection(path, SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def start_run(self, run_id: str, flow: str, state: Dict) -> None:
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR IGNORE INTO runs (run_id, flow, status, state, created_at, "
+            "updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, flow, RUNNING, json.dumps(state), now, now),
+        )
+
+    def save_step(self, run_id: str, name: str, state: Dict, seconds: float) -> None:
+        """Record a completed step and make `state` the one a resume starts from."""
+        connection = self._connection()
+        now = time.time()
+        serialized = json.dumps(state)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT INTO steps (run_id, name, seconds, state, finished_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (run_id, name, seconds, serialized, now),
+            )
+            connection.execute(
+                "UPDATE runs SET state = ?, updated_at = ? WHERE run_id = ?",
+                (serialized, now, run_id),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def finish_run(self, run_id: str, status: str) -> None:
+        self._connection().execute(
+            "UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?",
+            (status, time.time(), run_id),
+        )
+
+    def record_prompt(
+        self,
+        run_id: str,
+        candidate: Dict,
+        seconds: float,
+        results: Dict[str, Dict],
+    ) -> None:
+        """Store a scored prompt (a PromptCandidate dump) and its item results.
+        A prompt already recorded in the run, e.g. one whose earlier score was
+        reused, keeps its first row and round."""
+        connection = self._connection()
+        key = prompt_hash(candidate["prompt"])
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = connection.execute(
+                "INSERT INTO prompts (run_id, prompt_hash, prompt, round, score, "
+                "feedback, items_evaluated, seconds, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (run_id, prompt_hash) DO NOTHING",
+                (
+                    run_id,
+                    key,
+                    candidate["prompt"],
+                    candidate["round"],
+                    candidate["score"],
+                    candidate.get("feedback"),
+                    candidate.get("items_evaluated"),
+                    seconds,
+                    time.time(),
+                ),
+            ).rowcount
+            if inserted:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO item_results (run_id, prompt_hash, "
+                    "item_id, result) VALUES (?, ?, ?, ?)",
+                    [
+                        (run_id, key, item_id, json.dumps(result))
+                        for item_id, result in results.items()
+                    ],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def prompt(self, run_id: str, prompt: str) -> Optional[Dict]:
+        """The candidate recorded for `prompt` in this run, if it was scored."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT prompt, round, score, feedback, items_evaluated FROM prompts "
+                "WHERE run_id = ? AND prompt_hash = ?",
+                (run_id, prompt_hash(prompt)),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        return {
+            "prompt": row[0],
+            "round": row[1],
+            "score": row[2],
+            "feedback": row[3],
+            "items_evaluated": row[4],
+        }
+
+    def item_results(self, run_id: str, prompt: str) -> Dict[str, Dict]:
+        return {
+            row[0]: json.loads(row[1])
+            for row in self._connection().execute(
+                "SELECT item_id, result FROM item_results "
+                "WHERE run_id = ? AND prompt_hash = ?",
+                (run_id, prompt_hash(prompt)),
+            )
+        }
+
+    def _stored_run(self, row) -> StoredRun:
+        last_step, steps = (
+            self._connection()
+            .execute(
+                "SELECT (SELECT name FROM steps WHERE run_id = ? ORDER BY id DESC "
+                "LIMIT 1), COUNT(*) FROM steps WHERE run_id = ?",
+                (row[0], row[0]),
+            )
+            .fetchone()
+        )
+        return StoredRun(
+            run_id=row[0],
+            flow=row[1],
+            status=row[2],
+            state=json.loads(row[3]),
+            last_step=last_step,
+            steps=steps,
+            updated_at=row[4],
+        )
+
+    def load_run(self, run_id: str) -> Optional[StoredRun]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT run_id, flow, status, state, updated_at FROM runs "
+                "WHERE run_id = ?",
+                (run_id,),
+            )
+            .fetchone()
+        )
+        return None if row is None else self._stored_run(row)
+
+    def recent_runs(self, limit: int = 10) -> List[StoredRun]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT run_id, flow, status, state, updated_at FROM runs "
+                "ORDER BY updated_at DESC LIMIT ?",
+                (limit,),
+            )
+            .fetchall()
+        )
+        return [self._stored_run(row) for row in rows]
+
+
+run_store = RunStore()
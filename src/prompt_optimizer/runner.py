@@ -1,15 +1,106 @@
-from typing import List, Dict, Optional
-from prompt_optimizer.rag import query_rag
-from openai import OpenAI
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import asdict
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Dict,
+    Optional,
+    Tuple,
+)
+from prompt_optimizer import llm
+from prompt_optimizer.async_utils import run_sync
+from prompt_optimizer.cache import format_cache_stats, response_cache
+from prompt_optimizer.checkpoint import Checkpoint, item_id, prompt_hash
+from prompt_optimizer.datasets import (
+    merge_shard_results,
+    parse_shard,
+    select_items,
+    write_shard_result,
+)
+from prompt_optimizer.feedback import abuild_feedback
+from prompt_optimizer.indexing import collection_version
+from prompt_optimizer.judge_cascade import (
+    ajudge_fact,
+    cascade_stats,
+    current_thresholds,
+    format_cascade_stats,
+    reload_thresholds,
+)
+from prompt_optimizer.packing import (
+    CONTEXT_TOKEN_BUDGET,
+    format_packing_stats,
+    packing_stats,
+)
+from prompt_optimizer.prompts import (
+    DEFAULT_PROMPT,
+    fact_judge_messages,
+    facts_judge_messages,
+)
+from prompt_optimizer.rag import RETRIEVAL_MODE, aquery_rag
+from prompt_optimizer.resources import get_docs_collection
+from prompt_optimizer.scheduler import PRIORITY_JUDGE, format_scheduler_stats, scheduler
+from prompt_optimizer.snapshot import aget_snapshot
+from prompt_optimizer.telemetry import FACT_JUDGING, stage, telemetry
+from prompt_optimizer.workqueue import (
+    ENQUEUE_BATCH_SIZE,
+    POLL_SECONDS as QUEUE_POLL_SECONDS,
+    STALL_SECONDS as QUEUE_STALL_SECONDS,
+    WorkQueue,
+    new_run_id,
+    spawn_workers,
+)
 from pydantic import BaseModel
 from tqdm import tqdm
 from rich import print as rprint
 from rich.console import Console
 
-client = OpenAI()
 console = Console()
 
 MAX_EVALUATION_EXAMPLES: Optional[int] = None  #
+MAX_CONCURRENT_QUESTIONS = 8
+# "per_fact" judges every required fact with its own call, "batched" judges all
+# facts of a response in a single structured call, "cascade" tries a local check
+# and gpt-4o-mini before the full judge (see judge_cascade).
+JUDGE_MODE = os.getenv("PROMPT_OPTIMIZER_JUDGE_MODE", "per_fact")
+JUDGE_MODEL = "gpt-4o"
+# Adaptive evaluation: start with ADAPTIVE_MIN_ITEMS questions and stop once a
+# prompt is outside the ADAPTIVE_CONFIDENCE bound of the score to beat.
+ADAPTIVE_CONFIDENCE = 0.95
+ADAPTIVE_MIN_ITEMS = 4
+ADAPTIVE_SEED = 0
+
+# Number of full and adaptive evaluation runs started in this process, so
+# callers can see how often the same work is requested.
+EVALUATE_CALLS: Counter = Counter()
+# Score prompts against a frozen retrieval snapshot instead of re-running the
+# query rewrite and Chroma search for every candidate prompt.
+USE_CONTEXT_SNAPSHOT = os.getenv("PROMPT_OPTIMIZER_CONTEXT_SNAPSHOT", "") in (
+    "1",
+    "true",
+    "yes",
+)
+# A JSONL/CSV/Parquet file evaluated instead of evaluation_items, optionally
+# reduced to a stratified sample and then to one shard of it.
+EVALUATION_DATASET: Optional[str] = os.getenv("PROMPT_OPTIMIZER_DATASET") or None
+DATASET_SAMPLE_SIZE: Optional[int] = (
+    int(os.getenv("PROMPT_OPTIMIZER_DATASET_SAMPLE", 0)) or None
+)
+DATASET_SHARD: Optional[Tuple[int, int]] = None
+DATASET_SEED = 0
+# Hand items to `uv run worker` processes through this SQLite work queue
+# instead of scoring them in this process.
+WORK_QUEUE: Optional[str] = os.getenv("PROMPT_OPTIMIZER_WORK_QUEUE") or None
 
 evaluation_items = [
     {
@@ -205,57 +296,158 @@ class ResponseEvaluation(BaseModel):
     fact_evaluations: List[FactEvaluation]
 
 
+def _normalize_fact(fact: str) -> str:
+    return " ".join(fact.lower().strip(" -*.").split())
+
+
+def match_batched_evaluations(
+    required_facts: List[str], fact_evaluations: List[FactEvaluation]
+) -> List[Optional[FactEvaluation]]:
+    """Line up a batched judgment with the required facts.
+
+    Facts the model left out or judged more than once are returned as None so
+    the caller can fall back to judging them individually.
+    """
+    by_fact: Dict[str, List[FactEvaluation]] = {}
+    for evaluation in fact_evaluations:
+        by_fact.setdefault(_normalize_fact(evaluation.fact), []).append(evaluation)
+
+    matched = []
+    for fact in required_facts:
+        candidates = by_fact.get(_normalize_fact(fact), [])
+        if len(candidates) == 1:
+            matched.append(candidates[0].model_copy(update={"fact": fact}))
+        else:
+            matched.append(None)
+    return matched
+
+
+async def aevaluate_single_fact(
+    question: str, response: str, fact: str
+) -> FactEvaluation:
+    return await llm.parse(
+        JUDGE_MODEL,
+        fact_judge_messages(question, response, fact),
+        FactEvaluation,
+        priority=PRIORITY_JUDGE,
+    )
+
+
 def evaluate_single_fact(question: str, response: str, fact: str) -> FactEvaluation:
-    prompt = f"""You are an evaluator checking if a specific fact is present in an answer.
-    
-Question: {question}
-
-Fact to check: {fact}
-
-Answer to evaluate:
-{response}
-
-Determine if this specific fact is present in the answer. Consider both explicit mentions and implicit coverage.
-Provide a clear reason for your decision.
-"""
-
-    result = client.responses.parse(
-        model="gpt-4o",
-        input=[
-            {
-                "role": "system",
-                "content": "Evaluate if the specific fact is present in the answer.",
-            },
-            {"role": "user", "content": prompt},
-        ],
-        text_format=FactEvaluation,
+    return run_sync(aevaluate_single_fact(question, response, fact))
+
+
+async def aevaluate_fact_cascade(
+    question: str, response: str, fact: str
+) -> FactEvaluation:
+    passed, reason, _ = await ajudge_fact(
+        question, response, fact, aevaluate_single_fact
     )
+    return FactEvaluation(fact=fact, passed=passed, reason=reason)
 
-    return result.output_parsed
 
+async def aevaluate_single_response(
+    question: str,
+    response: str,
+    required_facts: List[str],
+    judge_mode: Optional[str] = None,
+) -> ResponseEvaluation:
+    with stage(FACT_JUDGING):
+        return await _aevaluate_single_response(
+            question, response, required_facts, judge_mode or JUDGE_MODE
+        )
 
-def evaluate_single_response(
-    question: str, response: str, required_facts: List[str]
+
+async def _aevaluate_single_response(
+    question: str, response: str, required_facts: List[str], judge_mode: str
 ) -> ResponseEvaluation:
-    fact_evaluations = []
-    passed_count = 0
 
-    for fact in required_facts:
-        evaluation = evaluate_single_fact(question, response, fact)
-        fact_evaluations.append(evaluation)
-        if evaluation.passed:
-            passed_count += 1
+    if judge_mode == "per_fact":
+        fact_evaluations = await asyncio.gather(
+            *(
+                aevaluate_single_fact(question, response, fact)
+                for fact in required_facts
+            )
+        )
+        return ResponseEvaluation(fact_evaluations=list(fact_evaluations))
+
+    if judge_mode == "cascade":
+        fact_evaluations = await asyncio.gather(
+            *(
+                aevaluate_fact_cascade(question, response, fact)
+                for fact in required_facts
+            )
+        )
+        return ResponseEvaluation(fact_evaluations=list(fact_evaluations))
 
-    return ResponseEvaluation(fact_evaluations=fact_evaluations)
+    if judge_mode != "batched":
+        raise ValueError(f"Unknown judge mode: {judge_mode}")
 
+    return ResponseEvaluation(
+        fact_evaluations=await ajudge_batched(question, response, required_facts)
+    )
 
-def process_and_evaluate_single_question(
-    prompt_template: str, item: Dict
+
+async def aevaluate_facts_batched(
+    question: str, response: str, facts: List[str]
+) -> ResponseEvaluation:
+    return await llm.parse(
+        JUDGE_MODEL,
+        facts_judge_messages(question, response, facts),
+        ResponseEvaluation,
+        priority=PRIORITY_JUDGE,
+    )
+
+
+async def ajudge_batched(
+    question: str,
+    response: str,
+    facts: List[str],
+    judge_facts: Callable[
+        [str, str, List[str]], Awaitable[ResponseEvaluation]
+    ] = aevaluate_facts_batched,
+    judge_fact: Callable[[str, str, str], Awaitable[FactEvaluation]] = (
+        aevaluate_single_fact
+    ),
+) -> List[FactEvaluation]:
+    """Judge all facts in one call; facts the batched answer does not match
+    one-to-one are judged on their own with `judge_fact`."""
+    evaluation = await judge_facts(question, response, facts)
+    matched = match_batched_evaluations(facts, evaluation.fact_evaluations)
+    fallbacks = await asyncio.gather(
+        *(
+            judge_fact(question, response, fact)
+            for fact, evaluation in zip(facts, matched)
+            if evaluation is None
+        )
+    )
+    fallbacks = iter(fallbacks)
+    return [
+        evaluation if evaluation is not None else next(fallbacks)
+        for evaluation in matched
+    ]
+
+
+def evaluate_single_response(
+    question: str,
+    response: str,
+    required_facts: List[str],
+    judge_mode: Optional[str] = None,
+) -> ResponseEvaluation:
+    return run_sync(
+        aevaluate_single_response(question, response, required_facts, judge_mode)
+    )
+
+
+async def aprocess_and_evaluate_single_question(
+    prompt_template: str, item: Dict, context: Optional[str] = None
 ) -> Dict[str, any]:
     question = item["question"]
-    response = query_rag(prompt_template, question)
+    response = await aquery_rag(prompt_template, question, context)
 
-    evaluation = evaluate_single_response(question, response, item["required_facts"])
+    evaluation = await aevaluate_single_response(
+        question, response, item["required_facts"]
+    )
     passed_count = sum(1 for eval in evaluation.fact_evaluations if eval.passed)
 
     return {
@@ -266,103 +458,516 @@ def process_and_evaluate_single_question(
     }
 
 
-def evaluate(prompt_template: str):
-    rprint(
-        f"[bold blue]🔍[/bold blue] [bold green]Evaluating prompt:[/bold green] [yellow]{prompt_template}[/yellow]"
+def process_and_evaluate_single_question(
+    prompt_template: str, item: Dict, context: Optional[str] = None
+) -> Dict[str, any]:
+    return run_sync(
+        aprocess_and_evaluate_single_question(prompt_template, item, context)
     )
 
-    total_passed = 0
-    total_facts = 0
-    evaluated_responses = []
-    failure_reasons = []
 
-    items_to_evaluate = (
-        evaluation_items[:MAX_EVALUATION_EXAMPLES]
-        if MAX_EVALUATION_EXAMPLES
-        else evaluation_items
+def iter_items_to_evaluate() -> Iterator[Dict]:
+    items: Iterable[Dict] = (
+        evaluation_items
+        if EVALUATION_DATASET is None
+        else select_items(
+            EVALUATION_DATASET, DATASET_SAMPLE_SIZE, DATASET_SHARD, DATASET_SEED
+        )
+    )
+    # 0 (like None) means every item.
+    return itertools.islice(items, MAX_EVALUATION_EXAMPLES or None)
+
+
+def get_items_to_evaluate() -> List[Dict]:
+    return list(iter_items_to_evaluate())
+
+
+async def _load_contexts(
+    items: List[Dict], use_snapshot: Optional[bool]
+) -> Dict[str, str]:
+    if USE_CONTEXT_SNAPSHOT if use_snapshot is None else use_snapshot:
+        return (await aget_snapshot(items)).contexts
+    return {}
+
+
+def collect_failure_reasons(results: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "question": result["question"],
+            "fact": eval["fact"],
+            "reason": eval["reason"],
+        }
+        for result in results
+        for eval in result["fact_evaluations"]
+        if not eval["passed"]
+    ]
+
+
+class ScoreAccumulator:
+    """Aggregate score and failures built up one streamed result at a time.
+
+    Only failing facts are kept, so memory does not grow with the number of
+    passing items.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.score_sum = 0.0
+        self.passed_facts = 0
+        self.total_facts = 0
+        self._failures: Dict[int, List[Dict]] = {}
+
+    def add(self, index: int, result: Dict) -> None:
+        self.items += 1
+        self.score_sum += result["score"]
+        self.passed_facts += sum(
+            1 for eval in result["fact_evaluations"] if eval["passed"]
+        )
+        self.total_facts += len(result["fact_evaluations"])
+        failures = collect_failure_reasons([result])
+        if failures:
+            self._failures[index] = failures
+
+    @property
+    def score(self) -> float:
+        return self.score_sum / self.items if self.items else 0.0
+
+    @property
+    def failure_reasons(self) -> List[Dict]:
+        # Results arrive in completion order; collect failures in dataset order
+        # so repeated runs produce the same feedback.
+        return [
+            reason
+            for index in sorted(self._failures)
+            for reason in self._failures[index]
+        ]
+
+
+def evaluation_config(use_snapshot: Optional[bool] = None) -> Dict:
+    """Everything besides the prompt and the item that a scored item depends
+    on; checkpointed results are only reused while it stays the same."""
+    return {
+        "judge_mode": JUDGE_MODE,
+        "judge_model": JUDGE_MODEL,
+        "judge_thresholds": (
+            asdict(current_thresholds()) if JUDGE_MODE == "cascade" else None
+        ),
+        "retrieval": RETRIEVAL_MODE,
+        "context_tokens": CONTEXT_TOKEN_BUDGET,
+        "snapshot": USE_CONTEXT_SNAPSHOT if use_snapshot is None else use_snapshot,
+        "dataset": EVALUATION_DATASET,
+        "collection": collection_version(get_docs_collection()),
+    }
+
+
+async def astream_evaluation(
+    prompt_template: str,
+    items: Optional[Iterable[Dict]] = None,
+    max_concurrency: int = MAX_CONCURRENT_QUESTIONS,
+    use_snapshot: Optional[bool] = None,
+    resume: bool = False,
+) -> AsyncIterator[Tuple[int, Dict]]:
+    """Yield `(index, result)` for every item as soon as it is scored.
+
+    Items are pulled from `items` only as concurrency frees up, so a lazily
+    read dataset is never loaded as a whole. Each result is appended to the
+    checkpoint of the prompt and evaluation_config() before it is yielded;
+    with `resume` items already in that checkpoint are yielded from it instead
+    of being evaluated again, otherwise the checkpoint is started over.
+    """
+    items = iter_items_to_evaluate() if items is None else items
+    checkpoint = Checkpoint(prompt_template, evaluation_config(use_snapshot))
+    if not resume:
+        checkpoint.clear()
+    done = checkpoint.load() if resume else {}
+
+    contexts = {}
+    if USE_CONTEXT_SNAPSHOT if use_snapshot is None else use_snapshot:
+        # The snapshot is built for the whole item list up front.
+        items = list(items)
+        contexts = await _load_contexts(items, True)
+
+    if WORK_QUEUE is not None:
+        async for entry in _astream_from_queue(
+            prompt_template, items, done, contexts, checkpoint
+        ):
+            yield entry
+        return
+
+    async def process(index: int, item: Dict):
+        result = await aprocess_and_evaluate_single_question(
+            prompt_template, item, contexts.get(item["question"])
+        )
+        await checkpoint.aappend(item_id(item), result)
+        return index, result
+
+    in_flight = set()
+    try:
+        for index, item in enumerate(items):
+            if item_id(item) in done:
+                yield index, done[item_id(item)]
+                continue
+            in_flight.add(asyncio.ensure_future(process(index, item)))
+            if len(in_flight) >= max_concurrency:
+                finished, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in finished:
+                    yield task.result()
+        while in_flight:
+            finished, in_flight = await asyncio.wait(
+                in_flight, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in finished:
+                yield task.result()
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def _astream_from_queue(
+    prompt_template: str,
+    items: Iterable[Dict],
+    done: Dict[str, Dict],
+    contexts: Dict[str, str],
+    checkpoint: Checkpoint,
+) -> AsyncIterator[Tuple[int, Dict]]:
+    queue = WorkQueue(WORK_QUEUE)
+    run_id = new_run_id()
+    item_ids: Dict[int, str] = {}
+    batch = []
+    try:
+        for index, item in enumerate(items):
+            if item_id(item) in done:
+                yield index, done[item_id(item)]
+                continue
+            item_ids[index] = item_id(item)
+            batch.append((index, item, contexts.get(item["question"])))
+            if len(batch) >= ENQUEUE_BATCH_SIZE:
+                queue.enqueue(run_id, prompt_template, batch)
+                batch = []
+        queue.enqueue(run_id, prompt_template, batch)
+
+        last_activity = time.monotonic()
+        while item_ids:
+            collected = await asyncio.to_thread(queue.collect, run_id)
+            for index, result in collected:
+                await checkpoint.aappend(item_ids.pop(index), result)
+                yield index, result
+            failures = queue.failures(run_id)
+            if failures:
+                raise RuntimeError(
+                    f"{len(failures)} evaluation jobs failed, e.g. {failures[0]}"
+                )
+            if collected or queue.live_leases(run_id):
+                last_activity = time.monotonic()
+            elif time.monotonic() - last_activity > QUEUE_STALL_SECONDS:
+                raise RuntimeError(
+                    f"No worker took any of the {len(item_ids)} remaining jobs in "
+                    f"{QUEUE_STALL_SECONDS:.0f}s; start one with "
+                    f"`uv run worker --queue {queue.path}`"
+                )
+            if item_ids:
+                await asyncio.sleep(QUEUE_POLL_SECONDS)
+    finally:
+        queue.cancel(run_id)
+
+
+async def aevaluate(
+    prompt_template: str,
+    max_concurrency: int = MAX_CONCURRENT_QUESTIONS,
+    use_snapshot: Optional[bool] = None,
+    show_progress: bool = True,
+    resume: bool = False,
+    totals: Optional[ScoreAccumulator] = None,
+):
+    """Score a prompt on every item; pass `totals` to read item counts and
+    score sums afterwards (e.g. to write a shard result)."""
+    EVALUATE_CALLS["evaluate"] += 1
+    rprint(
+        f"[bold blue]🔍[/bold blue] [bold green]Evaluating prompt:[/bold green] [yellow]{prompt_template}[/yellow]"
     )
 
+    cache_stats = response_cache.stats()
+    packing_before = packing_stats.snapshot()
+    cascade_before = cascade_stats.snapshot()
+    if JUDGE_MODE == "cascade":
+        reload_thresholds()
+    totals = ScoreAccumulator() if totals is None else totals
+    # External datasets are streamed, so their size is not known up front.
+    total_items = len(get_items_to_evaluate()) if EVALUATION_DATASET is None else None
+
     with tqdm(
-        total=len(items_to_evaluate),
+        total=total_items,
         desc="Progress",
         position=0,
         colour="green",
+        disable=not show_progress,
         bar_format="{desc}: {percentage:3.0f}%|{bar:30}| {n_fmt}/{total_fmt}",
     ) as pbar_questions:
         with tqdm(
             total=0,
             desc="Current Score",
             position=1,
+            disable=not show_progress,
             bar_format="{desc}: {n_fmt}/{total_fmt} {postfix}",
         ) as pbar_facts:
             with tqdm(
                 total=0,
                 desc="Current Question:",
                 position=2,
+                disable=not show_progress,
                 bar_format="{desc}",
                 postfix="",
             ) as pbar_question:
-                for item in items_to_evaluate:
-                    result = process_and_evaluate_single_question(prompt_template, item)
-                    evaluated_responses.append(result)
-
-                    passed_count = sum(
-                        1 for eval in result["fact_evaluations"] if eval["passed"]
-                    )
-                    total_passed += passed_count
-                    total_facts += len(item["required_facts"])
-
-                    for eval in result["fact_evaluations"]:
-                        if not eval["passed"]:
-                            failure_reasons.append(
-                                {
-                                    "question": item["question"],
-                                    "fact": eval["fact"],
-                                    "reason": eval["reason"],
-                                }
-                            )
+                async for index, result in astream_evaluation(
+                    prompt_template,
+                    iter_items_to_evaluate(),
+                    max_concurrency,
+                    use_snapshot,
+                    resume,
+                ):
+                    totals.add(index, result)
 
                     pbar_questions.update(1)
-                    pbar_facts.total = total_facts
-                    pbar_facts.n = total_passed
-                    pbar_facts.set_postfix_str(f"({total_passed/total_facts:.2f})")
+                    pbar_facts.total = totals.total_facts
+                    pbar_facts.n = totals.passed_facts
+                    pbar_facts.set_postfix_str(
+                        f"({totals.passed_facts/totals.total_facts:.2f})"
+                    )
                     pbar_question.set_description_str(
-                        f"Current Question: {item['question']}"
+                        f"Current Question: {result['question']}"
                     )
                     pbar_facts.refresh()
                     pbar_question.refresh()
 
-    total_score = sum(result["score"] for result in evaluated_responses) / len(
-        evaluated_responses
+    rprint(format_cache_stats(cache_stats, response_cache.stats()))
+    rprint(format_packing_stats(packing_before, packing_stats.snapshot()))
+    if JUDGE_MODE == "cascade":
+        rprint(format_cascade_stats(cascade_before, cascade_stats.snapshot()))
+    rprint(format_scheduler_stats(scheduler.stats()))
+
+    return totals.score, totals.failure_reasons
+
+
+def evaluate(
+    prompt_template: str,
+    max_concurrency: int = MAX_CONCURRENT_QUESTIONS,
+    use_snapshot: Optional[bool] = None,
+    show_progress: bool = True,
+    resume: bool = False,
+    totals: Optional[ScoreAccumulator] = None,
+):
+    return run_sync(
+        aevaluate(
+            prompt_template,
+            max_concurrency,
+            use_snapshot,
+            show_progress,
+            resume,
+            totals,
+        )
+    )
+
+
+def format_failure_reasons(failure_reasons: List[Dict]) -> str:
+    return "\n".join(f"- {reason['reason']}" for reason in failure_reasons)
+
+
+class AdaptiveEvaluation(BaseModel):
+    score: float
+    items_evaluated: int
+    total_items: int
+    interval: Tuple[float, float]
+    stopped_early: bool
+    failure_reasons: List[Dict]
+
+
+def score_interval(
+    scores: List[float], population: int, delta: float
+) -> Tuple[float, float]:
+    """Hoeffding-Serfling bound on the full-dataset score from a sample.
+
+    Item scores lie in [0, 1] and are drawn without replacement, which
+    tightens the plain Hoeffding bound as the sample nears the full dataset.
+    """
+    n = len(scores)
+    mean = sum(scores) / n
+    if n >= population:
+        return mean, mean
+    finite_population = 1 - (n - 1) / population
+    half_width = math.sqrt(finite_population * math.log(2 / delta) / (2 * n))
+    return max(0.0, mean - half_width), min(1.0, mean + half_width)
+
+
+async def aevaluate_adaptive(
+    prompt_template: str,
+    best_score: float,
+    confidence: float = ADAPTIVE_CONFIDENCE,
+    min_items: int = ADAPTIVE_MIN_ITEMS,
+    growth: int = 2,
+    max_concurrency: int = MAX_CONCURRENT_QUESTIONS,
+    use_snapshot: Optional[bool] = None,
+    seed: int = ADAPTIVE_SEED,
+    resume: bool = False,
+) -> AdaptiveEvaluation:
+    """Evaluate on growing subsets and stop once the prompt provably cannot
+    beat `best_score`.
+
+    Subsets grow by `growth` (successive halving's rung schedule) over a
+    seeded shuffle of the dataset, so every candidate sees the same items.
+    """
+    EVALUATE_CALLS["adaptive"] += 1
+    items = get_items_to_evaluate()
+    items = random.Random(seed).sample(items, len(items))
+
+    rungs = []
+    size = min(min_items, len(items))
+    while True:
+        rungs.append(size)
+        if size == len(items):
+            break
+        size = min(len(items), size * growth)
+    # Every rung is a look at the data; split the error budget between them.
+    delta = (1 - confidence) / len(rungs)
+
+    results: List[Dict] = []
+    for rung in rungs:
+        rung_items = items[len(results) : rung]
+        rung_results: List[Optional[Dict]] = [None] * len(rung_items)
+        # Later rungs add to the checkpoint the first rung started, so it
+        # ends up holding every item this evaluation scored.
+        async for index, result in astream_evaluation(
+            prompt_template,
+            rung_items,
+            max_concurrency,
+            use_snapshot,
+            resume or bool(results),
+        ):
+            rung_results[index] = result
+        results.extend(rung_results)
+        scores = [result["score"] for result in results]
+        interval = score_interval(scores, len(items), delta)
+        if interval[1] < best_score and rung < len(items):
+            break
+
+    return AdaptiveEvaluation(
+        score=sum(scores) / len(scores),
+        items_evaluated=len(results),
+        total_items=len(items),
+        interval=interval,
+        stopped_early=len(results) < len(items),
+        failure_reasons=collect_failure_reasons(results),
     )
 
-    return total_score, failure_reasons
 
+def evaluate_adaptive(prompt_template: str, best_score: float, **kwargs):
+    return run_sync(aevaluate_adaptive(prompt_template, best_score, **kwargs))
 
-def run():
-    prompt_template = """Answer the following question based on the provided context:
-Context:
-{context}
 
-Question:
-{question}"""
-    total_score, failure_reasons = evaluate(prompt_template)
+def run():
+    global EVALUATION_DATASET, DATASET_SAMPLE_SIZE, DATASET_SHARD, DATASET_SEED
+    global WORK_QUEUE
+    parser = argparse.ArgumentParser(description="Evaluate the default RAG prompt")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the on-disk response cache",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Only score the items missing from this prompt's checkpoint",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Use the frozen retrieval context snapshot (built on first use)",
+    )
+    parser.add_argument(
+        "--dataset",
+        help="JSONL, CSV or Parquet file to evaluate instead of the built-in questions",
+    )
+    parser.add_argument(
+        "--sample",
+        type=int,
+        help="Evaluate a stratified sample of this many dataset items",
+    )
+    parser.add_argument("--seed", type=int, default=DATASET_SEED)
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only evaluate shard i of n (e.g. 0/4) of the dataset",
+    )
+    parser.add_argument(
+        "--output",
+        help="Write this run's totals to a JSON file that --merge can combine",
+    )
+    parser.add_argument(
+        "--queue",
+        help="Score items through `uv run worker` processes sharing this SQLite queue",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Start this many local worker processes for --queue",
+    )
+    parser.add_argument(
+        "--merge",
+        nargs="+",
+        metavar="RESULT",
+        help="Combine per-shard --output files into one score instead of evaluating",
+    )
+    args = parser.parse_args()
+    if args.merge:
+        score, failure_reasons, items = merge_shard_results(args.merge)
+        print(f"Overall Score: {score:.2f} over {items} items")
+        print(f"{len(failure_reasons)} failed facts")
+        return
+
+    EVALUATION_DATASET = args.dataset or EVALUATION_DATASET
+    if EVALUATION_DATASET is None and (args.sample or args.shard):
+        parser.error(
+            "--sample and --shard need --dataset (or PROMPT_OPTIMIZER_DATASET)"
+        )
+    DATASET_SAMPLE_SIZE = args.sample or DATASET_SAMPLE_SIZE
+    DATASET_SHARD = args.shard
+    DATASET_SEED = args.seed
+    WORK_QUEUE = args.queue or WORK_QUEUE
+    if args.workers and WORK_QUEUE is None:
+        parser.error("--workers needs --queue")
+    workers = spawn_workers(args.workers, WORK_QUEUE) if args.workers else []
+    if args.no_cache:
+        response_cache.enabled = False
+    telemetry.start_run()
+
+    prompt_template = DEFAULT_PROMPT
+    totals = ScoreAccumulator()
+    try:
+        total_score, failure_reasons = evaluate(
+            prompt_template,
+            use_snapshot=args.snapshot or None,
+            resume=args.resume,
+            totals=totals,
+        )
+    finally:
+        for worker in workers:
+            worker.terminate()
     print(f"\nOverall Score: {total_score:.2f}")
+    if args.output:
+        write_shard_result(
+            args.output,
+            prompt_hash(prompt_template),
+            EVALUATION_DATASET,
+            DATASET_SHARD,
+            totals.items,
+            totals.score_sum,
+            failure_reasons,
+        )
+        print(f"Totals written to {args.output}")
 
     if failure_reasons:
         print("\nAnalyzing failure patterns...")
-        failure_summary = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Analyze the following failure reasons and provide a concise summary of the main patterns and issues.",
-                },
-                {
-                    "role": "user",
-                    "content": f"Here are the failure reasons:\n{str(failure_reasons)}",
-                },
-            ],
-        )
         print("\nFailure Analysis:")
-        print(failure_summary.choices[0].message.content)
+        print(run_sync(abuild_feedback(failure_reasons)))
@@ -0,0 +1,325 @@
+"""Process-wide admission control for OpenAI calls.
+
+Every model gets request and token buckets sized from its RPM/TPM limits and
+an AIMD concurrency limit: it grows by one slot per window of successful
+calls and halves on a 429 (or when latency climbs well above its usual
+level). Waiting calls are admitted in priority order, so answer generation
+is not stuck behind a backlog of judge calls. State is guarded by a thread
+lock rather than asyncio primitives because run_sync runs coroutines on
+several event loops at once.
+"""
+
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+PRIORITY_GENERATION = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_JUDGE = 2
+
+# (requests per minute, tokens per minute)
+MODEL_LIMITS: Dict[str, Tuple[int, int]] = {
+    "gpt-4o": (5_000, 800_000),
+    "gpt-4o-mini": (5_000, 4_000_000),
+    "gpt-4": (5_000, 300_000),
+    "text-embedding-3-small": (5_000, 5_000_000),
+}
+DEFAULT_LIMITS = (500, 200_000)
+INITIAL_CONCURRENCY = 8
+MAX_CONCURRENCY = 64
+MAX_ATTEMPTS = 6
+# A call slower than this multiple of the model's typical latency counts as
+# congestion and shrinks the concurrency limit like a 429 would, but gentler.
+LATENCY_BACKOFF_FACTOR = 3.0
+POLL_SECONDS = 0.02
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Oversized requests only need a full bucket, not more than it holds.
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float) -> None:
+        # A negative amount refunds tokens, but never past a full bucket.
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+@dataclass
+class ModelStats:
+    requests: int = 0
+    throttled: int = 0
+    retries: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    wait_seconds: float = 0.0
+    tokens: int = 0
+
+
+class ModelLimiter:
+    def __init__(self, model: str):
+        rpm, tpm = MODEL_LIMITS.get(model, DEFAULT_LIMITS)
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.limit = float(INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.latency = None
+        self.stats = ModelStats()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, ticket, tokens: int) -> Optional[float]:
+        """Admit `ticket` if it is first in line and capacity allows, else
+        return how long to wait before checking again."""
+        with self._lock:
+            now = time.monotonic()
+            if self._waiters[0] != ticket:
+                return POLL_SECONDS
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= int(self.limit):
+                return POLL_SECONDS
+            wait = max(
+                self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now)
+            )
+            if wait > 0:
+                return wait
+            heapq.heappop(self._waiters)
+            self.stats.queue_depth = len(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.in_flight += 1
+            return None
+
+    async def acquire(self, priority: int, tokens: int) -> None:
+        started = time.monotonic()
+        ticket = (priority, next(self._counter))
+        with self._lock:
+            heapq.heappush(self._waiters, ticket)
+            self.stats.queue_depth = len(self._waiters)
+            self.stats.max_queue_depth = max(
+                self.stats.max_queue_depth, self.stats.queue_depth
+            )
+        try:
+            while (wait := self._try_acquire(ticket, tokens)) is not None:
+                await asyncio.sleep(min(wait, 1.0))
+        except BaseException:
+            with self._lock:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                    self.stats.queue_depth = len(self._waiters)
+            raise
+        with self._lock:
+            self.stats.wait_seconds += time.monotonic() - started
+
+    def release(
+        self,
+        latency: Optional[float],
+        reserved_tokens: int,
+        used_tokens: Optional[int] = None,
+    ) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.stats.requests += 1
+            if used_tokens is not None:
+                # Settle the estimate against what the API actually counted.
+                self.tokens.take(used_tokens - reserved_tokens)
+                self.stats.tokens += used_tokens
+            if latency is None:
+                return
+            if (
+                self.latency is not None
+                and latency > LATENCY_BACKOFF_FACTOR * self.latency
+            ):
+                self.limit = max(1.0, self.limit * 0.9)
+            else:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            self.latency = (
+                latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+            )
+
+    def throttle(self, retry_after: Optional[float]) -> None:
+        with self._lock:
+            self.stats.throttled += 1
+            self.limit = max(1.0, self.limit / 2)
+            if retry_after:
+                self.blocked_until = max(
+                    self.blocked_until, time.monotonic() + retry_after
+                )
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.stats.retries += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                **vars(self.stats),
+                "in_flight": self.in_flight,
+                "concurrency_limit": int(self.limit),
+            }
+
+
+def retry_after_seconds(error) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _usage_tokens(result) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+@dataclass
+class HeldCall:
+    """A call admitted by Scheduler.hold; set `used_tokens` once the usage is
+    known (e.g. from the last chunk of a stream)."""
+
+    result: Any
+    used_tokens: Optional[int] = None
+
+
+class Scheduler:
+    def __init__(self):
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                self._limiters[model] = ModelLimiter(model)
+            return self._limiters[model]
+
+    async def run(
+        self,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        priority: int = PRIORITY_DEFAULT,
+    ) -> T:
+        """Run `call` once the model has budget, retrying throttled and
+        transient failures."""
+        limiter = self.limiter(model)
+        result, latency = await self._admit(limiter, call, estimated_tokens, priority)
+        limiter.release(latency, estimated_tokens, _usage_tokens(result))
+        return result
+
+    @asynccontextmanager
+    async def hold(
+        self,
+        model: str,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        priority: int = PRIORITY_DEFAULT,
+    ) -> AsyncIterator[HeldCall]:
+        """Like run, but the call keeps its slot until the block exits, so a
+        streamed response counts as in flight until it has been read."""
+        limiter = self.limiter(model)
+        result, latency = await self._admit(limiter, call, estimated_tokens, priority)
+        held = HeldCall(result)
+        try:
+            yield held
+        finally:
+            # The latency that adapts the limit is the time to the response
+            # headers, comparable to that of unstreamed calls.
+            limiter.release(latency, estimated_tokens, held.used_tokens)
+
+    async def _admit(
+        self,
+        limiter: ModelLimiter,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        priority: int,
+    ) -> Tuple[T, float]:
+        """Acquire a slot and run `call` with retries; on success the slot is
+        still taken and (result, latency) is returned. A failed attempt refunds
+        its reserved tokens, since the API counted none."""
+        import openai
+
+        for attempt in range(MAX_ATTEMPTS):
+            await limiter.acquire(priority, estimated_tokens)
+            started = time.monotonic()
+            try:
+                result = await call()
+            except openai.RateLimitError as error:
+                limiter.release(None, estimated_tokens, 0)
+                limiter.throttle(retry_after_seconds(error) or 2**attempt)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+            except (
+                openai.APIConnectionError,
+                openai.InternalServerError,
+            ):
+                limiter.release(None, estimated_tokens, 0)
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(2**attempt * (0.5 + random.random()))
+            except BaseException:
+                limiter.release(None, estimated_tokens, 0)
+                raise
+            else:
+                return result, time.monotonic() - started
+            limiter.record_retry()
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return {limiter.model: limiter.snapshot() for limiter in limiters}
+
+
+def format_scheduler_stats(stats: Dict[str, Dict]) -> str:
+    return "\n".join(
+        f"{model}: {model_stats['requests']} requests, "
+        f"{model_stats['throttled']} throttled, {model_stats['retries']} retries, "
+        f"max queue {model_stats['max_queue_depth']}, "
+        f"waited {model_stats['wait_seconds']:.1f}s, "
+        f"concurrency {model_stats['concurrency_limit']}"
+        for model, model_stats in stats.items()
+    )
+
+
+scheduler = Scheduler()
@@ -0,0 +1,233 @@
+"""Long-running HTTP service answering questions with the optimized prompt.
+
+    uv run serve --port 8000
+    curl -d '{"question": "Can I self-host Traceloop?"}' localhost:8000/query
+    curl -N -d '{"question": "...", "stream": true}' localhost:8000/query
+
+The Chroma collection and the OpenAI connection pool are opened once at
+startup. Identical questions that arrive while one is being answered share
+that answer (and its token stream) instead of calling the model again, and
+the prompt is re-read whenever optimized_prompt.txt changes on disk.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from prompt_optimizer.async_utils import get_async_client
+from prompt_optimizer.checkpoint import prompt_hash
+from prompt_optimizer.prompts import DEFAULT_PROMPT, to_prefix_layout
+from prompt_optimizer.rag import astream_query_rag
+from prompt_optimizer.resources import get_docs_collection
+from prompt_optimizer.telemetry import telemetry
+
+PROMPT_PATH = "optimized_prompt.txt"
+# Telemetry is written out and dropped from memory this often, so a server
+# that runs for weeks does not accumulate every request's records.
+TELEMETRY_WINDOW_SECONDS = 300.0
+
+
+def parse_prompt_file(text: str) -> str:
+    """Strip the "Score: ..." header write_best_prompt puts above the prompt."""
+    if text.startswith("Score:") and "\nPrompt:\n" in text:
+        return text.split("\nPrompt:\n", 1)[1]
+    return text
+
+
+class PromptFile:
+    """The serving prompt, re-read whenever the file's mtime changes."""
+
+    def __init__(self, path: str = PROMPT_PATH):
+        self.path = path
+        self._mtime: Optional[int] = None
+        self._prompt = DEFAULT_PROMPT
+
+    def get(self) -> str:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self._prompt
+        if mtime != self._mtime:
+            with open(self.path) as file:
+                prompt = to_prefix_layout(parse_prompt_file(file.read()))
+            try:
+                prompt.format(context="", question="")
+            except (KeyError, IndexError, ValueError) as error:
+                # Keep serving the previous prompt rather than failing requests.
+                print(f"Ignoring invalid prompt in {self.path}: {error!r}")
+            else:
+                if self._mtime is not None:
+                    print(f"Reloaded prompt from {self.path}")
+                self._prompt = prompt
+            self._mtime = mtime
+        return self._prompt
+
+
+class SharedAnswer:
+    """One upstream answer that any number of requests can follow."""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Condition()
+
+    async def produce(self, tokens: AsyncIterator[str]) -> None:
+        try:
+            async for token in tokens:
+                async with self._changed:
+                    self.tokens.append(token)
+                    self._changed.notify_all()
+        except BaseException as error:
+            self.error = error
+            raise
+        finally:
+            async with self._changed:
+                self.done = True
+                self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Replay the tokens produced so far, then the rest as they arrive."""
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(
+                    lambda: self.done or len(self.tokens) > position
+                )
+                new_tokens = self.tokens[position:]
+                finished = self.done
+            for token in new_tokens:
+                yield token
+            position += len(new_tokens)
+            if finished and position == len(self.tokens):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+class QueryService:
+    def __init__(self, prompt_file: PromptFile):
+        self.prompt_file = prompt_file
+        self.in_flight: Dict[Tuple[str, str], SharedAnswer] = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def answer(self, question: str) -> Tuple[SharedAnswer, str]:
+        prompt = self.prompt_file.get()
+        key = (prompt_hash(prompt), " ".join(question.lower().split()))
+        self.requests += 1
+        shared = self.in_flight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            return shared, key[0]
+
+        shared = SharedAnswer()
+        self.in_flight[key] = shared
+        task = asyncio.ensure_future(
+            shared.produce(astream_query_rag(prompt, question))
+        )
+        task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Errors reach every follower; keep asyncio from logging them again.
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return shared, key[0]
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+            "prompt_hash": prompt_hash(self.prompt_file.get()),
+        }
+
+
+def create_app(
+    service: QueryService, telemetry_window: float = TELEMETRY_WINDOW_SECONDS
+):
+    from aiohttp import web
+
+    async def query(request: web.Request) -> web.StreamResponse:
+        try:
+            body = await request.json()
+            question = body["question"]
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text='Expected {"question": "..."}')
+        if not isinstance(question, str) or not question.strip():
+            raise web.HTTPBadRequest(text='"question" must be a non-empty string')
+        if not isinstance(body.get("stream", False), bool):
+            raise web.HTTPBadRequest(text='"stream" must be true or false')
+
+        shared, version = service.answer(question)
+        if not body.get("stream"):
+            answer = "".join([token async for token in shared.follow()])
+            return web.json_response({"answer": answer, "prompt_hash": version})
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        try:
+            async for token in shared.follow():
+                await response.write(
+                    f"data: {json.dumps({'token': token})}\n\n".encode()
+                )
+        except Exception as error:
+            await response.write(
+                f"data: {json.dumps({'error': str(error)})}\n\n".encode()
+            )
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **service.stats()})
+
+    async def warm_up(app: web.Application) -> None:
+        # Open the collection and the loop's connection pool before the first request.
+        collection = await asyncio.to_thread(get_docs_collection)
+        print(f"Serving {await asyncio.to_thread(collection.count)} chunks")
+        get_async_client()
+
+    async def rotate_telemetry(app: web.Application) -> AsyncIterator[None]:
+        async def rotate():
+            while True:
+                await asyncio.sleep(telemetry_window)
+                await asyncio.to_thread(telemetry.rotate)
+
+        task = asyncio.ensure_future(rotate())
+        yield
+        task.cancel()
+
+    app = web.Application()
+    app.router.add_post("/query", query)
+    app.router.add_get("/healthz", health)
+    app.on_startup.append(warm_up)
+    app.cleanup_ctx.append(rotate_telemetry)
+    return app
+
+
+def run():
+    from aiohttp import web
+
+    parser = argparse.ArgumentParser(description="Serve query_rag over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--prompt",
+        default=PROMPT_PATH,
+        help="Prompt file, reloaded whenever it changes",
+    )
+    parser.add_argument(
+        "--telemetry-window",
+        type=float,
+        default=TELEMETRY_WINDOW_SECONDS,
+        help="Seconds of telemetry kept in memory before it is written out",
+    )
+    args = parser.parse_args()
+
+    telemetry.start_run()
+    web.run_app(
+        create_app(QueryService(PromptFile(args.prompt)), args.telemetry_window),
+        host=args.host,
+        port=args.port,
+    )
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from rich import print as rprint
+from tqdm import tqdm
+
+from prompt_optimizer.async_utils import run_sync
+from prompt_optimizer.packing import CONTEXT_TOKEN_BUDGET
+from prompt_optimizer.rag import (
+    RETRIEVAL_MODE,
+    aretrieve_context,
+    aretrieve_contexts,
+    collection_fingerprint,
+)
+from prompt_optimizer.resources import DOCS_COLLECTION
+from prompt_optimizer.vector_index import load_index
+
+# Bump whenever the way contexts are retrieved or joined changes, so snapshots
+# built by older code are rebuilt instead of silently reused.
+SNAPSHOT_VERSION = 2
+SNAPSHOT_PATH = os.getenv(
+    "PROMPT_OPTIMIZER_CONTEXT_SNAPSHOT_PATH", "db/context_snapshot.json"
+)
+MAX_CONCURRENT_RETRIEVALS = 8
+
+
+class ContextSnapshot(BaseModel):
+    version: int = SNAPSHOT_VERSION
+    collection: str
+    collection_fingerprint: str
+    retrieval: str = "rewrite"
+    context_tokens: int = 0
+    created_at: float
+    contexts: Dict[str, str]
+
+    def covers(self, items: List[Dict]) -> bool:
+        return all(item["question"] in self.contexts for item in items)
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[ContextSnapshot]:
+    """Load a snapshot, or None if it is missing or no longer matches Chroma."""
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        snapshot = ContextSnapshot.model_validate_json(file.read())
+
+    if snapshot.version != SNAPSHOT_VERSION:
+        rprint(
+            f"[yellow]Context snapshot {path} has an old version, rebuilding[/yellow]"
+        )
+        return None
+    if (snapshot.retrieval, snapshot.context_tokens) != (
+        RETRIEVAL_MODE,
+        CONTEXT_TOKEN_BUDGET,
+    ):
+        rprint(
+            f"[yellow]Context snapshot {path} used other retrieval settings, "
+            "rebuilding[/yellow]"
+        )
+        return None
+    if snapshot.collection_fingerprint != collection_fingerprint():
+        rprint(f"[yellow]Context snapshot {path} is stale, rebuilding[/yellow]")
+        return None
+    return snapshot
+
+
+async def abuild_snapshot(
+    items: List[Dict],
+    path: str = SNAPSHOT_PATH,
+    max_concurrency: int = MAX_CONCURRENT_RETRIEVALS,
+    base: Optional[ContextSnapshot] = None,
+) -> ContextSnapshot:
+    """Retrieve the contexts of `items` that `base` does not have yet and
+    write them to `path` together with the ones it has."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    known = base.contexts if base is not None else {}
+    questions = [
+        question
+        for question in dict.fromkeys(item["question"] for item in items)
+        if question not in known
+    ]
+
+    async def retrieve(question: str):
+        async with semaphore:
+            return question, await aretrieve_context(question)
+
+    contexts = {}
+    index = await asyncio.to_thread(load_index) if RETRIEVAL_MODE == "rewrite" else None
+    if index is not None:
+        # One embedding request and one matrix multiply for every question.
+        contexts = dict(zip(questions, await aretrieve_contexts(questions, index)))
+    else:
+        with tqdm(
+            total=len(questions), desc="Retrieving contexts", colour="green"
+        ) as pbar:
+            for completed in asyncio.as_completed([retrieve(q) for q in questions]):
+                question, context = await completed
+                contexts[question] = context
+                pbar.update(1)
+
+    snapshot = ContextSnapshot(
+        collection=DOCS_COLLECTION,
+        collection_fingerprint=collection_fingerprint(),
+        retrieval=RETRIEVAL_MODE,
+        context_tokens=CONTEXT_TOKEN_BUDGET,
+        created_at=time.time(),
+        contexts={**known, **contexts},
+    )
+
+    # Concurrent evaluations may extend the snapshot with other questions at
+    # the same time; keep what they wrote meanwhile. Each writer uses its own
+    # temporary file and the last atomic rename wins.
+    current = load_snapshot(path) if base is not None else None
+    if current is not None:
+        snapshot.contexts = {**current.contexts, **snapshot.contexts}
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as file:
+        file.write(snapshot.model_dump_json(indent=2))
+    os.replace(tmp_path, path)
+
+    return snapshot
+
+
+async def aget_snapshot(
+    items: List[Dict], path: str = SNAPSHOT_PATH, rebuild: bool = False
+) -> ContextSnapshot:
+    snapshot = None if rebuild else load_snapshot(path)
+    if snapshot is None or not snapshot.covers(items):
+        # Subsets (e.g. adaptive evaluation rungs) are added to the snapshot
+        # rather than replacing it.
+        snapshot = await abuild_snapshot(items, path, base=snapshot)
+    return snapshot
+
+
+def run():
+    from prompt_optimizer.runner import evaluation_items
+
+    parser = argparse.ArgumentParser(
+        description="Freeze the retrieved context for every evaluation item"
+    )
+    parser.add_argument("--path", default=SNAPSHOT_PATH)
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Rebuild even if the existing snapshot is still valid",
+    )
+    args = parser.parse_args()
+
+    snapshot = run_sync(aget_snapshot(evaluation_items, args.path, args.rebuild))
+    print(f"Context snapshot for {len(snapshot.contexts)} questions: {args.path}")
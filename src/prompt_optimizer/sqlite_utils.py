@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import threading
+from typing import Sequence
+
+
+class ThreadLocalConnection:
+    """One SQLite connection per thread to the database at `path`.
+
+    The database runs in WAL mode, so threads and separate processes on the
+    same host can share the file; `schema` statements run on every new
+    connection and must be idempotent (CREATE ... IF NOT EXISTS).
+    """
+
+    def __init__(self, path: str, schema: Sequence[str]):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=30000")
+            for statement in self.schema:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
@@ -0,0 +1,382 @@
+"""Per-stage timings, token usage and estimated cost for one process run.
+
+Every stage opens an OpenTelemetry span. With PROMPT_OPTIMIZER_TELEMETRY=traceloop
+the spans go through traceloop-sdk; by default ("file") they are written as
+OTLP-style JSON lines next to the run summary, so offline runs keep them too.
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+TELEMETRY_MODE = os.getenv("PROMPT_OPTIMIZER_TELEMETRY", "file")
+TELEMETRY_DIR = os.getenv("PROMPT_OPTIMIZER_TELEMETRY_DIR", "runs")
+
+QUERY_REWRITE = "query_rewrite"
+RETRIEVAL = "retrieval"
+CONTEXT_PACKING = "context_packing"
+GENERATION = "generation"
+FACT_JUDGING = "fact_judging"
+FEEDBACK_COMPRESSION = "feedback_compression"
+OPTIMIZER_CREW = "optimizer_crew"
+EVALUATOR_CREW = "evaluator_crew"
+
+# USD per million (input, cached input, output) tokens.
+PRICES_PER_MILLION = {
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4": (30.00, 30.00, 60.00),
+    "text-embedding-3-small": (0.02, 0.02, 0.0),
+}
+
+_current_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "prompt_optimizer_stage", default=None
+)
+
+
+@dataclass
+class StageTiming:
+    stage: str
+    seconds: float
+
+
+@dataclass
+class Usage:
+    stage: Optional[str]
+    model: str
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    cache_hit: bool = False
+    # Latency of the API call; 0 for response cache hits and crew totals.
+    seconds: float = 0.0
+
+    def _prices(self) -> Tuple[float, float, float]:
+        prices = PRICES_PER_MILLION.get(self.model)
+        if prices is None:
+            # Dated snapshots ("gpt-4o-2024-08-06") share their family's price.
+            family = max(
+                (name for name in PRICES_PER_MILLION if self.model.startswith(name)),
+                key=len,
+                default=None,
+            )
+            prices = PRICES_PER_MILLION.get(family, (0.0, 0.0, 0.0))
+        return prices
+
+    @property
+    def cost(self) -> float:
+        input_price, cached_price, output_price = self._prices()
+        return (
+            (self.input_tokens - self.cached_tokens) * input_price
+            + self.cached_tokens * cached_price
+            + self.output_tokens * output_price
+        ) / 1_000_000
+
+    @property
+    def prefix_cache_savings(self) -> float:
+        """What the cached input tokens would have cost at the full price."""
+        input_price, cached_price, _ = self._prices()
+        return self.cached_tokens * (input_price - cached_price) / 1_000_000
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(q / 100 * (len(ordered) - 1)))]
+
+
+class JsonlSpanExporter:
+    """Writes every finished span as one OTLP-style JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, open(self.path, "a") as file:
+            for span in spans:
+                file.write(span.to_json(indent=None) + "\n")
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
+
+
+class Telemetry:
+    def __init__(self):
+        self.run_id = time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.timings: List[StageTiming] = []
+        self.usage: List[Usage] = []
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._tracer = None
+        self._started = False
+        self._windows = 0
+
+    @property
+    def run_dir(self) -> str:
+        return os.path.join(TELEMETRY_DIR, self.run_id)
+
+    def start_run(self, mode: str = TELEMETRY_MODE) -> None:
+        """Configure span export and write the summary when the process exits."""
+        if self._started:
+            return
+        self._started = True
+        if mode == "off":
+            return
+
+        if mode == "traceloop":
+            from traceloop.sdk import Traceloop
+
+            Traceloop.init(app_name="prompt_optimizer", disable_batch=True)
+        else:
+            try:
+                from opentelemetry import trace
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+            except ImportError:
+                pass
+            else:
+                provider = TracerProvider()
+                provider.add_span_processor(
+                    SimpleSpanProcessor(
+                        JsonlSpanExporter(os.path.join(self.run_dir, "spans.jsonl"))
+                    )
+                )
+                trace.set_tracer_provider(provider)
+        atexit.register(self.finish)
+
+    def _get_tracer(self):
+        if self._tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                self._tracer = False
+            else:
+                self._tracer = trace.get_tracer("prompt_optimizer")
+        return self._tracer or None
+
+    @contextmanager
+    def stage(self, name: str):
+        token = _current_stage.set(name)
+        tracer = self._get_tracer()
+        span = tracer.start_as_current_span(name) if tracer else None
+        started = time.perf_counter()
+        try:
+            if span is None:
+                yield
+            else:
+                with span:
+                    yield
+        finally:
+            elapsed = time.perf_counter() - started
+            _current_stage.reset(token)
+            with self._lock:
+                self.timings.append(StageTiming(name, elapsed))
+
+    def record_usage(
+        self,
+        model: str,
+        input_tokens: int = 0,
+        output_tokens: int = 0,
+        cached_tokens: int = 0,
+        cache_hit: bool = False,
+        stage: Optional[str] = None,
+        seconds: float = 0.0,
+    ) -> None:
+        with self._lock:
+            self.usage.append(
+                Usage(
+                    stage=stage or _current_stage.get(),
+                    model=model,
+                    input_tokens=input_tokens or 0,
+                    cached_tokens=cached_tokens or 0,
+                    output_tokens=output_tokens or 0,
+                    cache_hit=cache_hit,
+                    seconds=seconds,
+                )
+            )
+
+    def record_openai_usage(self, model: str, usage, seconds: float = 0.0) -> None:
+        """Accepts the `usage` of both chat completions and Responses API results."""
+        if usage is None:
+            return
+        if hasattr(usage, "input_tokens"):
+            details = getattr(usage, "input_tokens_details", None)
+            input_tokens, output_tokens = usage.input_tokens, usage.output_tokens
+        else:
+            details = getattr(usage, "prompt_tokens_details", None)
+            input_tokens = usage.prompt_tokens
+            output_tokens = getattr(usage, "completion_tokens", 0)
+        self.record_usage(
+            model,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_tokens=getattr(details, "cached_tokens", 0) or 0,
+            seconds=seconds,
+        )
+
+    def record_crew_usage(self, crew, output, stage: str) -> None:
+        """Token usage crewAI collected for a whole kickoff."""
+        usage = getattr(output, "token_usage", None)
+        if usage is None:
+            return
+        llm = getattr(crew.agents[0], "llm", None) if crew.agents else None
+        self.record_usage(
+            getattr(llm, "model", "unknown"),
+            input_tokens=usage.prompt_tokens,
+            output_tokens=usage.completion_tokens,
+            cached_tokens=getattr(usage, "cached_prompt_tokens", 0),
+            stage=stage,
+        )
+
+    def summary(self) -> Dict:
+        with self._lock:
+            timings, usage = list(self.timings), list(self.usage)
+        return self._summarize(timings, usage, self.started_at)
+
+    def _summarize(
+        self, timings: List[StageTiming], usage: List[Usage], started_at: float
+    ) -> Dict:
+        stages: Dict[str, Dict] = {}
+        for name in dict.fromkeys(timing.stage for timing in timings):
+            seconds = [timing.seconds for timing in timings if timing.stage == name]
+            stages[name] = {
+                "calls": len(seconds),
+                "total_s": sum(seconds),
+                "p50_s": percentile(seconds, 50),
+                "p95_s": percentile(seconds, 95),
+                "max_s": max(seconds),
+            }
+        models: Dict[str, Dict] = {}
+        for record in usage:
+            for key, totals in (
+                ("stage", stages.setdefault(record.stage or "other", {})),
+                ("model", models.setdefault(record.model, {})),
+            ):
+                for field in ("input_tokens", "cached_tokens", "output_tokens"):
+                    totals[field] = totals.get(field, 0) + getattr(record, field)
+                totals["cache_hits"] = totals.get("cache_hits", 0) + record.cache_hit
+                totals["cost_usd"] = totals.get("cost_usd", 0.0) + record.cost
+                totals["prefix_cache_savings_usd"] = (
+                    totals.get("prefix_cache_savings_usd", 0.0)
+                    + record.prefix_cache_savings
+                )
+        for name, totals in stages.items():
+            if totals.get("input_tokens"):
+                totals["prefix_cache_rate"] = (
+                    totals["cached_tokens"] / totals["input_tokens"]
+                )
+            # Median latency of API calls that did and did not reuse a cached
+            # prefix; the difference is the latency the prefix cache saves.
+            calls = [r for r in usage if (r.stage or "other") == name and r.seconds]
+            for key, cached in (
+                ("prefix_cached_p50_s", True),
+                ("uncached_p50_s", False),
+            ):
+                seconds = [r.seconds for r in calls if bool(r.cached_tokens) == cached]
+                if seconds:
+                    totals[key] = percentile(seconds, 50)
+
+        return {
+            "run_id": self.run_id,
+            "started_at": started_at,
+            "wall_s": time.time() - started_at,
+            "stages": stages,
+            "models": models,
+            "total_cost_usd": sum(record.cost for record in usage),
+            "prefix_cache_savings_usd": sum(
+                record.prefix_cache_savings for record in usage
+            ),
+            "total_tokens": sum(
+                record.input_tokens + record.output_tokens for record in usage
+            ),
+        }
+
+    def format_summary(self, summary: Optional[Dict] = None) -> str:
+        summary = summary or self.summary()
+        lines = [f"Run {summary['run_id']} ({summary['wall_s']:.1f}s)"]
+        for name, stage in summary["stages"].items():
+            lines.append(
+                f"  {name:<15} {stage.get('calls', 0):>5} calls  "
+                f"p50 {stage.get('p50_s', 0.0):6.2f}s  "
+                f"p95 {stage.get('p95_s', 0.0):6.2f}s  "
+                f"{stage.get('input_tokens', 0):>8} in / "
+                f"{stage.get('output_tokens', 0):>7} out tokens"
+                + (
+                    f"  {stage['prefix_cache_rate']:.0%} cached"
+                    if "prefix_cache_rate" in stage
+                    else ""
+                )
+            )
+        for model, totals in summary["models"].items():
+            lines.append(
+                f"  {model:<15} {totals['input_tokens']:>8} in / "
+                f"{totals['output_tokens']:>7} out tokens  ${totals['cost_usd']:.4f}"
+            )
+        lines.append(
+            f"  Estimated cost: ${summary['total_cost_usd']:.4f} "
+            f"(prompt caching saved ${summary['prefix_cache_savings_usd']:.4f})"
+        )
+        return "\n".join(lines)
+
+    def finish(self) -> Optional[str]:
+        """Write usage records and the run summary; returns the summary path."""
+        if self._windows:
+            return self.rotate()
+        with self._lock:
+            timings, usage = list(self.timings), list(self.usage)
+        return self._write(self.run_dir, timings, usage, self.started_at)
+
+    def rotate(self) -> Optional[str]:
+        """Write the records collected since the last rotation to
+        runs/<run-id>/window-<n>/ and drop them from memory, so a long-running
+        process (serve) keeps a bounded amount of telemetry."""
+        with self._lock:
+            timings, usage, started_at = self.timings, self.usage, self.started_at
+            self.timings, self.usage, self.started_at = [], [], time.time()
+            if not timings and not usage:
+                return None
+            self._windows += 1
+            directory = os.path.join(self.run_dir, f"window-{self._windows:05d}")
+        return self._write(directory, timings, usage, started_at)
+
+    def _write(
+        self,
+        directory: str,
+        timings: List[StageTiming],
+        usage: List[Usage],
+        started_at: float,
+    ) -> Optional[str]:
+        if not timings and not usage:
+            return None
+        summary = self._summarize(timings, usage, started_at)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "usage.jsonl"), "w") as file:
+            for record in usage:
+                file.write(json.dumps({**asdict(record), "cost_usd": record.cost}))
+                file.write("\n")
+        path = os.path.join(directory, "summary.json")
+        with open(path, "w") as file:
+            json.dump(summary, file, indent=2)
+        print(self.format_summary(summary))
+        print(f"Telemetry written to {directory}")
+        return path
+
+
+telemetry = Telemetry()
+stage = telemetry.stage
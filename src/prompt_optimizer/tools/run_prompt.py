@@ -1,6 +1,8 @@
 from crewai.tools import BaseTool
 from typing import Type
 from pydantic import BaseModel, Field
+from prompt_optimizer.async_utils import run_sync
+from prompt_optimizer.feedback import abuild_feedback
 from prompt_optimizer.runner import evaluate
 
 
@@ -21,7 +23,7 @@ class RunPrompt(BaseTool):
         if not failure_reasons:
             return f"Score: {score}"
 
-        failure_text = "\n".join(f"- {reason['reason']}" for reason in failure_reasons)
+        failure_text = run_sync(abuild_feedback(failure_reasons))
 
         return f"""Score: {score}
 
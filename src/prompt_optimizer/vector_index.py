@@ -0,0 +1,254 @@
+"""Exported copy of the docs collection for batched, in-process retrieval.
+
+`uv run export_index` writes every chunk's embedding into a float32 matrix
+that is memory-mapped on load, with the chunk ids and documents next to it.
+A whole batch of queries is then embedded in one request and searched with
+one matrix multiply, instead of one Chroma query per question. The export
+records the collection size and index manifest version it was taken from and
+is ignored once load_data changes the collection.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from prompt_optimizer.async_utils import get_async_client, run_sync
+from prompt_optimizer.indexing import collection_version
+from prompt_optimizer.resources import EMBEDDING_MODEL, get_docs_collection
+from prompt_optimizer.scheduler import estimate_tokens, scheduler
+
+if TYPE_CHECKING:
+    import numpy as np
+
+INDEX_DIR = os.getenv("PROMPT_OPTIMIZER_VECTOR_INDEX_DIR", "db/vector_index")
+EMBEDDINGS_FILE = "embeddings.f32"
+METADATA_FILE = "metadata.json"
+EXPORT_PAGE_SIZE = 1000
+# Queries per embedding request; the API accepts up to 2048 inputs.
+QUERY_BATCH_SIZE = 512
+# --validate fails below this mean overlap with Chroma's results; HNSW is
+# approximate, so exact agreement on every query is not required.
+MIN_MEAN_OVERLAP = 0.95
+
+
+def export_index(directory: str = INDEX_DIR) -> int:
+    """Write the collection's embeddings, ids and documents; returns the row count."""
+    import numpy as np
+
+    collection = get_docs_collection()
+    version = collection_version(collection)
+    count = version["count"]
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    ids: List[str] = []
+    documents: List[str] = []
+    matrix = None
+    # Page through the collection so it is never loaded into memory twice.
+    for offset in range(0, count, EXPORT_PAGE_SIZE):
+        page = collection.get(
+            include=["embeddings", "documents"],
+            limit=EXPORT_PAGE_SIZE,
+            offset=offset,
+        )
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        if matrix is None:
+            matrix = np.memmap(
+                os.path.join(tmp_directory, EMBEDDINGS_FILE),
+                dtype=np.float32,
+                mode="w+",
+                shape=(count, embeddings.shape[1]),
+            )
+        matrix[offset : offset + len(embeddings)] = embeddings
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+    if matrix is not None:
+        matrix.flush()
+
+    with open(os.path.join(tmp_directory, METADATA_FILE), "w") as file:
+        json.dump(
+            {
+                **version,
+                "dimensions": 0 if matrix is None else matrix.shape[1],
+                "space": (collection.metadata or {}).get("hnsw:space", "l2"),
+                "ids": ids,
+                "documents": documents,
+            },
+            file,
+        )
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return len(ids)
+
+
+@dataclass
+class VectorIndex:
+    embeddings: "np.ndarray"
+    ids: List[str]
+    documents: List[str]
+    space: str
+
+    def search(self, queries: "np.ndarray", n_results: int = 5) -> List[List[int]]:
+        """Row numbers of the `n_results` nearest chunks for every query, ranked
+        with the same distance function as the Chroma collection."""
+        import numpy as np
+
+        n_results = min(n_results, len(self.ids))
+        if not n_results:
+            return [[] for _ in queries]
+        queries = np.asarray(queries, dtype=np.float32)
+        similarity = queries @ self.embeddings.T
+        if self.space == "l2":
+            # |q - x|^2 = |q|^2 - 2 q.x + |x|^2; |q|^2 does not change the ranking.
+            distances = self._squared_norms[None, :] - 2 * similarity
+        elif self.space == "cosine":
+            distances = -similarity / (
+                np.sqrt(self._squared_norms)[None, :]
+                * np.linalg.norm(queries, axis=1)[:, None]
+                + 1e-12
+            )
+        else:
+            distances = -similarity
+        nearest = np.argpartition(distances, n_results - 1, axis=1)[:, :n_results]
+        order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1)
+        return np.take_along_axis(nearest, order, axis=1).tolist()
+
+    @cached_property
+    def _squared_norms(self) -> "np.ndarray":
+        return (self.embeddings * self.embeddings).sum(axis=1)
+
+
+def load_index(directory: str = INDEX_DIR) -> Optional[VectorIndex]:
+    """The exported index, or None if there is none or the collection changed."""
+    import numpy as np
+
+    metadata_path = os.path.join(directory, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path) as file:
+        metadata = json.load(file)
+    version = {key: metadata[key] for key in ("collection", "count", "manifest")}
+    if version != collection_version(get_docs_collection()):
+        return None
+
+    count = len(metadata["ids"])
+    embeddings = (
+        np.memmap(
+            os.path.join(directory, EMBEDDINGS_FILE),
+            dtype=np.float32,
+            mode="r",
+            shape=(count, metadata["dimensions"]),
+        )
+        if count
+        else np.zeros((0, metadata["dimensions"]), dtype=np.float32)
+    )
+    return VectorIndex(
+        embeddings=embeddings,
+        ids=metadata["ids"],
+        documents=metadata["documents"],
+        space=metadata["space"],
+    )
+
+
+async def aembed_texts(texts: List[str]) -> "np.ndarray":
+    """Embed `texts` in as few requests as possible, one row per text."""
+    import numpy as np
+
+    client = get_async_client()
+    embeddings = []
+    for start in range(0, len(texts), QUERY_BATCH_SIZE):
+        batch = texts[start : start + QUERY_BATCH_SIZE]
+        response = await scheduler.run(
+            EMBEDDING_MODEL,
+            lambda: client.embeddings.create(model=EMBEDDING_MODEL, input=batch),
+            sum(estimate_tokens(text) for text in batch),
+        )
+        embeddings.extend(data.embedding for data in response.data)
+    return np.asarray(embeddings, dtype=np.float32).reshape(len(texts), -1)
+
+
+async def asearch(
+    index: VectorIndex, queries: List[str], n_results: int = 5
+) -> List[List[str]]:
+    """Documents for every query: one embedding request and one matrix multiply."""
+    if not queries:
+        return []
+    rows = index.search(await aembed_texts(queries), n_results)
+    return [[index.documents[row] for row in query_rows] for query_rows in rows]
+
+
+async def avalidate(
+    index: VectorIndex, queries: List[str], n_results: int = 5
+) -> Dict[str, float]:
+    """Compare the exported index with Chroma on the same query embeddings.
+
+    Chroma's HNSW search is approximate, so some differences are expected;
+    `mean_overlap` is the share of Chroma's chunks the export also returned."""
+    embeddings = await aembed_texts(queries)
+    expected = await asyncio.to_thread(
+        get_docs_collection().query,
+        query_embeddings=embeddings.tolist(),
+        n_results=n_results,
+        include=[],
+    )
+    matches = 0
+    overlap = 0.0
+    for query_rows, chroma_ids in zip(
+        index.search(embeddings, n_results), expected["ids"]
+    ):
+        ids = [index.ids[row] for row in query_rows]
+        matches += ids == chroma_ids
+        overlap += len(set(ids) & set(chroma_ids)) / max(len(chroma_ids), 1)
+    return {
+        "queries": len(queries),
+        "identical": matches,
+        "mean_overlap": overlap / len(queries) if queries else 1.0,
+    }
+
+
+def run():
+    from prompt_optimizer.runner import evaluation_items
+
+    parser = argparse.ArgumentParser(
+        description="Export the docs collection to a memory-mapped vector index"
+    )
+    parser.add_argument("--path", default=INDEX_DIR)
+    parser.add_argument(
+        "--min-overlap",
+        type=float,
+        default=MIN_MEAN_OVERLAP,
+        help="Mean overlap with Chroma below which --validate fails",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Check that the export returns the same chunks as Chroma for the "
+        "evaluation questions",
+    )
+    args = parser.parse_args()
+
+    count = export_index(args.path)
+    print(f"Exported {count} chunks to {args.path}")
+
+    if args.validate:
+        index = load_index(args.path)
+        if index is None:
+            # The collection changed while exporting, e.g. during an ingest.
+            parser.error(
+                f"The index at {args.path} does not match the docs collection; "
+                "run `uv run export_index` again"
+            )
+        questions = [item["question"] for item in evaluation_items]
+        report = run_sync(avalidate(index, questions))
+        print(
+            f"{report['identical']}/{report['queries']} queries returned the same "
+            f"chunks as Chroma (mean overlap {report['mean_overlap']:.1%})"
+        )
+        if report["mean_overlap"] < args.min_overlap:
+            raise SystemExit(1)
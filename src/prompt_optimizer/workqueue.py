@@ -0,0 +1,316 @@
+"""Durable SQLite queue of (prompt, item) evaluation jobs.
+
+`evaluate --queue PATH` enqueues its items here instead of scoring them in
+process, and any number of `uv run worker --queue PATH` processes lease
+jobs, score them and write the results back. A job whose worker stops
+renewing its lease is handed to another worker once the lease times out.
+
+The queue runs SQLite in WAL mode, which needs shared memory between the
+processes using the file: all of them must run on one host, with the file
+on a local disk (not NFS or SMB).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from prompt_optimizer.sqlite_utils import ThreadLocalConnection
+
+QUEUE_PATH = os.getenv("PROMPT_OPTIMIZER_QUEUE_PATH", "db/work_queue.sqlite3")
+LEASE_SECONDS = 120.0
+MAX_ATTEMPTS = 3
+POLL_SECONDS = 0.5
+WORKER_CONCURRENCY = 8
+# A coordinator gives up once none of its jobs has been held by a live worker
+# for this long (no worker was started, or all of them died).
+STALL_SECONDS = 120.0
+# Jobs are enqueued in batches so a lazily read dataset is never held in memory.
+ENQUEUE_BATCH_SIZE = 500
+
+
+@dataclass
+class Job:
+    id: int
+    run_id: str
+    position: int
+    prompt: str
+    item: Dict
+    context: Optional[str] = None
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        prompt TEXT NOT NULL,
+        item TEXT NOT NULL,
+        context TEXT,
+        state TEXT NOT NULL DEFAULT 'pending',
+        worker TEXT,
+        lease_until REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_until)",
+    "CREATE INDEX IF NOT EXISTS jobs_run ON jobs (run_id, state)",
+)
+
+
+class WorkQueue:
+    """Jobs move pending -> leased -> done -> collected, or to failed after
+    MAX_ATTEMPTS."""
+
+    def __init__(self, path: str = QUEUE_PATH, lease_seconds: float = LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._connections = ThreadLocalConnection(path, SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def enqueue(
+        self,
+        run_id: str,
+        prompt: str,
+        items: Iterable[Tuple[int, Dict, Optional[str]]],
+    ) -> None:
+        """Add `(position, item, context)` jobs for one run."""
+        self._connection().executemany(
+            "INSERT INTO jobs (run_id, position, prompt, item, context) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                (run_id, position, prompt, json.dumps(item), context)
+                for position, item, context in items
+            ],
+        )
+
+    def lease(self, worker: str, limit: int) -> List[Job]:
+        """Claim up to `limit` pending jobs, or jobs whose lease has expired."""
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "UPDATE jobs SET state = 'failed', error = 'Lease expired too often' "
+                "WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, MAX_ATTEMPTS),
+            )
+            rows = connection.execute(
+                "SELECT id, run_id, position, prompt, item, context FROM jobs "
+                "WHERE state = 'pending' OR (state = 'leased' AND lease_until < ?) "
+                "ORDER BY id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(worker, now + self.lease_seconds, row[0]) for row in rows],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [
+            Job(
+                id=row[0],
+                run_id=row[1],
+                position=row[2],
+                prompt=row[3],
+                item=json.loads(row[4]),
+                context=row[5],
+            )
+            for row in rows
+        ]
+
+    def renew(self, worker: str, job_ids: List[int]) -> None:
+        self._connection().executemany(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+            [(time.time() + self.lease_seconds, job_id, worker) for job_id in job_ids],
+        )
+
+    def complete(self, worker: str, job_id: int, result: Dict) -> bool:
+        """Store a result; False if the lease was lost to another worker."""
+        return bool(
+            self._connection()
+            .execute(
+                "UPDATE jobs SET state = 'done', result = ? "
+                "WHERE id = ? AND worker = ? AND state = 'leased'",
+                (json.dumps(result), job_id, worker),
+            )
+            .rowcount
+        )
+
+    def fail(self, worker: str, job_id: int, error: str) -> None:
+        self._connection().execute(
+            "UPDATE jobs SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_until = NULL WHERE id = ? AND worker = ? AND state = 'leased'",
+            (MAX_ATTEMPTS, error, job_id, worker),
+        )
+
+    def collect(self, run_id: str) -> List[Tuple[int, Dict]]:
+        """Take the finished results of a run that were not collected yet."""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, position, result FROM jobs WHERE run_id = ? AND state = 'done'",
+                (run_id,),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET state = 'collected', result = NULL WHERE id = ?",
+                [(row[0],) for row in rows],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [(row[1], json.loads(row[2])) for row in rows]
+
+    def failures(self, run_id: str) -> List[str]:
+        return [
+            row[0]
+            for row in self._connection().execute(
+                "SELECT error FROM jobs WHERE run_id = ? AND state = 'failed'",
+                (run_id,),
+            )
+        ]
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        return dict(
+            self._connection()
+            .execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state",
+                (run_id,),
+            )
+            .fetchall()
+        )
+
+    def live_leases(self, run_id: str) -> int:
+        return (
+            self._connection()
+            .execute(
+                "SELECT COUNT(*) FROM jobs WHERE run_id = ? AND state = 'leased' "
+                "AND lease_until >= ?",
+                (run_id, time.time()),
+            )
+            .fetchone()[0]
+        )
+
+    def cancel(self, run_id: str) -> None:
+        self._connection().execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex
+
+
+async def aworker(
+    queue: WorkQueue,
+    concurrency: int = WORKER_CONCURRENCY,
+    exit_when_idle: Optional[float] = None,
+) -> int:
+    """Lease and score jobs until idle for `exit_when_idle` seconds (forever if
+    None). Returns the number of jobs completed."""
+    from prompt_optimizer.runner import aprocess_and_evaluate_single_question
+
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    running: Dict[int, asyncio.Task] = {}
+    completed = 0
+    idle_since = time.monotonic()
+    last_renewal = time.monotonic()
+
+    async def process(job: Job):
+        try:
+            result = await aprocess_and_evaluate_single_question(
+                job.prompt, job.item, job.context
+            )
+        except Exception as error:
+            queue.fail(worker, job.id, f"{type(error).__name__}: {error}")
+            print(f"Job {job.id} failed: {error}")
+            return False
+        return queue.complete(worker, job.id, result)
+
+    while True:
+        free = concurrency - len(running)
+        if free:
+            for job in queue.lease(worker, free):
+                running[job.id] = asyncio.ensure_future(process(job))
+        if running:
+            idle_since = time.monotonic()
+            done, _ = await asyncio.wait(
+                running.values(),
+                timeout=POLL_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for job_id in [job_id for job_id, task in running.items() if task in done]:
+                completed += running.pop(job_id).result()
+        elif (
+            exit_when_idle is not None
+            and time.monotonic() - idle_since > exit_when_idle
+        ):
+            return completed
+        else:
+            await asyncio.sleep(POLL_SECONDS)
+
+        if time.monotonic() - last_renewal > queue.lease_seconds / 3:
+            queue.renew(worker, list(running))
+            last_renewal = time.monotonic()
+
+
+def spawn_workers(count: int, path: str = QUEUE_PATH) -> List[subprocess.Popen]:
+    """Start local worker processes that exit once the queue runs dry."""
+    return [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "prompt_optimizer.workqueue",
+                "--queue",
+                path,
+                "--exit-when-idle",
+                "10",
+            ]
+        )
+        for _ in range(count)
+    ]
+
+
+def run_worker():
+    from prompt_optimizer.async_utils import run_sync
+
+    parser = argparse.ArgumentParser(
+        description="Score evaluation jobs from a shared work queue"
+    )
+    parser.add_argument("--queue", default=QUEUE_PATH)
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY)
+    parser.add_argument(
+        "--exit-when-idle",
+        type=float,
+        help="Stop after this many seconds without work (default: run forever)",
+    )
+    parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    args = parser.parse_args()
+
+    completed = run_sync(
+        aworker(
+            WorkQueue(args.queue, args.lease_seconds),
+            args.concurrency,
+            args.exit_when_idle,
+        )
+    )
+    print(f"Worker finished {completed} jobs")
+
+
+if __name__ == "__main__":
+    run_worker()
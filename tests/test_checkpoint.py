@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from prompt_optimizer.checkpoint import Checkpoint, config_hash, item_id
+
+
+def test_config_hash_ignores_key_order():
+    assert config_hash({"judge": "gpt-4o", "k": 5}) == config_hash(
+        {"k": 5, "judge": "gpt-4o"}
+    )
+    assert config_hash({"k": 5}) != config_hash({"k": 6})
+
+
+def test_item_id_prefers_the_id_column():
+    assert item_id({"id": 7, "question": "q"}) == "7"
+    assert item_id({"question": "q"}) == item_id({"question": "q", "id": None})
+    assert item_id({"question": "q"}) != item_id({"question": "other"})
+
+
+def test_checkpoint_path_depends_on_prompt_and_config(tmp_path):
+    base = Checkpoint("prompt", {"k": 5}, directory=str(tmp_path))
+    assert base.path == Checkpoint("prompt", {"k": 5}, directory=str(tmp_path)).path
+    assert base.path != Checkpoint("other", {"k": 5}, directory=str(tmp_path)).path
+    assert base.path != Checkpoint("prompt", {"k": 6}, directory=str(tmp_path)).path
+
+
+def test_load_returns_appended_results(tmp_path):
+    checkpoint = Checkpoint("prompt", {"k": 5}, directory=str(tmp_path))
+    checkpoint.append("a", {"score": 1.0})
+    checkpoint.append("b", {"score": 0.5})
+    checkpoint.append("a", {"score": 0.0})
+
+    assert Checkpoint("prompt", {"k": 5}, directory=str(tmp_path)).load() == {
+        "a": {"score": 0.0},
+        "b": {"score": 0.5},
+    }
+
+
+def test_load_skips_torn_and_foreign_lines(tmp_path):
+    checkpoint = Checkpoint("prompt", {"k": 5}, directory=str(tmp_path))
+    checkpoint.append("a", {"score": 1.0})
+    with open(checkpoint.path, "a") as file:
+        foreign = {
+            "prompt_hash": checkpoint.prompt_hash,
+            "config_hash": "something-else",
+            "item_id": "b",
+            "result": {"score": 0.0},
+        }
+        file.write(json.dumps(foreign) + "\n")
+        file.write('{"prompt_hash": "cut short')
+
+    assert checkpoint.load() == {"a": {"score": 1.0}}
+
+
+def test_clear_removes_the_file(tmp_path):
+    checkpoint = Checkpoint("prompt", directory=str(tmp_path))
+    checkpoint.append("a", {"score": 1.0})
+    checkpoint.clear()
+    assert checkpoint.load() == {}
+
+
+def test_append_after_a_torn_line_starts_a_new_one(tmp_path):
+    checkpoint = Checkpoint("prompt", directory=str(tmp_path))
+    checkpoint.append("a", {"score": 1.0})
+    with open(checkpoint.path, "a") as file:
+        file.write('{"prompt_hash": "cut short')
+
+    resumed = Checkpoint("prompt", directory=str(tmp_path))
+    asyncio.run(resumed.aappend("b", {"score": 0.5}))
+    assert resumed.load() == {"a": {"score": 1.0}, "b": {"score": 0.5}}
@@ -0,0 +1,62 @@
+import json
+from collections import Counter
+
+import pytest
+
+from prompt_optimizer.datasets import allocate, parse_shard, select_items
+
+
+def write_dataset(path, categories):
+    with open(path, "w") as file:
+        for index, (category, count) in enumerate(categories.items()):
+            for number in range(count):
+                row = {
+                    "id": f"{category}-{number}",
+                    "question": f"Question {number} about {category}?",
+                    "required_facts": [f"fact {index}"],
+                    "category": category,
+                }
+                file.write(json.dumps(row) + "\n")
+    return str(path)
+
+
+def test_allocate_is_proportional_and_exact():
+    allocation = allocate({"a": 50, "b": 30, "c": 20}, 10)
+    assert allocation == {"a": 5, "b": 3, "c": 2}
+    assert sum(allocate({"a": 1, "b": 1, "c": 1}, 2).values()) == 2
+    assert allocate({"a": 2, "b": 1}, 10) == {"a": 2, "b": 1}
+
+
+def test_sample_is_stratified_deterministic_and_in_file_order(tmp_path):
+    path = write_dataset(tmp_path / "questions.jsonl", {"api": 60, "sdk": 40})
+
+    sample = list(select_items(path, sample_size=10, seed=3))
+    assert Counter(item["category"] for item in sample) == {"api": 6, "sdk": 4}
+    assert [item["id"] for item in sample] == [
+        item["id"] for item in select_items(path, sample_size=10, seed=3)
+    ]
+    assert [item["id"] for item in sample] != [
+        item["id"] for item in select_items(path, sample_size=10, seed=4)
+    ]
+    order = [item["id"] for item in select_items(path)]
+    positions = [order.index(item["id"]) for item in sample]
+    assert positions == sorted(positions)
+
+
+def test_shards_partition_the_sample(tmp_path):
+    path = write_dataset(tmp_path / "questions.jsonl", {"api": 30, "sdk": 20})
+    sample = {item["id"] for item in select_items(path, sample_size=20)}
+
+    shards = [
+        {item["id"] for item in select_items(path, sample_size=20, shard=(i, 3))}
+        for i in range(3)
+    ]
+    assert set().union(*shards) == sample
+    assert sum(len(shard) for shard in shards) == len(sample)
+
+
+def test_parse_shard_rejects_bad_values():
+    assert parse_shard("1/4") == (1, 4)
+    for value in ("4/4", "x/2", "1"):
+        with pytest.raises(ValueError):
+            parse_shard(value)
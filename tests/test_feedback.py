@@ -0,0 +1,46 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+feedback = pytest.importorskip("prompt_optimizer.feedback")
+
+
+def grouped_vectors():
+    """Three tight groups of 5, 3 and 2 vectors around orthogonal directions."""
+    rng = np.random.default_rng(1)
+    directions = np.eye(3, 8)
+    sizes = (5, 3, 2)
+    vectors = np.concatenate(
+        [
+            direction * rng.uniform(0.5, 2.0, (size, 1))
+            + rng.normal(0, 0.01, (size, 8))
+            for direction, size in zip(directions, sizes)
+        ]
+    )
+    groups = np.repeat(np.arange(3), sizes)
+    return vectors, groups
+
+
+def test_kmeans_recovers_separated_groups():
+    vectors, groups = grouped_vectors()
+    labels = feedback.kmeans(vectors, 3)
+    for group in range(3):
+        assert len(set(labels[groups == group])) == 1
+    assert len(set(labels)) == 3
+
+
+def test_kmeans_is_deterministic_and_caps_k():
+    vectors, _ = grouped_vectors()
+    assert (feedback.kmeans(vectors, 3) == feedback.kmeans(vectors, 3)).all()
+    assert len(set(feedback.kmeans(vectors[:2], 8))) <= 2
+
+
+def test_clusters_are_largest_first():
+    vectors, groups = grouped_vectors()
+    failures = [
+        {"question": f"q{index}", "fact": "f", "reason": "r"}
+        for index in range(len(vectors))
+    ]
+    clusters = feedback.cluster_failures(failures, vectors, k=3)
+    assert [len(cluster.failures) for cluster in clusters] == [5, 3, 2]
+    assert sorted(clusters[0].order) == list(range(5))
+    assert clusters[0].questions == 5
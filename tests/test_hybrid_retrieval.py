@@ -0,0 +1,19 @@
+import pytest
+
+rag = pytest.importorskip("prompt_optimizer.rag")
+
+
+def test_ids_found_by_both_searches_rank_first():
+    fused = rag.reciprocal_rank_fusion([["a", "b", "c"], ["c", "d", "a"]])
+    assert fused[:2] == ["a", "c"]
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_fusion_scores_are_one_over_k_plus_rank():
+    # b: 1/(k+2) + 1/(k+1) beats a: 1/(k+1) + 1/(k+3).
+    assert rag.reciprocal_rank_fusion([["a", "b"], ["b", "x", "a"]], k=1)[0] == "b"
+
+
+def test_single_ranking_is_unchanged():
+    assert rag.reciprocal_rank_fusion([["c", "a", "b"]]) == ["c", "a", "b"]
+    assert rag.reciprocal_rank_fusion([]) == []
@@ -0,0 +1,47 @@
+import pytest
+
+judge_cascade = pytest.importorskip("prompt_optimizer.judge_cascade")
+
+MIN_DECISIONS = judge_cascade.MIN_DECISIONS
+
+
+def test_lexical_coverage_matches_stemmed_key_terms():
+    coverage = judge_cascade.lexical_coverage
+    assert coverage("Traceloop traces OpenAI calls", "OpenAI calls are traced") == (
+        pytest.approx(3 / 4)
+    )
+    assert coverage("Spans are exported", "spans exporting") == 1.0
+    assert coverage("Spans are exported", "Nothing relevant here") == 0.0
+    # A fact made only of stopwords has no key terms to find.
+    assert coverage("what is it", "what is it") == 0.0
+
+
+def passes_at(value, threshold):
+    return value >= threshold
+
+
+def test_agreeing_threshold_picks_the_first_agreeing_candidate():
+    cases = [(0.5, False)] * 5 + [(0.8, True)] * 4 + [(1.0, True)] * MIN_DECISIONS
+    # 0.5 decides everything but agrees only 9 times in 14, 0.8 agrees always.
+    assert (
+        judge_cascade._agreeing_threshold(cases, [0.5, 0.8, 1.0], passes_at, True)
+        == 0.8
+    )
+
+
+def test_agreeing_threshold_needs_enough_decisions():
+    cases = [(1.0, True)] * (MIN_DECISIONS - 1)
+    assert judge_cascade._agreeing_threshold(cases, [1.0], passes_at, True) is None
+
+
+def test_calibrate_lexical_leaves_disagreeing_tiers_undecided():
+    labels = [
+        {"fact": "spans exported", "response": "spans are exported", "passed": True}
+    ] * MIN_DECISIONS + [
+        {"fact": "spans exported", "response": "nothing", "passed": index % 2 == 0}
+        for index in range(MIN_DECISIONS * 2)
+    ]
+    thresholds = judge_cascade.Thresholds()
+    judge_cascade.calibrate_lexical(labels, thresholds)
+    assert thresholds.lexical_pass == 1.0
+    assert thresholds.lexical_fail == -1.0
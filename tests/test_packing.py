@@ -0,0 +1,62 @@
+from prompt_optimizer.packing import (
+    SEPARATOR,
+    containment,
+    count_tokens,
+    pack_context,
+    shingles,
+)
+
+INSTALL = (
+    "## Installation\n"
+    "Run pip install traceloop-sdk to get started with the SDK.\n"
+    "Then call Traceloop.init in the entry point of your application."
+)
+API_KEY = (
+    "Then call Traceloop.init in the entry point of your application.\n"
+    "## Installation\n"
+    "Set the TRACELOOP_API_KEY environment variable before starting it."
+)
+WORKFLOWS = (
+    "Decorate functions with @workflow and @task to group their spans "
+    "into traces that show up in the dashboard."
+)
+
+
+def test_short_text_is_hashed_whole():
+    assert shingles("Quick start") == {hash(("quick", "start"))}
+    assert shingles("") == set()
+    assert len(shingles("one two three four five six")) == 2
+
+
+def test_containment():
+    assert containment(shingles(INSTALL), shingles(INSTALL)) == 1.0
+    assert containment(set(), {1}) == 1.0
+    assert containment(shingles(WORKFLOWS), shingles(INSTALL)) == 0.0
+
+
+def test_duplicate_chunks_are_dropped():
+    packed = pack_context([INSTALL, WORKFLOWS, INSTALL + "\n"], token_budget=0)
+    assert packed.text == SEPARATOR.join([INSTALL, WORKFLOWS])
+    assert (packed.kept, packed.duplicates) == (2, 1)
+
+
+def test_overlapping_edge_lines_are_trimmed():
+    packed = pack_context([INSTALL, API_KEY], token_budget=0)
+    assert packed.text == SEPARATOR.join(
+        [INSTALL, "Set the TRACELOOP_API_KEY environment variable before starting it."]
+    )
+    assert packed.tokens_saved > 0
+
+
+def test_budget_skips_chunks_that_do_not_fit():
+    budget = count_tokens(INSTALL) + count_tokens(SEPARATOR) + count_tokens("Short.")
+    packed = pack_context([INSTALL, WORKFLOWS + " " + WORKFLOWS, "Short."], budget)
+    assert packed.text == SEPARATOR.join([INSTALL, "Short."])
+    assert packed.tokens_out <= budget
+
+
+def test_first_chunk_is_truncated_to_the_budget():
+    packed = pack_context([INSTALL], token_budget=5)
+    assert packed.kept == 1
+    assert count_tokens(packed.text) <= 5
+    assert INSTALL.startswith(packed.text)
@@ -0,0 +1,46 @@
+from prompt_optimizer.prompts import (
+    DEFAULT_PROMPT,
+    VARIABLE_SECTION,
+    has_prefix_layout,
+    render_answer_prompt,
+    to_prefix_layout,
+)
+
+
+def test_laid_out_templates_are_unchanged():
+    assert to_prefix_layout(DEFAULT_PROMPT) == DEFAULT_PROMPT
+    template = "Be concise.\n\n" + VARIABLE_SECTION
+    assert to_prefix_layout(template + "\n") == template
+
+
+def test_labels_move_with_their_placeholders():
+    template = "Context:\n{context}\n\nQuestion: {question}\n\nAnswer in one sentence."
+    assert to_prefix_layout(template) == (
+        "Answer in one sentence.\n\n" + VARIABLE_SECTION
+    )
+
+
+def test_instructions_around_placeholders_are_kept():
+    template = "Use the context: {context}\nAnswer {question} in one sentence."
+    assert to_prefix_layout(template) == (
+        "Use the context below.\n"
+        "Answer the question below in one sentence.\n\n" + VARIABLE_SECTION
+    )
+
+
+def test_only_placeholders_in_the_template_are_added():
+    laid_out = to_prefix_layout("Answer this question: {question}")
+    assert laid_out == "Answer this question below.\n\nQuestion:\n{question}"
+    assert "{context}" not in laid_out
+    assert has_prefix_layout(laid_out)
+    assert to_prefix_layout(laid_out) == laid_out
+
+
+def test_templates_without_placeholders_are_left_alone():
+    assert to_prefix_layout("Say hello.") == "Say hello."
+
+
+def test_render_sends_the_template_as_given():
+    assert render_answer_prompt("Q: {question}\n{context}", "docs", "why?") == (
+        "Q: why?\ndocs"
+    )
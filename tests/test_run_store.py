@@ -0,0 +1,65 @@
+from prompt_optimizer.run_store import RUNNING, RunStore
+
+
+def test_resume_sees_the_last_completed_step(tmp_path):
+    path = str(tmp_path / "runs.sqlite3")
+    store = RunStore(path)
+    store.start_run("run-1", "beam", {"run_id": "run-1", "round": 0})
+    store.save_step("run-1", "run_round", {"run_id": "run-1", "round": 1}, 2.5)
+    store.save_step("run-1", "run_round", {"run_id": "run-1", "round": 2}, 3.0)
+    # Starting the same run again must not reset it.
+    store.start_run("run-1", "beam", {"run_id": "run-1", "round": 0})
+
+    # A new store stands in for the process that resumes the run.
+    run = RunStore(path).load_run("run-1")
+    assert run.flow == "beam"
+    assert run.status == RUNNING
+    assert run.state == {"run_id": "run-1", "round": 2}
+    assert (run.last_step, run.steps) == ("run_round", 2)
+
+
+def test_scored_prompts_and_item_results_round_trip(tmp_path):
+    store = RunStore(str(tmp_path / "runs.sqlite3"))
+    store.start_run("run-1", "prompt", {})
+    candidate = {
+        "prompt": "Answer: {context} {question}",
+        "round": 1,
+        "score": 0.75,
+        "feedback": "Too short",
+        "items_evaluated": 2,
+    }
+    results = {"a": {"score": 1.0}, "b": {"score": 0.5}}
+    store.record_prompt("run-1", candidate, 4.0, results)
+
+    assert store.prompt("run-1", candidate["prompt"]) == candidate
+    assert store.item_results("run-1", candidate["prompt"]) == results
+    assert store.prompt("run-1", "another prompt") is None
+    assert store.prompt("run-2", candidate["prompt"]) is None
+
+
+def test_a_rescored_prompt_keeps_its_first_round(tmp_path):
+    store = RunStore(str(tmp_path / "runs.sqlite3"))
+    candidate = {
+        "prompt": "Answer: {context} {question}",
+        "round": 1,
+        "score": 0.75,
+        "feedback": None,
+        "items_evaluated": 1,
+    }
+    store.record_prompt("run-1", candidate, 4.0, {"a": {"score": 0.75}})
+    store.record_prompt("run-1", {**candidate, "round": 3}, 0.0, {"a": {"score": 0.0}})
+
+    assert store.prompt("run-1", candidate["prompt"]) == candidate
+    assert store.item_results("run-1", candidate["prompt"]) == {"a": {"score": 0.75}}
+
+
+def test_finished_runs_and_recent_order(tmp_path):
+    store = RunStore(str(tmp_path / "runs.sqlite3"))
+    store.start_run("old", "prompt", {})
+    store.start_run("new", "prompt", {})
+    store.save_step("new", "evaluate_prompt", {"score": 0.5}, 1.0)
+    store.finish_run("old", "completed")
+
+    assert store.load_run("old").status == "completed"
+    assert [run.run_id for run in store.recent_runs()] == ["old", "new"]
+    assert store.load_run("missing") is None
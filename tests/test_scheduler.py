@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+import pytest
+
+from prompt_optimizer.scheduler import (
+    INITIAL_CONCURRENCY,
+    LATENCY_BACKOFF_FACTOR,
+    ModelLimiter,
+    Scheduler,
+    TokenBucket,
+)
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(60)
+    now = bucket.updated
+    assert bucket.wait_time(60, now) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1) == pytest.approx(0.0)
+
+
+def test_token_bucket_caps_oversized_requests_at_capacity():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    now = bucket.updated
+    assert bucket.wait_time(1_000, now) == pytest.approx(60.0)
+    assert bucket.wait_time(1_000, now + 60) == 0.0
+
+
+def test_limit_grows_on_success_and_halves_on_throttle():
+    limiter = ModelLimiter("gpt-4o")
+    limiter.in_flight = 1
+    limiter.release(0.5, 10)
+    assert limiter.limit == pytest.approx(INITIAL_CONCURRENCY + 1 / INITIAL_CONCURRENCY)
+    assert limiter.in_flight == 0
+
+    limiter.throttle(None)
+    assert limiter.limit == pytest.approx((INITIAL_CONCURRENCY + 0.125) / 2)
+    assert limiter.stats.throttled == 1
+
+
+def test_slow_calls_shrink_the_limit():
+    limiter = ModelLimiter("gpt-4o")
+    limiter.in_flight = 2
+    limiter.release(1.0, 10)
+    limit = limiter.limit
+    limiter.release(LATENCY_BACKOFF_FACTOR * 2, 10)
+    assert limiter.limit == pytest.approx(limit * 0.9)
+
+
+def test_throttle_blocks_admission_until_retry_after():
+    limiter = ModelLimiter("gpt-4o")
+    limiter.throttle(30)
+    assert limiter.blocked_until > time.monotonic() + 29
+
+
+def test_release_settles_reserved_tokens_against_usage():
+    limiter = ModelLimiter("gpt-4o")
+    limiter.in_flight = 1
+    before = limiter.tokens.tokens
+    limiter.release(None, reserved_tokens=100, used_tokens=250)
+    assert limiter.tokens.tokens == pytest.approx(before - 150, abs=1)
+    assert limiter.stats.tokens == 250
+
+
+def test_refunds_never_overfill_the_bucket():
+    bucket = TokenBucket(60)
+    bucket.take(10)
+    bucket.take(-50)
+    assert bucket.tokens == 60
+
+
+def test_failed_calls_refund_their_reserved_tokens():
+    scheduler = Scheduler()
+
+    async def fail():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run("gpt-4o", fail, estimated_tokens=1_000))
+    limiter = scheduler.limiter("gpt-4o")
+    assert limiter.tokens.tokens == pytest.approx(limiter.tokens.capacity)
+    assert limiter.in_flight == 0
+
+
+def test_waiters_are_admitted_in_priority_order():
+    limiter = ModelLimiter("gpt-4o")
+    limiter.limit = 1.0
+    admitted = []
+
+    async def call(priority, name):
+        await limiter.acquire(priority, 1)
+        admitted.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(None, 1)
+
+    async def main():
+        first = asyncio.create_task(call(0, "first"))
+        await asyncio.sleep(0)
+        await asyncio.gather(call(2, "judge"), call(0, "generation"), first)
+
+    asyncio.run(main())
+    assert admitted == ["first", "generation", "judge"]
+
+
+def test_hold_keeps_the_slot_until_the_block_exits():
+    pytest.importorskip("openai")
+    scheduler = Scheduler()
+    limiter = scheduler.limiter("gpt-4o")
+
+    async def call():
+        return "stream"
+
+    async def main():
+        async with scheduler.hold("gpt-4o", call, 10) as held:
+            assert held.result == "stream"
+            assert limiter.in_flight == 1
+            held.used_tokens = 12
+        assert limiter.in_flight == 0
+        assert limiter.stats.tokens == 12
+
+    asyncio.run(main())